@@ -21,7 +21,7 @@ import sys
 import argparse
 import numpy as np
 from md_utils.md_common import (InvalidDataError, warning, create_out_fname, list_to_file, IO_ERROR, GOOD_RET,
-                                INPUT_ERROR, INVALID_DATA, file_rows_to_list)
+                                INPUT_ERROR, INVALID_DATA, file_rows_to_list, open_input)
 
 __author__ = 'hmayes'
 
@@ -175,7 +175,7 @@ def process_cp2k_force_file(f_file, out_dir, req_atom_num):
     keep_lines = False
     to_print = []
 
-    with open(f_file) as f:
+    with open_input(f_file) as f:
         atom_num = None
         qm_atom_num = None
         for line in f:
@@ -23,7 +23,8 @@ except ImportError:
     from configparser import ConfigParser
 from md_utils.md_common import (InvalidDataError, create_out_fname, warning, process_cfg,
                                 list_to_file, file_rows_to_list, create_element_dict,
-                                HEAD_CONTENT, ATOMS_CONTENT, TAIL_CONTENT, process_pdb_tpl, PDB_FORMAT)
+                                HEAD_CONTENT, ATOMS_CONTENT, TAIL_CONTENT, process_pdb_tpl, PDB_FORMAT,
+                                open_input)
 
 __author__ = 'hmayes'
 
@@ -255,7 +256,7 @@ def process_cp2k_file(cfg, cp2k_file, data_tpl_content, pdb_tpl_content, element
 
     result_dict = {FILE_NAME: cp2k_file, QMMM_ENERGY: np.inf, OPT_GEOM: 'NA', COMPLETED_JOB: False}
     atoms_xyz = None
-    with open(cp2k_file) as f:
+    with open_input(cp2k_file) as f:
         pkg_version = md_utils.__version__
         # print(temp1)
         # pkg_version = pkg_resources.parse_version(md_utils.__version__)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Converts LAMMPS dump files to binary caches, which all scripts reading dump files (e.g. lammps_proc, lammps_dist)
+use in place of the dump file while the cache is up to date, without parsing it.
+"""
+
+from __future__ import print_function
+import sys
+import argparse
+from md_utils.md_common import InvalidDataError, warning, file_rows_to_list, make_dump_bin, DUMP_BIN_EXT
+
+__author__ = 'hmayes'
+
+# Error Codes
+# The good status code
+GOOD_RET = 0
+INPUT_ERROR = 1
+IO_ERROR = 2
+INVALID_DATA = 3
+
+
+def parse_cmdline(argv):
+    """
+    Returns the parsed argument list and return code.
+    `argv` is a list of arguments, or `None` for ``sys.argv[1:]``.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # initialize the parser object:
+    parser = argparse.ArgumentParser(description='Converts LAMMPS dump files to binary caches (written next to each '
+                                                 'dump file, with "{}" appended to its name), which are read in place '
+                                                 'of the dump file while it is unchanged.'.format(DUMP_BIN_EXT))
+    parser.add_argument("dump_files", help="The dump files to convert.", nargs='*', default=[])
+    parser.add_argument("-l", "--list_file", help="A file listing dump files to convert (one per line), "
+                                                  "in addition to any given as arguments.", default=None)
+    parser.add_argument("-s", "--single", help="Store the coordinates as single (32-bit) instead of double precision "
+                                               "floats, halving the size of the cache. Such caches are only read in "
+                                               "place of the dump file by scripts told to allow it (lammps_dist "
+                                               "'-s', lammps_proc 'single_dump_bin_flag = True').",
+                        action='store_true', default=False)
+    args = None
+    try:
+        args = parser.parse_args(argv)
+        if args.list_file is not None:
+            args.dump_files += file_rows_to_list(args.list_file)
+        if len(args.dump_files) == 0:
+            raise InvalidDataError("No dump files were specified.")
+    except IOError as e:
+        warning("Problems reading file:", e)
+        parser.print_help()
+        return args, IO_ERROR
+    except InvalidDataError as e:
+        warning("Input data missing:", e)
+        parser.print_help()
+        return args, INPUT_ERROR
+    except SystemExit as e:
+        if hasattr(e, 'code') and e.code == 0:
+            return args, GOOD_RET
+        warning("Input data missing:", e)
+        parser.print_help()
+        return args, INPUT_ERROR
+
+    return args, GOOD_RET
+
+
+def main(argv=None):
+    # Read input
+    args, ret = parse_cmdline(argv)
+    if ret != GOOD_RET or args is None:
+        return ret
+
+    try:
+        for dump_file in args.dump_files:
+            bin_file = make_dump_bin(dump_file, single=args.single)
+            print("Wrote file: {}".format(bin_file))
+    except IOError as e:
+        warning("Problems reading file:", e)
+        return IO_ERROR
+    except InvalidDataError as e:
+        warning("Problems reading data:", e)
+        return INVALID_DATA
+
+    return GOOD_RET  # success
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
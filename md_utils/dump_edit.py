@@ -10,7 +10,8 @@ import argparse
 import numpy as np
 
 from md_utils.md_common import (InvalidDataError, create_out_fname, warning, process_cfg,
-                                find_dump_section_state, read_csv_dict)
+                                read_dump_frames, read_csv_dict, TIMESTEP, ATOM_NUM, MOL_NUM, ATOM_TYPE, CHARGE,
+                                XYZ_COORDS, NUM_ATOMS, HEAD_CONTENT)
 try:
     # noinspection PyCompatibility
     from ConfigParser import ConfigParser
@@ -63,22 +64,14 @@ DEF_CFG_VALS = {DUMPS_FILE: 'dump_list.txt',
 REQ_KEYS = {}
 
 # From data template file
-NUM_ATOMS = 'num_atoms'
 TAIL_CONTENT = 'tail_content'
 ATOMS_CONTENT = 'atoms_content'
-HEAD_CONTENT = 'head_content'
 
 # For data template file processing
 SEC_HEAD = 'head_section'
 SEC_ATOMS = 'atoms_section'
 SEC_TAIL = 'tail_section'
 
-
-# For dump file processing
-SEC_TIMESTEP = 'timestep'
-SEC_NUM_ATOMS = 'dump_num_atoms'
-SEC_BOX_SIZE = 'dump_box_size'
-
 # For deciding if a float is close enough to a value
 TOL = 0.000001
 # Bundle of headers for calculating charge
@@ -155,87 +148,53 @@ def print_to_dump_file(head_content, atoms_struct, fname, mode='a'):
             print("Wrote file: {}".format(fname))
 
 
+def renum_array(id_array, renum_dict):
+    """
+    Applies an old-to-new mapping to an array of ids; ids not in the mapping are unchanged
+    @param id_array: numpy array of integer ids
+    @param renum_dict: dict of old id to new id
+    @return: numpy array with the new ids
+    """
+    if len(renum_dict) == 0:
+        return id_array
+    return np.array([renum_dict.get(old_id, old_id) for old_id in id_array.tolist()], dtype=id_array.dtype)
+
+
 def process_dump_file(cfg, dump_file, atom_num_dict, atom_type_dict, mol_num_dict):
-    section = None
-    box = np.zeros((3,))
-    counter = 1
-    num_atoms = 0
-    head_content = []
     steps_count = 0
     step_stop = cfg[MAX_STEPS] * cfg[OUT_FREQ]
     timestep = None
-    with open(dump_file) as d:
-        d_out = create_out_fname(dump_file, suffix='_reorder', base_dir=cfg[OUT_BASE_DIR])
-        write_mode = 'w'
-        for line in d:
-            line = line.strip()
-
-            if section == SEC_ATOMS:
-                split_line = line.split()
-                # If there is an incomplete line in a dump file, move on to the next file
-                if len(split_line) < 7:
-                    break
-
-                atom_num = int(split_line[0])
-                if atom_num in atom_num_dict:
-                    atom_num = atom_num_dict[atom_num]
-
-                mol_num = int(split_line[1])
-                if mol_num in mol_num_dict:
-                    mol_num = mol_num_dict[mol_num]
-                # Default RENUM_START_MOL is neg 1; if still less than zero, user did not specify renumbering
-                if 0 <= cfg[RENUM_START_MOL] <= mol_num:
-                    mol_num += cfg[RENUM_SHIFT]
-
-                atom_type = int(split_line[2])
-                if atom_type in atom_type_dict:
-                    atom_type = atom_type_dict[atom_type]
-
-                charge = float(split_line[3])
-                x, y, z = map(float, split_line[4:7])
-                atom_struct = [atom_num, mol_num, atom_type, charge, x, y, z]
-                atom_data.append(atom_struct)
-                if counter == num_atoms:
-                    if len(atom_num_dict) > 0:
-                        atom_data = sorted(atom_data, key=lambda atom: atom[0])
-                    steps_count += 1
-                    if steps_count % cfg[OUT_FREQ] == 0:
-                        print_to_dump_file(head_content, atom_data, d_out, mode=write_mode)
-                        if write_mode == 'w':
-                            write_mode = 'a'
-                    if steps_count == step_stop:
-                        print("Reached the maximum number of steps ({})".format(cfg[MAX_STEPS]))
-                        counter = 1
-                        break
-                    # reset for next timestep
-                    head_content = []
-                    counter = 0
-                    section = None
-                counter += 1
-
+    full_frame = True
+    d_out = create_out_fname(dump_file, suffix='_reorder', base_dir=cfg[OUT_BASE_DIR])
+    write_mode = 'w'
+    for dump_frame in read_dump_frames(dump_file):
+        timestep = dump_frame[TIMESTEP]
+        # If there is an incomplete line in a dump file, move on to the next file
+        if len(dump_frame[ATOM_NUM]) < dump_frame[NUM_ATOMS]:
+            full_frame = False
+            break
+        steps_count += 1
+        if steps_count % cfg[OUT_FREQ] == 0:
+            atom_nums = renum_array(dump_frame[ATOM_NUM], atom_num_dict)
+            mol_nums = renum_array(dump_frame[MOL_NUM], mol_num_dict)
+            # Default RENUM_START_MOL is neg 1; if still less than zero, user did not specify renumbering
+            if cfg[RENUM_START_MOL] >= 0:
+                mol_nums = np.where(mol_nums >= cfg[RENUM_START_MOL], mol_nums + cfg[RENUM_SHIFT], mol_nums)
+            atom_types = renum_array(dump_frame[ATOM_TYPE], atom_type_dict)
+            if len(atom_num_dict) > 0:
+                new_order = np.argsort(atom_nums, kind='mergesort')
             else:
-                head_content.append(line)
-                if section is None:
-                    section = find_dump_section_state(line)
-                    if section is None:
-                        raise InvalidDataError('Unexpected line in file {}: {}'.format(d, line))
-                elif section == SEC_TIMESTEP:
-                    timestep = line
-                    # Reset variables
-                    atom_data = []
-                    section = None
-                elif section == SEC_NUM_ATOMS:
-                    num_atoms = int(line)
-                    section = None
-                elif section == SEC_BOX_SIZE:
-                    split_line = line.split()
-                    diff = float(split_line[1]) - float(split_line[0])
-                    box[counter - 1] = diff
-                    if counter == 3:
-                        counter = 0
-                        section = None
-                    counter += 1
-    if counter == 1:
+                new_order = slice(None)
+            atom_data = zip(atom_nums[new_order].tolist(), mol_nums[new_order].tolist(),
+                            atom_types[new_order].tolist(), dump_frame[CHARGE][new_order].tolist(),
+                            *dump_frame[XYZ_COORDS][new_order].T.tolist())
+            print_to_dump_file(dump_frame[HEAD_CONTENT], atom_data, d_out, mode=write_mode)
+            if write_mode == 'w':
+                write_mode = 'a'
+        if steps_count == step_stop:
+            print("Reached the maximum number of steps ({})".format(cfg[MAX_STEPS]))
+            break
+    if full_frame:
         print("Completed reading: {}".format(dump_file))
     else:
         warning("Dump file {} step {} did not have the full list of atom numbers. "
@@ -12,7 +12,7 @@ import argparse
 import numpy as np
 from md_utils.md_common import (InvalidDataError, warning, create_out_fname, process_cfg,
                                 print_qm_kind, IO_ERROR, GOOD_RET, INPUT_ERROR, INVALID_DATA, read_csv_dict,
-                                file_rows_to_list, write_csv)
+                                file_rows_to_list, write_csv, open_input)
 
 try:
     # noinspection PyCompatibility
@@ -145,7 +145,7 @@ def print_vmd_list(atom_ids, fname, mode='w'):
 
 def get_evb_atoms(cfg, chk_file):
 
-    with open(chk_file) as d:
+    with open_input(chk_file) as d:
         chk_data = {HEAD_CONTENT: [], ATOMS_CONTENT: [], TAIL_CONTENT: []}
 
         section = SEC_HEAD
@@ -232,7 +232,7 @@ def get_ene_data(cfg, chk_file_list):
     """
     chk_dict_list = []
     for chk_file in chk_file_list:
-        with open(chk_file) as d:
+        with open_input(chk_file) as d:
             base_file_name = os.path.basename(chk_file)
             chk_file_dict = {FILE_NAME: base_file_name}
             rel_e_group = None
@@ -27,7 +27,8 @@ import sys
 import argparse
 import numpy as np
 from md_utils.md_common import (InvalidDataError, warning, create_out_fname, process_cfg, write_csv,
-                                IO_ERROR, GOOD_RET, INPUT_ERROR, INVALID_DATA, file_rows_to_list, read_csv_dict)
+                                IO_ERROR, GOOD_RET, INPUT_ERROR, INVALID_DATA, file_rows_to_list, read_csv_dict,
+                                open_input)
 
 try:
     # noinspection PyCompatibility
@@ -291,7 +292,7 @@ def find_section_state(line):
 
 def process_evb_file(evb_file, cfg):
     steps_read = 0
-    with open(evb_file) as d:
+    with open_input(evb_file) as d:
         base_file_name = os.path.basename(evb_file)
         section = None
         # cec_array = np.zeros(3)
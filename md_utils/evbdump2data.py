@@ -12,8 +12,9 @@ import sys
 import argparse
 import numpy as np
 from collections import defaultdict
-from md_utils.md_common import (list_to_file, InvalidDataError, create_out_fname, pbc_dist,
-                                warning, process_cfg, find_dump_section_state)
+from md_utils.md_common import (list_to_file, InvalidDataError, create_out_fname, pbc_dists,
+                                warning, process_cfg, read_dump_frames, TIMESTEP, BOX, ATOM_NUM, MOL_NUM,
+                                ATOM_TYPE, CHARGE, XYZ_COORDS, NUM_ATOMS, HEAD_CONTENT)
 try:
     # noinspection PyCompatibility
     from ConfigParser import ConfigParser
@@ -101,10 +102,8 @@ REQ_KEYS = {DATA_TPL_FILE: str,
             PROT_H_TYPE: int, }
 
 # From data template file
-NUM_ATOMS = 'num_atoms'
 TAIL_CONTENT = 'tail_content'
 ATOMS_CONTENT = 'atoms_content'
-HEAD_CONTENT = 'head_content'
 H3O_MOL = 'hydronium_molecule'
 H3O_O_CHARGE = 'hydronium_o_charge'
 H3O_H_CHARGE = 'hydronium_h_charge'
@@ -119,11 +118,6 @@ SEC_ATOMS = 'atoms_section'
 SEC_TAIL = 'tail_section'
 
 
-# For dump file processing
-SEC_TIMESTEP = 'timestep'
-SEC_NUM_ATOMS = 'dump_num_atoms'
-SEC_BOX_SIZE = 'dump_box_size'
-
 # For deciding if a float is close enough to a value
 TOL = 0.000001
 # Bundle of headers for calculating charge
@@ -303,14 +297,16 @@ def deprotonate(cfg, protonatable_res, excess_proton, dump_h3o_mol, water_mol_di
     excess_proton[3] = tpl_data[H3O_H_CHARGE]    # charge
     dump_h3o_mol.append(excess_proton)
     min_dist_id = None
-    min_dist = np.linalg.norm(box)
+    wat_mol_ids = []
+    wat_o_coords = []
     for mol_id, molecule in water_mol_dict.items():
         for atom in molecule:
             if atom[2] == cfg[WAT_O_TYPE]:
-                dist = pbc_dist(np.asarray(excess_proton[4:7]), np.asarray(atom[4:7]), box)
-        if dist < min_dist:
-            min_dist_id = mol_id
-            min_dist = dist
+                wat_mol_ids.append(mol_id)
+                wat_o_coords.append(atom[4:7])
+    if len(wat_mol_ids) > 0:
+        wat_o_dists = pbc_dists(np.asarray(wat_o_coords, dtype=float), np.asarray(excess_proton[4:7]), box)
+        min_dist_id = wat_mol_ids[np.argmin(wat_o_dists)]
     logger.debug('Deprotonated residue: the molecule ID of the closest water '
                  '(to become a hydronium) is {}.'.format(min_dist_id))
     # Now that have the closest water, add its atoms to the hydronium list
@@ -367,140 +363,114 @@ def assign_hyd_mol(cfg, hyd_mol):
 
 
 def process_dump_file(cfg, data_tpl_content, dump_file):
-    section = None
-    box = np.zeros((3,))
-    counter = 1
     atom_list_order = [PRE_RES, PROT_RES, POST_RES, HYD_MOL, WAT_MOL, POST_WAT]
-    dump_atom_data = []
-    atom_lists = {PRE_RES: [],
-                  PROT_RES: [],
-                  POST_RES: [],
-                  HYD_MOL: [],
-                  WAT_MOL: [],
-                  POST_WAT: []
-                  }
-
-    with open(dump_file) as d:
-        for line in d:
-            line = line.strip()
-            if section is None:
-                section = find_dump_section_state(line)
-                if section is None:
-                    raise InvalidDataError('Unexpected line in file {}: {}'.format(dump_file, line))
-            elif section == SEC_TIMESTEP:
-                timestep = line
-                # Reset variables
-                water_dict = defaultdict(list)
-                dump_atom_data = []
-                excess_proton = None
-                hydronium = []
-                for a_list in atom_lists:
-                    atom_lists[a_list] = []
-                section = None
-            elif section == SEC_NUM_ATOMS:
-                if data_tpl_content[NUM_ATOMS] != int(line):
-                    raise InvalidDataError('At timestep {} in file {}, the listed number of atoms ({}) does '
-                                           'not equal the number of atoms in the template data file '
-                                           '({}).'.format(timestep, dump_file, line, data_tpl_content[NUM_ATOMS]))
-                section = None
-            elif section == SEC_BOX_SIZE:
-                split_line = line.split()
-                diff = float(split_line[1]) - float(split_line[0])
-                box[counter - 1] = diff
-                if counter == 3:
-                    counter = 0
-                    section = None
-                counter += 1
-            elif section == SEC_ATOMS:
-                split_line = line.split()
-                # If there is an incomplete line in a dump file, move on to the next file
-                if len(split_line) < 7:
-                    continue
-                atom_num = int(split_line[0])
-                mol_num = int(split_line[1])
-                atom_type = int(split_line[2])
-                charge = float(split_line[3])
-                x, y, z = map(float, split_line[4:7])
-                description = ''
-                atom_struct = [atom_num, mol_num, atom_type, charge, x, y, z, description]
-
-                # Keep track of separate portions of the system to allow sorting and processing
-                if mol_num == cfg[PROT_RES_MOL_ID]:
-                    if atom_type == cfg[PROT_H_TYPE] and atom_num not in cfg[PROT_H_IGNORE]:
-                        excess_proton = atom_struct
-                    else:
-                        atom_lists[PROT_RES].append(atom_struct)
-                elif atom_type == cfg[H3O_O_TYPE] or atom_type == cfg[H3O_H_TYPE]:
-                    hydronium.append(atom_struct)
-                elif atom_type == cfg[WAT_O_TYPE] or atom_type == cfg[WAT_H_TYPE]:
-                    water_dict[mol_num].append(atom_struct)
-                # Save everything else in three chunks for recombining sections post-processing
-                elif len(atom_lists[PROT_RES]) == 0:
-                    atom_lists[PRE_RES].append(atom_struct)
-                elif len(water_dict) == 0:
-                    atom_lists[POST_RES].append(atom_struct)
+    timestep = None
+    full_frame = True
+
+    for dump_frame in read_dump_frames(dump_file):
+        timestep = dump_frame[TIMESTEP]
+        box = dump_frame[BOX]
+        if data_tpl_content[NUM_ATOMS] != dump_frame[NUM_ATOMS]:
+            raise InvalidDataError('At timestep {} in file {}, the listed number of atoms ({}) does '
+                                   'not equal the number of atoms in the template data file '
+                                   '({}).'.format(timestep, dump_file, dump_frame[NUM_ATOMS],
+                                                  data_tpl_content[NUM_ATOMS]))
+        # If there is an incomplete line in a dump file, move on to the next file
+        if len(dump_frame[ATOM_NUM]) < dump_frame[NUM_ATOMS]:
+            full_frame = False
+            break
+
+        water_dict = defaultdict(list)
+        dump_atom_data = []
+        excess_proton = None
+        hydronium = []
+        atom_lists = {PRE_RES: [],
+                      PROT_RES: [],
+                      POST_RES: [],
+                      HYD_MOL: [],
+                      WAT_MOL: [],
+                      POST_WAT: []
+                      }
+        description = ''
+        for atom_num, mol_num, atom_type, charge, xyz in zip(dump_frame[ATOM_NUM].tolist(),
+                                                             dump_frame[MOL_NUM].tolist(),
+                                                             dump_frame[ATOM_TYPE].tolist(),
+                                                             dump_frame[CHARGE].tolist(),
+                                                             dump_frame[XYZ_COORDS].tolist()):
+            atom_struct = [atom_num, mol_num, atom_type, charge] + xyz + [description]
+
+            # Keep track of separate portions of the system to allow sorting and processing
+            if mol_num == cfg[PROT_RES_MOL_ID]:
+                if atom_type == cfg[PROT_H_TYPE] and atom_num not in cfg[PROT_H_IGNORE]:
+                    excess_proton = atom_struct
                 else:
-                    atom_lists[POST_WAT].append(atom_struct)
-
-                if counter == data_tpl_content[NUM_ATOMS]:
-                    counter = 0
-                    section = None
-
-                    # Now that finished reading all atom lines...
-                    # Check and process!
-                    if len(water_dict) == 0:
-                        raise InvalidDataError('Found no water molecules. Check that the input types {} = {} '
-                                               'and {} = {} are in the dump '
-                                               'file.'.format(WAT_O_TYPE, cfg[WAT_O_TYPE],
-                                                              WAT_H_TYPE, cfg[WAT_H_TYPE]))
-                    if excess_proton is None:
-                        if len(hydronium) != 4:
-                            raise InvalidDataError('Did not find an excess proton or one hydronium ion. Check dump '
-                                                   'file and input types: {} = {}; {} = {}; {} = {}'
-                                                   .format(PROT_H_TYPE, cfg[PROT_H_TYPE],
-                                                           H3O_O_TYPE, cfg[H3O_O_TYPE],
-                                                           H3O_H_TYPE, cfg[H3O_H_TYPE]))
-                    else:
-                        if len(hydronium) != 0:
-                            raise InvalidDataError('Found an excess proton and a hydronium atoms. Check dump file '
-                                                   'and input types: {} = {}; {} = {}; {} = {}'
-                                                   .format(PROT_H_TYPE, cfg[PROT_H_TYPE],
-                                                           H3O_O_TYPE, cfg[H3O_O_TYPE],
-                                                           H3O_H_TYPE, cfg[H3O_H_TYPE]))
-                        deprotonate(cfg, atom_lists[PROT_RES], excess_proton, hydronium,
-                                    water_dict, box, data_tpl_content)
-
-                    # Ensure in correct order for printing
-                    atom_lists[HYD_MOL] = assign_hyd_mol(cfg, hydronium)
-                    atom_lists[WAT_MOL] = sort_wat_mols(cfg, water_dict)
-
-                    for a_list in atom_list_order:
-                        dump_atom_data += atom_lists[a_list]
-
-                    # overwrite atom_num, mol_num, atom_type, charge, then description
-                    for index in range(len(dump_atom_data)):
-                        if dump_atom_data[index][3] == data_tpl_content[ATOMS_CONTENT][index][3] or \
-                                dump_atom_data[index][0] in cfg[PROT_TYPE_IGNORE_ATOMS]:
-                            dump_atom_data[index][0:4] = data_tpl_content[ATOMS_CONTENT][index][0:4]
-                            dump_atom_data[index][7] = ' '.join(data_tpl_content[ATOMS_CONTENT][index][7:])
-                        else:
-                            raise InvalidDataError("In reading file: {}\n found atom index {} with charge {} which "
-                                                   "does not match the charge in the data template ({}). \n"
-                                                   "To ignore this mis-match, list "
-                                                   "the atom's index number in the keyword '{}' in the ini file."
-                                                   "".format(dump_file,
-                                                             dump_atom_data[index][0], dump_atom_data[index][3],
-                                                             data_tpl_content[ATOMS_CONTENT][index][3],
-                                                             PROT_TYPE_IGNORE_ATOMS))
-
-                    d_out = create_out_fname(dump_file, suffix='_' + str(timestep),
-                                             ext='.data', base_dir=cfg[OUT_BASE_DIR])
-                    data_tpl_content[HEAD_CONTENT][0] = "Created by evbdump2data from {} " \
-                                                        "timestep {}".format(dump_file, timestep)
-                    list_to_file(data_tpl_content[HEAD_CONTENT] + dump_atom_data + data_tpl_content[TAIL_CONTENT],
-                                 d_out)
-                counter += 1
-    if counter == 1:
+                    atom_lists[PROT_RES].append(atom_struct)
+            elif atom_type == cfg[H3O_O_TYPE] or atom_type == cfg[H3O_H_TYPE]:
+                hydronium.append(atom_struct)
+            elif atom_type == cfg[WAT_O_TYPE] or atom_type == cfg[WAT_H_TYPE]:
+                water_dict[mol_num].append(atom_struct)
+            # Save everything else in three chunks for recombining sections post-processing
+            elif len(atom_lists[PROT_RES]) == 0:
+                atom_lists[PRE_RES].append(atom_struct)
+            elif len(water_dict) == 0:
+                atom_lists[POST_RES].append(atom_struct)
+            else:
+                atom_lists[POST_WAT].append(atom_struct)
+
+        # Check and process!
+        if len(water_dict) == 0:
+            raise InvalidDataError('Found no water molecules. Check that the input types {} = {} '
+                                   'and {} = {} are in the dump '
+                                   'file.'.format(WAT_O_TYPE, cfg[WAT_O_TYPE],
+                                                  WAT_H_TYPE, cfg[WAT_H_TYPE]))
+        if excess_proton is None:
+            if len(hydronium) != 4:
+                raise InvalidDataError('Did not find an excess proton or one hydronium ion. Check dump '
+                                       'file and input types: {} = {}; {} = {}; {} = {}'
+                                       .format(PROT_H_TYPE, cfg[PROT_H_TYPE],
+                                               H3O_O_TYPE, cfg[H3O_O_TYPE],
+                                               H3O_H_TYPE, cfg[H3O_H_TYPE]))
+        else:
+            if len(hydronium) != 0:
+                raise InvalidDataError('Found an excess proton and a hydronium atoms. Check dump file '
+                                       'and input types: {} = {}; {} = {}; {} = {}'
+                                       .format(PROT_H_TYPE, cfg[PROT_H_TYPE],
+                                               H3O_O_TYPE, cfg[H3O_O_TYPE],
+                                               H3O_H_TYPE, cfg[H3O_H_TYPE]))
+            deprotonate(cfg, atom_lists[PROT_RES], excess_proton, hydronium,
+                        water_dict, box, data_tpl_content)
+
+        # Ensure in correct order for printing
+        atom_lists[HYD_MOL] = assign_hyd_mol(cfg, hydronium)
+        atom_lists[WAT_MOL] = sort_wat_mols(cfg, water_dict)
+
+        for a_list in atom_list_order:
+            dump_atom_data += atom_lists[a_list]
+
+        # overwrite atom_num, mol_num, atom_type, charge, then description
+        for index in range(len(dump_atom_data)):
+            if dump_atom_data[index][3] == data_tpl_content[ATOMS_CONTENT][index][3] or \
+                    dump_atom_data[index][0] in cfg[PROT_TYPE_IGNORE_ATOMS]:
+                dump_atom_data[index][0:4] = data_tpl_content[ATOMS_CONTENT][index][0:4]
+                dump_atom_data[index][7] = ' '.join(data_tpl_content[ATOMS_CONTENT][index][7:])
+            else:
+                raise InvalidDataError("In reading file: {}\n found atom index {} with charge {} which "
+                                       "does not match the charge in the data template ({}). \n"
+                                       "To ignore this mis-match, list "
+                                       "the atom's index number in the keyword '{}' in the ini file."
+                                       "".format(dump_file,
+                                                 dump_atom_data[index][0], dump_atom_data[index][3],
+                                                 data_tpl_content[ATOMS_CONTENT][index][3],
+                                                 PROT_TYPE_IGNORE_ATOMS))
+
+        d_out = create_out_fname(dump_file, suffix='_' + str(timestep),
+                                 ext='.data', base_dir=cfg[OUT_BASE_DIR])
+        data_tpl_content[HEAD_CONTENT][0] = "Created by evbdump2data from {} " \
+                                            "timestep {}".format(dump_file, timestep)
+        list_to_file(data_tpl_content[HEAD_CONTENT] + dump_atom_data + data_tpl_content[TAIL_CONTENT],
+                     d_out)
+
+    if full_frame:
         print("Completed reading dumpfile {}".format(dump_file))
     else:
         warning("Dump file {} step {} did not have the full list of atom numbers. "
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Combines the g(r) checkpoint files written by lammps_proc (see its 'gofr_checkpoint_file' option) from independent
+runs, and writes the normalized RDFs from all of them.
+"""
+
+from __future__ import print_function
+import sys
+import argparse
+from md_utils.md_common import InvalidDataError, warning, file_rows_to_list
+from md_utils.lammps_proc import read_gofr_checkpoint, check_gofr_match, add_gofr_data, write_gofr
+
+__author__ = 'hmayes'
+
+# Error Codes
+# The good status code
+GOOD_RET = 0
+INPUT_ERROR = 1
+IO_ERROR = 2
+INVALID_DATA = 3
+
+# Defaults
+DEF_OUT_FILE = 'merged_gofrs.csv'
+
+
+def merge_gofr_checkpoints(checkpoint_files):
+    """
+    Adds up the RDF accumulators saved in g(r) checkpoint files. Each checkpoint must have the same bins and RDFs.
+    @param checkpoint_files: list of the names of the checkpoint files
+    @return: dict of the combined histogram data, and the histogram bin width
+    """
+    gofr_data = None
+    g_dr = None
+    file_sources = {}
+    for checkpoint_file in checkpoint_files:
+        chk_gofr_data, chk_g_dr, done_files, partial_file, partial_frames = read_gofr_checkpoint(checkpoint_file)
+        if partial_frames > 0:
+            done_files.append(partial_file)
+        for dump_file in done_files:
+            if dump_file in file_sources:
+                warning("Dump file {} was read for both checkpoint file {} and {}; its frames will be counted "
+                        "more than once.".format(dump_file, file_sources[dump_file], checkpoint_file))
+            else:
+                file_sources[dump_file] = checkpoint_file
+        if gofr_data is None:
+            gofr_data = chk_gofr_data
+            g_dr = chk_g_dr
+        else:
+            check_gofr_match(gofr_data, chk_gofr_data, checkpoint_file)
+            add_gofr_data(gofr_data, chk_gofr_data)
+    return gofr_data, g_dr
+
+
+def parse_cmdline(argv):
+    """
+    Returns the parsed argument list and return code.
+    `argv` is a list of arguments, or `None` for ``sys.argv[1:]``.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # initialize the parser object:
+    parser = argparse.ArgumentParser(description='Combines g(r) checkpoint files written by lammps_proc from '
+                                                 'independent runs, and writes the normalized RDFs.')
+    parser.add_argument("checkpoint_files", help="The g(r) checkpoint files to combine.", nargs='*', default=[])
+    parser.add_argument("-l", "--list_file", help="A file listing g(r) checkpoint files to combine (one per line), "
+                                                  "in addition to any given as arguments.", default=None)
+    parser.add_argument("-o", "--out_file", help="The name of the output file. The default is {}."
+                                                 "".format(DEF_OUT_FILE), default=DEF_OUT_FILE)
+    args = None
+    try:
+        args = parser.parse_args(argv)
+        if args.list_file is not None:
+            args.checkpoint_files += file_rows_to_list(args.list_file)
+        if len(args.checkpoint_files) == 0:
+            raise InvalidDataError("No g(r) checkpoint files were specified.")
+    except IOError as e:
+        warning("Problems reading file:", e)
+        parser.print_help()
+        return args, IO_ERROR
+    except InvalidDataError as e:
+        warning("Input data missing:", e)
+        parser.print_help()
+        return args, INPUT_ERROR
+    except SystemExit as e:
+        if hasattr(e, 'code') and e.code == 0:
+            return args, GOOD_RET
+        warning("Input data missing:", e)
+        parser.print_help()
+        return args, INPUT_ERROR
+
+    return args, GOOD_RET
+
+
+def main(argv=None):
+    # Read input
+    args, ret = parse_cmdline(argv)
+    if ret != GOOD_RET or args is None:
+        return ret
+
+    try:
+        gofr_data, g_dr = merge_gofr_checkpoints(args.checkpoint_files)
+        write_gofr(gofr_data, g_dr, args.out_file)
+    except IOError as e:
+        warning("Problems reading file:", e)
+        return IO_ERROR
+    except InvalidDataError as e:
+        warning("Problems reading data:", e)
+        return INVALID_DATA
+
+    return GOOD_RET  # success
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
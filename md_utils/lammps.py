@@ -2,73 +2,48 @@
 import os
 import numpy as np
 from collections import OrderedDict
-from md_utils.md_common import (InvalidDataError, warning)
+from md_utils.md_common import (InvalidDataError, warning, read_dump_atoms, TIMESTEP, NUM_ATOMS, BOX, ATOM_NUM,
+                                MOL_NUM, ATOM_TYPE, CHARGE, XYZ_COORDS)
 
 # Constants #
 
 MISSING_ATOMS_MSG = "Could not find lines for atoms ({}) in timestep {} in file: {}"
-TSTEP_LINE = 'ITEM: TIMESTEP'
-NUM_ATOM_LINE = 'ITEM: NUMBER OF ATOMS'
-BOX_LINE = 'ITEM: BOX'
-ATOMS_LINE = 'ITEM: ATOMS'
 
 
 # Logic #
 
-def find_atom_data(lammps_f, atom_ids):
-    """Searches and returns the given file location for atom data for the given IDs.
+def find_atom_data(lammps_f, atom_ids, frame_offsets=None):
+    """Searches and returns the given file location for atom data for the given IDs. Only the lines of the
+    given atoms are read from time steps with atom lines sorted by ID (see read_dump_atoms in md_common).
 
     :param lammps_f: The LAMMPS data file to search.
     :param atom_ids: The set of atom IDs to collect.
+    :param frame_offsets: If given, only the frames starting at these byte offsets are searched (see
+        split_dump_frames in md_common).
     :return: A nested dict of the atoms found keyed first by time step, then by atom ID.
     :raises: InvalidDataError If the file is missing atom data or is otherwise malformed.
     """
     tstep_atoms = OrderedDict()
     tstep_box = {}
     atom_count = len(atom_ids)
-    empty_dims = np.full(3, np.nan)
-
-    with open(lammps_f) as lfh:
-        file_name = os.path.basename(lammps_f)
-        tstep_id = None
-        box_dim = np.copy(empty_dims)
-        tstep_val = "(no value)"
-        for line in lfh:
-            if line.startswith(TSTEP_LINE):
-                try:
-                    tstep_val = next(lfh).strip()
-                    tstep_id = int(tstep_val)
-                # Todo: remove if never used
-                except ValueError as e:
-                    raise InvalidDataError("Invalid timestep value {}: {}".format(tstep_val, e))
-            elif line.startswith(NUM_ATOM_LINE):
-                # not needed, so just move along
-                next(lfh)
-            elif line.startswith(BOX_LINE):
-                try:
-                    for coord_id in range(len(box_dim)):
-                        box_vals = list(map(float, next(lfh).strip().split()))
-                        if len(box_vals) == 2:
-                            box_dim[coord_id] = box_vals[1] - box_vals[0]
-                except (ValueError, KeyError) as e:
-                    raise InvalidDataError("Invalid PBC value read on timestep {}: {}".format(tstep_val, e))
-            elif tstep_id is not None:
-                atom_lines = find_atom_lines(lfh, atom_ids, tstep_id, file_name)
-                if len(atom_lines) != atom_count:
-                    try:
-                        missing_atoms_err(atom_ids, atom_lines, tstep_id, file_name)
-                    except InvalidDataError as e:
-                        warning(e)
-                        warning("Skipping timestep and continuing.")
-                else:
-                    tstep_atoms[tstep_id] = atom_lines
-                    tstep_box[tstep_id] = box_dim
-                    tstep_id = None
-                    box_dim = empty_dims
+    file_name = os.path.basename(lammps_f)
+
+    for dump_frame in read_dump_atoms(lammps_f, list(atom_ids), frame_offsets=frame_offsets):
+        tstep_id = dump_frame[TIMESTEP]
+        atom_lines = find_atom_lines(dump_frame, atom_ids, tstep_id, file_name)
+        if len(atom_lines) != atom_count:
+            try:
+                missing_atoms_err(atom_ids, atom_lines, tstep_id, file_name)
+            except InvalidDataError as e:
+                warning(e)
+                warning("Skipping timestep and continuing.")
+        else:
+            tstep_atoms[tstep_id] = atom_lines
+            tstep_box[tstep_id] = dump_frame[BOX]
     return tstep_atoms, tstep_box
 
 
-def find_atom_lines(lfh, atom_ids, tstep_id, file_name):
+def find_atom_lines(dump_frame, atom_ids, tstep_id, file_name):
     """Collects the atom data for the given IDs, returning a dict keyed by atom
     ID with the atom value formatted as a six-element list containing:
 
@@ -79,29 +54,55 @@ def find_atom_lines(lfh, atom_ids, tstep_id, file_name):
     * Y (float)
     * Z (float)
 
-    :param lfh: A file handle for a LAMMPS file.
+    :param dump_frame: The columns of atom data for one time step, as returned by read_dump_frames or
+        read_dump_atoms.
     :param atom_ids: The set of atom IDs to collect.
     :param tstep_id: The ID for the current time step.
     :param file_name: the file name (basename) for the lammps file (for error printing)
 
     :return: A dict of atom lines keyed by atom ID (int).
-    :raises: InvalidDataError If the time step section is missing atom data or
-        is otherwise malformed.
+    :raises: InvalidDataError If the (complete) time step section is missing atom data.
     """
+    found_rows = np.flatnonzero(np.isin(dump_frame[ATOM_NUM], list(atom_ids)))
     found_atoms = {}
-    atom_count = len(atom_ids)
-    for aline in lfh:
-        s_line = aline.split()
-        if len(s_line) == 7 and int(s_line[0]) in atom_ids:
-            # noinspection PyTypeChecker
-            p_line = list(map(int, s_line[:3])) + list(map(float, s_line[-4:]))
-            found_atoms[p_line[0]] = p_line[1:]
-            if len(found_atoms) == atom_count:
-                return found_atoms
-        elif aline.startswith(TSTEP_LINE):
-            missing_atoms_err(atom_ids, found_atoms, tstep_id, file_name)
+    for atom_id, mol_id, atom_type, charge, xyz in zip(dump_frame[ATOM_NUM][found_rows].tolist(),
+                                                       dump_frame[MOL_NUM][found_rows].tolist(),
+                                                       dump_frame[ATOM_TYPE][found_rows].tolist(),
+                                                       dump_frame[CHARGE][found_rows].tolist(),
+                                                       dump_frame[XYZ_COORDS][found_rows].tolist()):
+        found_atoms[atom_id] = [mol_id, atom_type, charge] + xyz
+    # Only a time step cut off at the end of the file may be missing atoms; that one is skipped by the caller
+    if len(found_atoms) != len(atom_ids) and len(dump_frame[ATOM_NUM]) == dump_frame[NUM_ATOMS]:
+        missing_atoms_err(atom_ids, found_atoms, tstep_id, file_name)
     return found_atoms
 
+
+def find_atom_rows(dump_frame, atom_ids, tstep_id, file_name):
+    """Finds the rows of the given atom IDs in the columns of atom data for one time step, so that the data for
+    many atoms can be gathered at once.
+
+    :param dump_frame: The columns of atom data for one time step, as returned by read_dump_frames or
+        read_dump_atoms.
+    :param atom_ids: An integer array (of any shape) of the atom IDs to find; IDs may be repeated.
+    :param tstep_id: The ID for the current time step.
+    :param file_name: the file name (basename) for the lammps file (for error printing)
+
+    :return: An array of row indices with the same shape as atom_ids.
+    :raises: InvalidDataError If the time step section is missing atom data.
+    """
+    atom_ids = np.asarray(atom_ids)
+    if atom_ids.size == 0:
+        return np.zeros(atom_ids.shape, dtype=int)
+    frame_ids = dump_frame[ATOM_NUM]
+    found_rows = np.flatnonzero(np.isin(frame_ids, atom_ids))
+    found_ids = frame_ids[found_rows]
+    id_order = np.argsort(found_ids, kind='mergesort')
+    sorted_ids = found_ids[id_order]
+    id_pos = np.minimum(np.searchsorted(sorted_ids, atom_ids), max(len(sorted_ids) - 1, 0))
+    if len(sorted_ids) == 0 or np.any(sorted_ids[id_pos] != atom_ids):
+        missing_atoms_err(set(atom_ids.ravel().tolist()), dict.fromkeys(found_ids.tolist()), tstep_id, file_name)
+    return found_rows[id_order[id_pos]]
+
 # Exception Creators #
 
 
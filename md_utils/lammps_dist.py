@@ -11,69 +11,162 @@ import logging
 import os
 import sys
 import itertools
+import numpy as np
 from collections import OrderedDict
-from md_utils.lammps import find_atom_data
+from multiprocessing import Pool
+from md_utils.lammps import find_atom_rows
 from md_utils.md_common import (InvalidDataError, unique_list, create_out_fname, GOOD_RET, INPUT_ERROR,
-                                warning, IO_ERROR, file_rows_to_list, pbc_dist)
+                                warning, IO_ERROR, file_rows_to_list, pbc_dists, split_dump_frames, read_dump_atoms,
+                                imap_bounded, get_dump_bin, TIMESTEP, NUM_ATOMS, BOX, ATOM_NUM, XYZ_COORDS)
 
 logger = logging.getLogger(__name__)
 
 # Constants #
 
 FILENAME = 'filename'
-MISSING_TSTEP_ATOM_MSG = "Couldn't find an atom in file {} for timestep {}: {}"
 DEF_PAIRS_FILE = 'atom_pairs.txt'
 
 
 # Logic #
 
-def atom_distances(rst, atom_pairs):
+def iter_frame_distances(rst, atom_pairs, frame_offsets=None, single=False):
+    """Finds the distances between each of the atom pairs in the given LAMMPS dump file, one time step at a time.
+    Only the lines of the paired atoms are read from each time step (see read_dump_atoms in md_common), their
+    coordinates are gathered with one array index, and all the distances of the time step are found at once.
+
+    :param rst: A file in the LAMMPS dump format.
+    :param atom_pairs: Zero or more pairs of atom IDs to compare.
+    :param frame_offsets: If given, only the frames starting at these byte offsets are read.
+    :param single: If True, a binary cache with single precision coordinates may be read in place of the dump file.
+    :returns: A generator of tuples of the time step and an array of the distances, in the order of atom_pairs.
+    """
+    pair_ids = np.asarray(atom_pairs, dtype=int).reshape(-1, 2)
+    file_name = os.path.basename(rst)
+    for dump_frame in read_dump_atoms(rst, pair_ids, frame_offsets=frame_offsets, single=single):
+        tstep = dump_frame[TIMESTEP]
+        try:
+            pair_rows = find_atom_rows(dump_frame, pair_ids, tstep, file_name)
+        except InvalidDataError as e:
+            # Only a time step cut off at the end of the file may be missing atoms
+            if len(dump_frame[ATOM_NUM]) == dump_frame[NUM_ATOMS]:
+                raise
+            warning(e)
+            warning("Skipping timestep and continuing.")
+            continue
+        xyz_coords = dump_frame[XYZ_COORDS]
+        yield tstep, pbc_dists(xyz_coords[pair_rows[:, 0]], xyz_coords[pair_rows[:, 1]], dump_frame[BOX])
+
+
+def atom_distances(rst, atom_pairs, frame_offsets=None):
     """Finds the distance between the each of the atom pairs in the
     given LAMMPS dump file.
 
     :param rst: A file in the LAMMPS dump format.
     :param atom_pairs: Zero or more pairs of atom IDs to compare.
+    :param frame_offsets: If given, only the frames starting at these byte offsets are read.
     :returns: Nested dicts keyed by time step, then pair, with the distance as the value.
     """
     results = OrderedDict()
-    flat_ids = set(itertools.chain.from_iterable(atom_pairs))
-    tstep_atoms, tstep_box = find_atom_data(rst, flat_ids)
-
-    for tstep, atoms in tstep_atoms.items():
+    for tstep, dists in iter_frame_distances(rst, atom_pairs, frame_offsets=frame_offsets):
         pair_dist = OrderedDict({FILENAME: os.path.basename(rst)})
-        for pair in atom_pairs:
-            try:
-                row1 = atoms[pair[0]]
-                row2 = atoms[pair[1]]
-                pair_dist[pair] = pbc_dist(row1[-3:], row2[-3:], tstep_box[tstep])
-            except KeyError as e:
-                warning(MISSING_TSTEP_ATOM_MSG.format(rst, tstep, e))
-                return
+        for pair, dist in zip(atom_pairs, dists.tolist()):
+            pair_dist[pair] = dist
         results[tstep] = pair_dist
     return results
 
 
-def write_results(out_fname, dist_data, atom_pairs, write_mode='w'):
-    with open(out_fname, write_mode) as o_file:
-        o_writer = csv.writer(o_file, quoting=csv.QUOTE_NONNUMERIC)
-        # add header only if write mode (if appending, do not add header)
-        if write_mode == 'w':
-            o_writer.writerow([FILENAME, "timestep"] +
-                              ["_".join(map(str, t_pair)) for t_pair in atom_pairs])
-        for tstep, pair_dists in dist_data.items():
-            f_name = pair_dists[FILENAME]
-            dist_row = [f_name, tstep]
-            pair = None
-            try:
-                for pair in atom_pairs:
-                    dist_row.append(round(pair_dists[pair], 6))
-                o_writer.writerow(dist_row)
-            except KeyError as e:
-                raise InvalidDataError(MISSING_TSTEP_ATOM_MSG.format("_".join(map(str, pair)), tstep, e))
+def atom_distances_worker(dist_task):
+    """Runs iter_frame_distances in a worker process.
+
+    :param dist_task: A tuple of the arguments for iter_frame_distances.
+    :returns: A list of the time step and distances tuples from iter_frame_distances.
+    """
+    return list(iter_frame_distances(*dist_task))
+
+
+def file_distance_tasks(file_list, atom_pairs, num_workers, single=False):
+    """Divides the dump files into tasks for the worker processes. If there are fewer files than workers,
+    each file is split into contiguous ranges of frames so that all workers have frames to process.
+
+    :param file_list: The dump files to process.
+    :param atom_pairs: Zero or more pairs of atom IDs to compare.
+    :param num_workers: The number of worker processes.
+    :param single: If True, binary caches with single precision coordinates may be read in place of the dump files.
+    :returns: A list, in file order, of the list of iter_frame_distances arguments for each file.
+    """
+    if len(file_list) >= num_workers:
+        return [[(l_file, atom_pairs, None, single)] for l_file in file_list]
+    chunks_per_file = -(-num_workers // len(file_list))
+    file_tasks = []
+    for l_file in file_list:
+        frame_chunks = split_dump_frames(l_file, chunks_per_file)[0]
+        file_tasks.append([(l_file, atom_pairs, frame_offsets, single) for frame_offsets in frame_chunks])
+    return file_tasks
+
+
+def iter_file_distances(file_list, atom_pairs, num_workers=1, single=False):
+    """Finds the atom pair distances for each dump file, using worker processes if more than one worker is requested.
+    Results from the ranges of frames of a file are chained so that they are in the same order as when the file
+    is read in series. Workers only run ahead of the output by a few tasks, so that the results waiting to be
+    written do not pile up when there are many dump files.
+
+    :param file_list: The dump files to process.
+    :param atom_pairs: Zero or more pairs of atom IDs to compare.
+    :param num_workers: The number of worker processes.
+    :param single: If True, binary caches with single precision coordinates may be read in place of the dump files.
+    :returns: An iterator, in file order, of the iterator of time step and distances tuples for each file (see
+        iter_frame_distances), which must be used up before going on to the next file.
+    """
+    if num_workers < 2:
+        for l_file in file_list:
+            yield iter_frame_distances(l_file, atom_pairs, single=single)
+        return
+    file_tasks = file_distance_tasks(file_list, atom_pairs, num_workers, single=single)
+    all_tasks = [dist_task for dist_tasks in file_tasks for dist_task in dist_tasks]
+    num_procs = max(min(num_workers, len(all_tasks)), 1)
+    pool = Pool(num_procs)
+    try:
+        task_results = imap_bounded(pool, atom_distances_worker, all_tasks, 2 * num_procs)
+        for dist_tasks in file_tasks:
+            yield itertools.chain.from_iterable(itertools.islice(task_results, len(dist_tasks)))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def write_results(out_fname, f_name, frame_dists, atom_pairs, write_mode='w'):
+    """Writes a row of distances for each time step as it is found. The output file is only opened once there is a
+    row to write.
+
+    :param out_fname: The name of the output file.
+    :param f_name: The name of the dump file (for the file name column).
+    :param frame_dists: An iterator of tuples of the time step and an array of the distances (see
+        iter_frame_distances).
+    :param atom_pairs: Zero or more pairs of atom IDs to compare.
+    :param write_mode: 'w' to start a new file (with a header), or 'a' to append.
+    :return: A boolean, True if any rows were written.
+    """
+    o_file = None
+    try:
+        for tstep, dists in frame_dists:
+            if o_file is None:
+                o_file = open(out_fname, write_mode)
+                o_writer = csv.writer(o_file, quoting=csv.QUOTE_NONNUMERIC)
+                # add header only if write mode (if appending, do not add header)
+                if write_mode == 'w':
+                    o_writer.writerow([FILENAME, "timestep"] +
+                                      ["_".join(map(str, t_pair)) for t_pair in atom_pairs])
+            o_writer.writerow([f_name, tstep] + [round(dist, 6) for dist in dists.tolist()])
+    finally:
+        if o_file is not None:
+            o_file.close()
+    if o_file is None:
+        return False
     if write_mode == 'w':
         print("Wrote file: {}".format(out_fname))
     elif write_mode == 'a':
         print("  Appended: {}".format(out_fname))
+    return True
 
 
 def parse_pairs(pair_files):
@@ -114,6 +207,16 @@ def parse_cmdline(argv=None):
                             DEF_PAIRS_FILE))
     parser.add_argument("-f", "--file", help="The dump file to process", default=None)
     parser.add_argument("-l", "--list_file", help="The file with a list of dump files to process", default=None)
+    parser.add_argument("-w", "--workers", help="The number of processes to use to read dump files; if there are "
+                                                "fewer dump files than processes, the frames of each file are "
+                                                "divided among them (default 1)", default=1, type=int)
+    parser.add_argument("-b", "--bin_cache", help="First convert each dump file without an up-to-date binary cache "
+                                                  "(see dump2bin), so that this and later runs read the cache "
+                                                  "without parsing", action='store_true', default=False)
+    parser.add_argument("-s", "--single", help="Read binary caches with single precision coordinates (see dump2bin "
+                                               "'-s') in place of the dump files, and with '-b', store the "
+                                               "coordinates of new caches in single precision",
+                        action='store_true', default=False)
 
     args = None
     try:
@@ -125,6 +228,8 @@ def parse_cmdline(argv=None):
                                        "pair file: {}".format(DEF_PAIRS_FILE))
         if (args.file is None) and (args.list_file is None):
             raise InvalidDataError("Specify either a file or list of files to process.")
+        if args.workers < 1:
+            raise InvalidDataError("The number of workers ({}) must be at least 1.".format(args.workers))
     except (KeyError, InvalidDataError, SystemExit) as e:
         if hasattr(e, 'code') and e.code == 0:
             return args, GOOD_RET
@@ -155,14 +260,16 @@ def main(argv=None):
         if args.file is not None:
             file_list.append(args.file)
 
-        dists = OrderedDict()
         pairs = parse_pairs(args.pair_files)
+        if args.bin_cache:
+            for l_file in file_list:
+                get_dump_bin(l_file, single=args.single)
+        out_fname = create_out_fname(base_file_name, prefix='pairs_', ext='.csv')
         write_mode = 'w'
-        for l_file in file_list:
-            dists.update(atom_distances(l_file, pairs))
-            if len(dists) > 0:
-                write_results(create_out_fname(base_file_name, prefix='pairs_', ext='.csv'),
-                              dists, pairs, write_mode=write_mode)
+        for file_index, frame_dists in enumerate(iter_file_distances(file_list, pairs, num_workers=args.workers,
+                                                                     single=args.single)):
+            if write_results(out_fname, os.path.basename(file_list[file_index]), frame_dists, pairs,
+                             write_mode=write_mode):
                 write_mode = 'a'
     except IOError as e:
         warning("Problems reading file: {}".format(e))
@@ -12,7 +12,7 @@ import sys
 import re
 
 from md_utils.md_common import (InvalidDataError, warning, file_rows_to_list, IO_ERROR, GOOD_RET, INPUT_ERROR,
-                                INVALID_DATA, get_fname_root, create_out_fname, write_csv)
+                                INVALID_DATA, get_fname_root, create_out_fname, write_csv, open_input)
 
 try:
     # noinspection PyCompatibility
@@ -105,7 +105,7 @@ def process_log(log_file):
     result_list = []
     file_root = get_fname_root(log_file)
 
-    with open(log_file) as l_file:
+    with open_input(log_file) as l_file:
         reading_steps = False
         result_dict = {}
         for line in l_file:
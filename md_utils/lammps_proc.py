@@ -8,13 +8,21 @@ This script assumes we care about one protonatable residue in a simulation with
 
 from __future__ import print_function
 import copy
+import csv
 import os
 import sys
 import argparse
 import numpy as np
+from bisect import bisect_left
+from functools import partial
+from itertools import islice, product
+from multiprocessing import Pool
 from md_utils.md_common import (InvalidDataError, create_out_fname, pbc_dist, warning, process_cfg,
-                                find_dump_section_state, write_csv, list_to_csv, pbc_vector_avg, pbc_calc_vector,
-                                file_rows_to_list, vec_angle, vec_dihedral, read_csv_to_dict, read_csv_header)
+                                read_dump_frames, write_csv, list_to_csv, pbc_vector_avg, pbc_calc_vector,
+                                pbc_dists, pbc_pair_dists, pbc_neighbor_dists, pbc_neighbor_pairs, file_rows_to_list,
+                                vec_angle, vec_dihedral, vec_angles, vec_dihedrals, pbc_calc_vectors,
+                                read_csv_header, open_input, get_dump_index, split_dump_frames, NUM_ATOMS, BOX,
+                                IDX_TIMESTEPS, IDX_OFFSETS, get_dump_bin)
 from md_utils.evb_get_info import (CEC_X, CEC_Y, CEC_Z)
 
 try:
@@ -90,16 +98,55 @@ CALC_CEC_DIST = 'calc_cec_dist_flag'
 WATER_TERMS_PRINT = 'print_water_terms'
 COMBINE_OUTPUT = 'combine_output_flag'
 
-# TODO: talk to Chris about listing many angles, dihedrals
+
+# Optional section listing coordination numbers to report for every frame: each key is the output column name, and
+#     its value the two atom selections (each either an atom type or the name of one of the ATOM_GROUPS) followed by
+#     the switching and cut-off distances of switch_func
+COORD_NUM_SEC = 'coordination_numbers'
 CALC_COORD_NUM = 'calc_coord_number'
-CALC_ANG_OCO = 'calc_carboxyl_o_c_o_ang'  # 18 17 19
-CALC_ANG_COH = 'calc_carboxyl_c_o_h_ang'  # 17 ?? ??
-CALC_DIH_CCCC = 'calc_carboxyl_ca_cb_cg_cd_dihed'  # 9 11 14 17
-CALC_DIH_CCOH = 'calc_carboxyl_cg_cd_o_h_dihed'  # 14 17 ?? ??
+# Optional sections listing internal coordinates to report for every frame: each key is the output column name,
+#     and its value the comma-separated atom ids defining the distance, angle (at the middle atom), or dihedral
+DIST_SEC = 'distances'
+ANGLE_SEC = 'angles'
+DIHED_SEC = 'dihedrals'
+# section names with the number of atoms defining each coordinate
+INTERNAL_COORD_SECS = [(DIST_SEC, 2), (ANGLE_SEC, 3), (DIHED_SEC, 4)]
+INTERNAL_COORDS = 'internal_coords'
+# Mean squared displacements (MSDs) over the frames processed (in dump file order) of the listed atom ids, of all the
+#     atoms of one type, and/or of the CEC (read from the evb_sum_file_name), with diffusion coefficients fit over a
+#     range of lags (in frames)
+MSD_ATOM_NUMS = 'msd_atom_nums'
+MSD_ATOM_TYPE = 'msd_atom_type'
+CALC_CEC_MSD = 'calc_cec_msd_flag'
+MSD_MAX_LAG = 'msd_max_lag_frames'
+MSD_FIT_LAGS = 'msd_fit_lag_frames'
+MSD_OUTPUT = 'flag_for_msd_output'
+# Residence time correlation functions of the water molecules (found by their water or hydronium oxygen atoms) within
+#     a cutoff distance of each carboxylic oxygen atom
+CALC_RES_TIME = 'calc_res_time_flag'
+RES_CUTOFF = 'res_time_cutoff'
+RES_MAX_LAG = 'res_time_max_lag_frames'
+# Spatial density grids of atoms of the listed types, on a cube of voxels centered on the carboxylic carbon atom
+DENSITY_ATOM_TYPES = 'density_grid_atom_types'
+DENSITY_SPACING = 'density_grid_spacing'
+DENSITY_HALF_WIDTH = 'density_grid_half_width'
 
 # Added so I don't have to read all of a really big file
 MAX_TIMESTEPS = 'max_timesteps_per_dumpfile'
 PRINT_TIMESTEPS = 'print_output_every_x_timesteps'
+# the time between frames, for the lag times of the time correlation functions
+FRAME_TIME = 'time_per_frame'
+NUM_WORKERS = 'num_workers'
+# If True, dump files without an up-to-date binary cache (see dump2bin) are converted first, so later runs are faster
+MAKE_DUMP_BIN = 'make_dump_bin_flag'
+# If True, binary caches with single precision coordinates (see dump2bin) are read in place of dump files, and those
+#     made with MAKE_DUMP_BIN store single precision coordinates
+SINGLE_DUMP_BIN = 'single_dump_bin_flag'
+# Optional file where the RDF accumulators and the progress through the dump files are saved, every PRINT_TIMESTEPS
+#     timesteps and after each dump file, so that a run can be resumed, or combined with others (see gofr_merge)
+GOFR_CHECKPOINT = 'gofr_checkpoint_file'
+GOFR_RESUME = 'resume_from_gofr_checkpoint'
+BATCH_HIJ = 'batch_hij_calcs'
 PER_FRAME_OUTPUT = 'requires_output_for_every_frame'
 PER_FRAME_OUTPUT_FLAGS = [CALC_OCOH_PROPS, CALC_HIJ_DA_GAUSS_FORM, CALC_HIJ_ARQ_FORM, CALC_HIJ_WATER_FORM,
                           WATER_TERMS_PRINT, CALC_HYD_WAT, CALC_HIJ_NEW, CALC_CEC_DIST]
@@ -120,6 +167,11 @@ VIJ_NEW = 'new_vij'
 EPS_NEW = 'new_eps'
 C_DA_NEW = 'new_c_da'
 NEW_PARAMS = [GAMMA_NEW, LAMBDA_NEW, R0_DA_NEW, R0SC_NEW, ALPHA_NEW, A_DA_NEW, VIJ_NEW, EPS_NEW, C_DA_NEW]
+# Optional section listing many sets of the "new" parameters, all evaluated in one pass over the dump files
+NEW_SWEEP_SEC = 'new_arq_sweep'
+NEW_SWEEP = 'new_arq_sweep_param_sets'
+NEW_SWEEP_GRID = 'new_arq_sweep_grid_flag'
+NEW_SWEEP_COL = 'hij_new_column'
 MIN_DIST_BETA = 'min_dist_beta'
 
 # Defaults
@@ -156,9 +208,13 @@ DEF_CFG_VALS = {DUMP_FILE_LIST: 'list.txt',
                 COMBINE_OUTPUT: False,
                 ARQ_TYPE: 2,
                 GAMMA_NEW: None, LAMBDA_NEW: None, R0_DA_NEW: None, R0SC_NEW: None, ALPHA_NEW: None,
-                A_DA_NEW: None, VIJ_NEW: None, EPS_NEW: None, C_DA_NEW: None,
+                A_DA_NEW: None, VIJ_NEW: None, EPS_NEW: None, C_DA_NEW: None, NEW_SWEEP_GRID: False,
                 EVB_SUM_FILE: None, ALIGN_COL: TIMESTEP, CALC_CEC_DIST: False, EVB_FILE_EXT: '.evb',
-                MIN_DIST_BETA: 250.0, ONLY_STEPS: [],
+                MIN_DIST_BETA: 250.0, ONLY_STEPS: [], NUM_WORKERS: 1, MAKE_DUMP_BIN: False, BATCH_HIJ: False,
+                SINGLE_DUMP_BIN: False, GOFR_CHECKPOINT: None, GOFR_RESUME: False,
+                MSD_ATOM_NUMS: [], MSD_ATOM_TYPE: -1, CALC_CEC_MSD: False, MSD_MAX_LAG: 1000, FRAME_TIME: 1.0,
+                MSD_FIT_LAGS: [], MSD_OUTPUT: False, CALC_RES_TIME: False, RES_CUTOFF: 3.5, RES_MAX_LAG: 1000,
+                DENSITY_ATOM_TYPES: [], DENSITY_SPACING: 0.25, DENSITY_HALF_WIDTH: 8.0,
                 }
 REQ_KEYS = {PROT_RES_MOL_ID: int,
             PROT_H_TYPE: int,
@@ -169,10 +225,6 @@ REQ_KEYS = {PROT_RES_MOL_ID: int,
             }
 
 # For dump file processing
-SEC_TIMESTEP = 'timestep'
-SEC_NUM_ATOMS = 'dump_num_atoms'
-SEC_BOX_SIZE = 'dump_box_size'
-SEC_ATOMS = 'atoms_section'
 ATOM_NUM = 'atom_num'
 MOL_NUM = 'mol_num'
 ATOM_TYPE = 'atom_type'
@@ -198,6 +250,135 @@ OO_STEPS_COUNTED = 'oo_steps_counted'
 HH_STEPS_COUNTED = 'hh_steps_counted'
 OH_STEPS_COUNTED = 'oh_steps_counted'
 TYPE_STEPS_COUNTED = 'type_steps_counted'
+# the flag requesting each RDF, its accumulators, and its output column (in output order)
+GOFR_ACCUMULATORS = [(CALC_HO_GOFR, HO_BIN_COUNT, HO_STEPS_COUNTED, GOFR_HO),
+                     (CALC_OO_GOFR, OO_BIN_COUNT, OO_STEPS_COUNTED, GOFR_OO),
+                     (CALC_HH_GOFR, HH_BIN_COUNT, HH_STEPS_COUNTED, GOFR_HH),
+                     (CALC_OH_GOFR, OH_BIN_COUNT, OH_STEPS_COUNTED, GOFR_OH),
+                     (CALC_TYPE_GOFR, TYPE_BIN_COUNT, TYPE_STEPS_COUNTED, GOFR_TYPE),
+                     ]
+# for g(r) checkpoints: besides the bins and the accumulators, the dump files fully read, in order, and the number of
+#     frames read from the next one
+CHK_DONE_FILES = 'done_dump_files'
+CHK_PARTIAL_FILE = 'partial_dump_file'
+CHK_PARTIAL_FRAMES = 'partial_frames_read'
+
+# for MSD calcs
+MSD_LAG = 'msd_lag'
+MSD_TIME = 'msd_time'
+MSD_ATOMS = 'msd_atoms'
+MSD_TYPE = 'msd_type'
+MSD_CEC = 'msd_cec'
+MSD_COLUMN = 'msd_column'
+DIFF_COEF = 'diffusion_coef'
+# per-frame positions (one array for each MSD column), and box, kept until added to the MSD accumulators (every
+#     MIN_CORR_CHUNK frames processed)
+MSD_XYZ = 'msd_xyz'
+MSD_BOX = 'msd_box'
+# time correlation functions are found from chunks of at least MIN_CORR_CHUNK frames
+MIN_CORR_CHUNK = 100
+# MSD accumulators: frames are unwrapped one at a time, then correlated in chunks. The first frame (wrapped), the
+#     first max_lag frames and the sum of the unwrapped positions are kept so that the accumulators for a later range
+#     of frames (e.g. from a worker process) can be added (see add_msd_data).
+MSD_FIRST_STEP = 'msd_first_step'
+MSD_FIRST_XYZ = 'msd_first_xyz'
+MSD_FIRST_BOX = 'msd_first_box'
+MSD_COLS = 'msd_cols'
+MSD_COL_SIZES = 'msd_col_sizes'
+MSD_NUM_FRAMES = 'msd_num_frames'
+MSD_PREV_XYZ = 'msd_prev_xyz'
+MSD_UNWRAPPED = 'msd_unwrapped'
+MSD_PENDING = 'msd_pending'
+MSD_LAST_FRAMES = 'msd_last_frames'
+MSD_HEAD_FRAMES = 'msd_head_frames'
+MSD_XYZ_SUM = 'msd_xyz_sum'
+MSD_SQ_SUM = 'msd_sq_sum'
+MSD_CORR = 'msd_corr'
+
+# for residence time calcs
+RES_LAG = 'res_lag'
+RES_LAG_TIME = 'res_lag_time'
+RES_CORR = 'res_corr_{}'
+RES_COLUMN = 'res_column'
+RES_TIME = 'residence_time'
+# per-frame occupancies, as bits (carboxylic oxygen atoms x bytes), with the number of waters, kept until added to the
+#     residence time accumulators (every MIN_CORR_CHUNK frames processed)
+RES_OCC = 'res_occupancy'
+RES_NUM_WATERS = 'res_num_waters'
+# the first max_lag frames are kept so that the accumulators for a later range of frames can be added
+RES_FIRST_STEP = 'res_first_step'
+RES_HEAD_FRAMES = 'res_head_frames'
+RES_NUM_FRAMES = 'res_num_frames'
+RES_PENDING = 'res_pending'
+RES_LAST_FRAMES = 'res_last_frames'
+RES_OCC_SUM = 'res_occ_sum'
+RES_CORR_SUMS = 'res_corr_sums'
+
+# for spatial density grids: the number of atoms found in each voxel, and the number of frames counted
+DENSITY_COUNTS = 'density_counts'
+DENSITY_NUM_FRAMES = 'density_num_frames'
+
+# For reading the evb summary file: the file column of the alignment column and of each of EVB_SUM_HEADERS, and,
+#     if the file is sorted by timestep, the timestep and byte offset of every EVB_INDEX_STRIDE-th row (so that reading
+#     can start near any timestep); otherwise, a dict of the needed values of every row
+EVB_INDEX_STRIDE = 1000
+EVB_ALIGN_INDEX = 'evb_align_index'
+EVB_COL_INDICES = 'evb_col_indices'
+EVB_KEYS = 'evb_keys'
+EVB_OFFSETS = 'evb_offsets'
+EVB_DICT = 'evb_dict'
+# for following the sorted evb summary file along with the dump frames
+EVB_ROWS = 'evb_rows'
+EVB_NEXT_ROW = 'evb_next_row'
+EVB_LAST_VAL = 'evb_last_val'
+EVB_MATCH_KEY = 'evb_match_key'
+EVB_MATCH_VALS = 'evb_match_vals'
+
+# For worker processes
+WORKER_INPUT = {}
+CFG = 'cfg'
+EVB_SUM = 'evb_sum'
+
+# For the atom selections kept from one timestep to the next
+SEL_CARBOXYL_O = 'carboxyl_oxys'
+SEL_CARBOXYL_C = 'carboxyl_carb'
+SEL_PROT_H = 'prot_h'
+SEL_WATER_O = 'water_oxys'
+SEL_WATER_H = 'water_hs'
+SEL_HYDRONIUM = 'hydronium'
+SEL_GOFR_TYPE1 = 'gofr_type1_atoms'
+SEL_GOFR_TYPE2 = 'gofr_type2_atoms'
+SEL_CATEGORIES = 'atom_categories'
+# each atom is in at most one of these groups; the order sets the priority used to classify atoms
+SEL_COORD_ATOMS = 'internal_coord_atoms'
+SEL_MSD_ATOMS = 'msd_atoms'
+ATOM_GROUPS = [SEL_CARBOXYL_O, SEL_CARBOXYL_C, SEL_PROT_H, SEL_WATER_O, SEL_WATER_H, SEL_HYDRONIUM]
+NO_GROUP = -1
+
+# For planning the per-frame calculations
+CALC_PLAN = 'calc_plan'
+STEP_EXCESS_H = 'excess_proton'
+STEP_OH_DISTS = 'oh_dists'
+STEP_CARBOXYL_GEOM = 'carboxyl_geometry'
+STEP_CEC = 'cec_dists'
+STEP_HIJ_AMINO = 'hij_amino'
+STEP_CLOSEST_O = 'closest_o_to_ostar'
+STEP_WATER_Q = 'water_q'
+STEP_HIJ_WATER = 'hij_water'
+STEP_DA_GEOM = 'da_geometry'
+STEP_HIJ_ARQ = 'hij_arq'
+STEP_HIJ_NEW = 'hij_new'
+STEP_HIJ_NEW_SWEEP = 'hij_new_sweep'
+STEP_HYD_WAT = 'hyd_wat'
+# intermediate values shared between calculation steps
+DUMP_ATOM_DATA = 'dump_atom_data'
+WATER_OXY_COORDS = 'water_oxy_coords'
+EXCESS_H = 'excess_h'
+O_STAR = 'o_star'
+ALT_O = 'alt_o'
+CLOSEST_O = 'closest_o'
+DA_DH_VEC = 'da_dh_vector'
+DA_DA_VEC = 'da_da_vector'
 
 # Values to output
 OH_MIN = 'oh_min'
@@ -354,6 +535,39 @@ def calc_q(r_o, r_op, r_h, box):
     return np.dot(q_vec, q_vec)
 
 
+def calc_da_vectors(r_ao, r_do, r_h, box):
+    """
+    Calculates the donor-acceptor geometry used for the 3-body term of Maupin et al. 2006
+    @param r_ao: x,y,z position of the acceptor oxygen (closest water O)
+    @param r_do: x,y,z position of the donor oxygen (always using the glu oxygen, for now)
+    @param r_h: x,y,z position of the reactive H
+    @param box: the dimensions of the periodic box (assumed 90 degree angles)
+    @return: the donor-acceptor distance, the donor-to-H vector, and the donor-to-acceptor vector
+    """
+    da_dist = pbc_dist(r_do, r_ao, box)
+    r_dh = pbc_calc_vector(r_h, r_do, box)
+    r_da = pbc_calc_vector(r_ao, r_do, box)
+    return da_dist, r_dh, r_da
+
+
+def calc_q_dot_arq(da_dist, r_dh, r_da, r0_sc, r0_da_q, lambda_q):
+    """
+    Calculates the 3-body term from the donor-acceptor geometry (see calc_da_vectors), per Maupin et al. 2006,
+    http://pubs.acs.org/doi/pdf/10.1021/jp053596r, equations 7-8
+    Also accepts arrays of distances and (N, 3) arrays of vectors, to evaluate many frames at once.
+    @param da_dist: the donor-acceptor distance
+    @param r_dh: the donor-to-H vector
+    @param r_da: the donor-to-acceptor vector
+    @param r0_sc: parameter for calc
+    @param r0_da_q: parameter for calc
+    @param lambda_q: parameters for calc
+    @return: the dot-product of the vector q (not the norm, as we need it squared for the next step)
+    """
+    r_sc = r0_sc - lambda_q * (da_dist - r0_da_q)
+    q_vec = np.subtract(r_dh, np.expand_dims(r_sc, -1) * r_da / 2.0)
+    return np.einsum('...i,...i', q_vec, q_vec)
+
+
 def calc_q_arq(r_ao, r_do, r_h, box, r0_sc, r0_da_q, lambda_q):
     """
     Calculates the 3-body term, keeping the pbc in mind, per Maupin et al. 2006,
@@ -365,14 +579,10 @@ def calc_q_arq(r_ao, r_do, r_h, box, r0_sc, r0_da_q, lambda_q):
     @param r0_sc: parameter for calc
     @param r0_da_q: parameter for calc
     @param lambda_q: parameters for calc
-    @return: the dot-product of the vector q (not the norm, as we need it squared for the next step)
+    @return: the donor-acceptor distance and the dot-product of the vector q
     """
-    da_dist = pbc_dist(r_do, r_ao, box)
-    r_sc = r0_sc - lambda_q * (da_dist - r0_da_q)
-    r_dh = pbc_calc_vector(r_h, r_do, box)
-    r_da = pbc_calc_vector(r_ao, r_do, box)
-    q_vec = np.subtract(r_dh, r_sc * r_da / 2.0)
-    return da_dist, np.dot(q_vec, q_vec)
+    da_dist, r_dh, r_da = calc_da_vectors(r_ao, r_do, r_h, box)
+    return da_dist, calc_q_dot_arq(da_dist, r_dh, r_da, r0_sc, r0_da_q, lambda_q)
 
 
 def calc_hij_wat(r_oo, q_dot):
@@ -422,15 +632,122 @@ def switch_func(rc, rs, r_array):
     @param r_array: an array of distance values
     @return: an array of smoothing values in range [0,1]
     """
-    switches = np.zeros(len(r_array))
-    for index, r in enumerate(r_array):
-        if r <= rs:
-            switches[index] = 1.00
-        elif r < rc:
-            switches[index] = 1 - (rc - rs) ** (-3) * (r - rs) ** 2 * (3 * rc - rs - 2 * r)
+    r_array = np.asarray(r_array, dtype=float)
+    switches = 1 - (rc - rs) ** (-3) * (r_array - rs) ** 2 * (3 * rc - rs - 2 * r_array)
+    switches[r_array <= rs] = 1.00
+    switches[r_array >= rc] = 0.0
     return switches
 
 
+def read_new_sweep_vals(sweep_items):
+    """
+    Reads the values listed for each "new" parameter in the parameter sweep section
+    @param sweep_items: list of key, value tuples from the sweep section of the configuration file
+    @return: dict of parameter name to a list of its float values
+    """
+    sweep_vals = {}
+    for key, val in sweep_items:
+        if key not in NEW_PARAMS:
+            raise InvalidDataError("Unexpected key '{}' in section '{}'. Expected keys: {}"
+                                   "".format(key, NEW_SWEEP_SEC, NEW_PARAMS))
+        try:
+            sweep_vals[key] = [float(x.strip()) for x in val.split(',')]
+        except ValueError:
+            raise InvalidDataError("Found '{}' for key '{}' in section '{}'. Require a comma-separated list of "
+                                   "floats.".format(val, key, NEW_SWEEP_SEC))
+    return sweep_vals
+
+
+def make_new_sweep(cfg, sweep_vals):
+    """
+    Makes the sets of "new" parameters to evaluate. Parameters not in the sweep section take their main section
+    value. The sets are either every combination of the listed values (NEW_SWEEP_GRID), or the listed values taken
+    in order, so that the n-th set uses the n-th value listed for each key.
+    @param cfg: configuration for the run, with the main section "new" parameters converted to floats
+    @param sweep_vals: dict of parameter name to a list of values, as returned by read_new_sweep_vals
+    @return: dict of parameter name to a numpy array of its value in each set
+    """
+    param_vals = [sweep_vals.get(key, [cfg[key]]) for key in NEW_PARAMS]
+    if cfg[NEW_SWEEP_GRID]:
+        param_sets = list(product(*param_vals))
+    else:
+        num_sets = max(len(vals) for vals in param_vals)
+        for key, vals in zip(NEW_PARAMS, param_vals):
+            if len(vals) not in [1, num_sets]:
+                raise InvalidDataError("Found {} values for key '{}' in section '{}'. Unless '{}' is True, each key "
+                                       "must have either one value or the same number of values as the other keys "
+                                       "({}).".format(len(vals), key, NEW_SWEEP_SEC, NEW_SWEEP_GRID, num_sets))
+        param_sets = list(zip(*[vals * num_sets if len(vals) == 1 else vals for vals in param_vals]))
+    return dict((key, np.array(key_vals)) for key, key_vals in zip(NEW_PARAMS, zip(*param_sets)))
+
+
+def new_sweep_fieldname(set_index):
+    """
+    @param set_index: the (zero-based) index of a parameter set in the sweep
+    @return: the name of the output column with the hij for that parameter set
+    """
+    return '{}_{}'.format(HIJ_NEW, set_index + 1)
+
+
+def read_internal_coords(config):
+    """
+    Reads the distances, angles, and dihedrals listed in the configuration file
+    @param config: the ConfigParser with the configuration file read
+    @return: dict, keyed by section name, of the list of output column names and the array of their atom ids
+    """
+    internal_coords = {}
+    coord_names = set()
+    for section, num_atoms in INTERNAL_COORD_SECS:
+        if section not in config.sections():
+            continue
+        section_names = []
+        section_ids = []
+        for key, val in config.items(section):
+            try:
+                atom_ids = [int(x.strip()) for x in val.split(',')]
+            except ValueError:
+                atom_ids = []
+            if len(atom_ids) != num_atoms:
+                raise InvalidDataError("For key '{}' in section '{}', expected {} comma-separated integer atom ids, "
+                                       "but read: {}".format(key, section, num_atoms, val))
+            if key in coord_names:
+                raise InvalidDataError("Found key '{}' in more than one of the sections: {}"
+                                       "".format(key, [sec_name for sec_name, sec_atoms in INTERNAL_COORD_SECS]))
+            coord_names.add(key)
+            section_names.append(key)
+            section_ids.append(atom_ids)
+        if len(section_names) > 0:
+            internal_coords[section] = (section_names, np.array(section_ids))
+    return internal_coords
+
+
+def read_coord_nums(config):
+    """
+    Reads the coordination numbers listed in the configuration file
+    @param config: the ConfigParser with the configuration file read
+    @return: list of tuples of the output column name, the two atom selections, and the switching and cut-off
+        distances
+    """
+    coord_nums = []
+    if COORD_NUM_SEC not in config.sections():
+        return coord_nums
+    for key, val in config.items(COORD_NUM_SEC):
+        entries = [x.strip() for x in val.split(',')]
+        try:
+            if len(entries) != 4:
+                raise ValueError
+            atom_sels = [entry if entry in ATOM_GROUPS else int(entry) for entry in entries[:2]]
+            switch_dist, cutoff = float(entries[2]), float(entries[3])
+            if not 0.0 <= switch_dist < cutoff:
+                raise ValueError
+        except ValueError:
+            raise InvalidDataError("For key '{}' in section '{}', read: {}\n    Expected two atom selections (each an "
+                                   "atom type or one of {}), then the switching distance and a larger cut-off "
+                                   "distance.".format(key, COORD_NUM_SEC, val, ATOM_GROUPS))
+        coord_nums.append((key, atom_sels[0], atom_sels[1], switch_dist, cutoff))
+    return coord_nums
+
+
 def read_cfg(floc, cfg_proc=process_cfg):
     """
     Reads the given configuration file, returning a dict with the converted values supplemented by default values.
@@ -445,7 +762,13 @@ def read_cfg(floc, cfg_proc=process_cfg):
     if not good_files:
         raise IOError('Could not read file {}'.format(floc))
     main_proc = cfg_proc(dict(config.items(MAIN_SEC)), DEF_CFG_VALS, REQ_KEYS)
-    main_proc[CALC_HIJ_NEW] = False
+    main_proc[INTERNAL_COORDS] = read_internal_coords(config)
+    main_proc[CALC_COORD_NUM] = read_coord_nums(config)
+    if NEW_SWEEP_SEC in config.sections():
+        sweep_vals = read_new_sweep_vals(config.items(NEW_SWEEP_SEC))
+    else:
+        sweep_vals = {}
+    main_proc[CALC_HIJ_NEW] = len(sweep_vals) > 0
     # first see if we will calculate it
     for key in NEW_PARAMS:
         if main_proc[key] is not None:
@@ -453,6 +776,9 @@ def read_cfg(floc, cfg_proc=process_cfg):
             break
     if main_proc[CALC_HIJ_NEW]:
         for key in NEW_PARAMS:
+            # a parameter given in the sweep section need not also be given in the main section
+            if key in sweep_vals and main_proc[key] is None:
+                continue
             try:
                 main_proc[key] = float(main_proc[key].split(',')[0])
             except (TypeError, ValueError, AttributeError):
@@ -462,12 +788,41 @@ def read_cfg(floc, cfg_proc=process_cfg):
                     first_warn = "Found '{}' for key '{}'. ".format(main_proc[key], key)
                 raise InvalidDataError(first_warn + "Require float inputs for keys: {}"
                                        "".format(NEW_PARAMS))
+    if len(sweep_vals) > 0:
+        main_proc[NEW_SWEEP] = make_new_sweep(main_proc, sweep_vals)
+    else:
+        main_proc[NEW_SWEEP] = None
     if main_proc[ALIGN_COL] not in [TIMESTEP, FILE_NAME]:
         raise InvalidDataError("The program currently can only align CEC data on either '{}' or '{}'"
                                .format(TIMESTEP, FILE_NAME))
     if main_proc[CALC_CEC_DIST] and main_proc[EVB_SUM_FILE] is None:
         raise InvalidDataError("To calculate CEC distances ('{}' set to True), an '{}' must be specified."
                                .format(CALC_CEC_DIST, EVB_SUM_FILE))
+    if main_proc[CALC_CEC_MSD] and main_proc[EVB_SUM_FILE] is None:
+        raise InvalidDataError("To calculate the CEC MSD ('{}' set to True), an '{}' must be specified."
+                               .format(CALC_CEC_MSD, EVB_SUM_FILE))
+    if main_proc[CALC_RES_TIME] and (main_proc[RES_MAX_LAG] < 1 or main_proc[RES_CUTOFF] <= 0.0):
+        raise InvalidDataError("Found '{}' = {} and '{}' = {}; positive values are required."
+                               "".format(RES_MAX_LAG, main_proc[RES_MAX_LAG], RES_CUTOFF, main_proc[RES_CUTOFF]))
+    if len(main_proc[DENSITY_ATOM_TYPES]) > 0:
+        if main_proc[PROT_C_ID] < 1:
+            raise InvalidDataError("To calculate spatial density grids, specify the carboxylic carbon atom, at the "
+                                   "center of the grid, with '{}'.".format(PROT_C_ID))
+        if main_proc[DENSITY_SPACING] <= 0.0 or main_proc[DENSITY_HALF_WIDTH] < main_proc[DENSITY_SPACING] / 2:
+            raise InvalidDataError("Found '{}' = {} and '{}' = {}; a positive spacing no more than twice the half "
+                                   "width is required.".format(DENSITY_SPACING, main_proc[DENSITY_SPACING],
+                                                               DENSITY_HALF_WIDTH, main_proc[DENSITY_HALF_WIDTH]))
+    main_proc[MSD_OUTPUT] = (len(main_proc[MSD_ATOM_NUMS]) > 0 or main_proc[MSD_ATOM_TYPE] > 0 or
+                             main_proc[CALC_CEC_MSD])
+    if main_proc[MSD_OUTPUT]:
+        if main_proc[MSD_MAX_LAG] < 1:
+            raise InvalidDataError("Found '{}' = {}; a positive integer is required."
+                                   "".format(MSD_MAX_LAG, main_proc[MSD_MAX_LAG]))
+        fit_lags = main_proc[MSD_FIT_LAGS]
+        if len(fit_lags) > 0 and (len(fit_lags) != 2 or not 0 <= fit_lags[0] < fit_lags[1] <= main_proc[MSD_MAX_LAG]):
+            raise InvalidDataError("Found '{}' = {}. To fit diffusion coefficients, specify the first and last lag "
+                                   "(in frames, no more than '{}') of the fit, separated by a comma."
+                                   "".format(MSD_FIT_LAGS, fit_lags, MSD_MAX_LAG))
     return main_proc
 
 
@@ -491,6 +846,10 @@ def parse_cmdline(argv):
                                                       "being read, when a file is being written). The default is false "
                                                       "(progress shown).",
                         action='store_true')
+    parser.add_argument("-w", "--workers", help="The number of processes to use to read dump files in parallel. "
+                                                "Overrides the configuration file value for '{}' "
+                                                "(default 1).".format(NUM_WORKERS),
+                        type=int, default=None)
     args = None
     try:
         args = parser.parse_args(argv)
@@ -498,6 +857,8 @@ def parse_cmdline(argv):
             args.config[PRINT_PROGRESS] = False
         else:
             args.config[PRINT_PROGRESS] = True
+        if args.workers is not None:
+            args.config[NUM_WORKERS] = args.workers
 
     except IOError as e:
         warning("Problems reading file:", e)
@@ -510,6 +871,10 @@ def parse_cmdline(argv):
         parser.print_help()
         return args, INPUT_ERROR
 
+    if args.config[NUM_WORKERS] < 1:
+        warning("The number of workers ('{}') must be at least 1. Check input.".format(NUM_WORKERS))
+        return args, INVALID_DATA
+
     if len(args.config[PROT_O_IDS]) != 2:
         warning('Expected to find exactly two atom indices listed for the key {}. Check '
                 'configuration file.'.format(PROT_O_IDS))
@@ -519,6 +884,8 @@ def parse_cmdline(argv):
     for flag in PER_FRAME_OUTPUT_FLAGS:
         if args.config[flag]:
             args.config[PER_FRAME_OUTPUT] = True
+    if len(args.config[INTERNAL_COORDS]) > 0 or len(args.config[CALC_COORD_NUM]) > 0:
+        args.config[PER_FRAME_OUTPUT] = True
     for flag in GOFR_OUTPUT_FLAGS:
         if args.config[flag]:
             args.config[GOFR_OUTPUT] = True
@@ -536,72 +903,167 @@ def parse_cmdline(argv):
                     'configuration file. Check input data.'.format(GOFR_MAX))
             return args, INVALID_DATA
 
-    if not args.config[GOFR_OUTPUT] and not args.config[PER_FRAME_OUTPUT]:
+    if args.config[GOFR_CHECKPOINT] is None:
+        if args.config[GOFR_RESUME]:
+            warning("To resume from a g(r) checkpoint, specify the checkpoint file with the configuration key "
+                    "'{}'.".format(GOFR_CHECKPOINT))
+            return args, INVALID_DATA
+    elif not args.config[GOFR_OUTPUT]:
+        warning("A g(r) checkpoint file was specified ('{}'), but no g(r) calculations were requested. Set at least "
+                "one of the following option flags to be True: \n  {}".format(GOFR_CHECKPOINT,
+                                                                              '  \n'.join(GOFR_OUTPUT_FLAGS)))
+        return args, INVALID_DATA
+
+    if args.config[GOFR_RESUME] and (args.config[MSD_OUTPUT] or args.config[CALC_RES_TIME] or
+                                     len(args.config[DENSITY_ATOM_TYPES]) > 0):
+        warning("When resuming from a g(r) checkpoint, MSDs, residence times, and density grids are calculated only "
+                "from the frames read in this run.")
+
+    if not (args.config[GOFR_OUTPUT] or args.config[PER_FRAME_OUTPUT] or args.config[MSD_OUTPUT] or
+            args.config[CALC_RES_TIME] or len(args.config[DENSITY_ATOM_TYPES]) > 0):
         warning('No calculations have been requested. Program exiting without action.\n '
                 'Set at least one of the following option flags to be True: \n  '
-                '{}'.format('  \n'.join(PER_FRAME_OUTPUT_FLAGS)))
+                '{}\n or list internal coordinates or coordination numbers in the sections: {}\n '
+                'or atoms for MSDs with: {}\n or set {} to True\n or list atom types with {}'
+                ''.format('  \n'.join(PER_FRAME_OUTPUT_FLAGS),
+                          [section for section, num_atoms in INTERNAL_COORD_SECS] + [COORD_NUM_SEC],
+                          [MSD_ATOM_NUMS, MSD_ATOM_TYPE, CALC_CEC_MSD], CALC_RES_TIME, DENSITY_ATOM_TYPES))
         parser.print_help()
         return args, INPUT_ERROR
 
     return args, GOOD_RET
 
 
-def calc_pair_dists(atom_a_list, atom_b_list, box):
-    dist = np.zeros(len(atom_a_list) * len(atom_b_list))
-    dist_index = 0
-    for atom_a in atom_a_list:
-        for atom_b in atom_b_list:
-            dist[dist_index] = pbc_dist(np.asarray(atom_a[XYZ_COORDS]), np.asarray(atom_b[XYZ_COORDS]), box)
-            dist_index += 1
-    return dist
+def atom_coords(atom_list):
+    """
+    @param atom_list: list of atom dicts
+    @return: N x 3 numpy array of the xyz coordinates of the atoms
+    """
+    return np.array([atom[XYZ_COORDS] for atom in atom_list], dtype=float).reshape(-1, 3)
+
+
+def atoms_mask(num_atoms, index_arrays):
+    """
+    @param num_atoms: the number of atoms in the frame
+    @param index_arrays: list of arrays of atom indices
+    @return: boolean array marking the atoms in any of the arrays
+    """
+    mask = np.zeros(num_atoms, dtype=bool)
+    for indices in index_arrays:
+        mask[indices] = True
+    return mask
 
 
-def find_closest_excess_proton(carboxyl_oxys, prot_h, hydronium, box, cfg, carboxyl_carbon, cec_xyz):
+def group_gofr_pairs(gofr_pairs, num_atoms):
+    """
+    Groups RDFs so that each group can share one neighbor search without finding pairs no RDF in it needs: RDFs with
+    the same first set of atoms are grouped, and then groups needing the same second set of atoms are merged
+    @param gofr_pairs: list of tuples of the bin count key, the steps counted key, and the arrays of the indices of
+        the two sets of atoms, for each RDF
+    @param num_atoms: the number of atoms in the frame
+    @return: list of tuples of the (sorted) first set atoms, the second set atoms, and the indices in gofr_pairs of
+        the RDFs in each group
+    """
+    a_groups = {}
+    for gofr_index, (bin_count, step_count, a_indices, b_indices) in enumerate(gofr_pairs):
+        a_groups.setdefault(a_indices.tobytes(), []).append(gofr_index)
+    b_groups = {}
+    for gofr_indices in a_groups.values():
+        b_atoms = np.flatnonzero(atoms_mask(num_atoms, [gofr_pairs[gofr_index][3] for gofr_index in gofr_indices]))
+        b_groups.setdefault(b_atoms.tobytes(), (b_atoms, []))[1].extend(gofr_indices)
+    groups = []
+    for b_atoms, gofr_indices in b_groups.values():
+        a_atoms = np.flatnonzero(atoms_mask(num_atoms, [gofr_pairs[gofr_index][2] for gofr_index in gofr_indices]))
+        groups.append((a_atoms, b_atoms, gofr_indices))
+    return groups
+
+
+def gofr_bin_ids(dists, gofr_bins):
+    """
+    Finds the histogram bin of each distance, as np.histogram would: each bin includes its lower edge, and the last
+    bin also its upper edge
+    @param dists: array of distances, all within the range of the bins
+    @param gofr_bins: the (evenly spaced) histogram bin edges
+    @return: array of the bin index of each distance
+    """
+    num_bins = len(gofr_bins) - 1
+    bin_ids = np.minimum(((dists - gofr_bins[0]) * (num_bins / (gofr_bins[-1] - gofr_bins[0]))).astype(int),
+                         num_bins - 1)
+    # correct any distance placed in a neighboring bin by rounding
+    bin_ids[dists < gofr_bins[bin_ids]] -= 1
+    bin_ids[(dists >= gofr_bins[bin_ids + 1]) & (bin_ids < num_bins - 1)] += 1
+    return bin_ids
+
+
+def add_frame_gofrs(xyz_coords, box, gofr_data, gofr_pairs):
+    """
+    Adds one frame's histograms to the requested RDFs. RDFs sharing atoms share a cell list search (see
+    group_gofr_pairs); each pair of atoms found is then binned for every RDF that includes it, and all the RDFs are
+    counted with one bincount over their stacked bin indices.
+    @param xyz_coords: array of the xyz coords of all atoms in the frame
+    @param box: the dimensions of the periodic box (assumed 90 degree angles)
+    @param gofr_data: dict of histogram data, updated in place
+    @param gofr_pairs: list of tuples of the bin count key, the steps counted key, and the arrays of the indices of
+        the two sets of atoms, for each RDF to add this frame to
+    """
+    if len(gofr_pairs) == 0:
+        return
+    gofr_bins = gofr_data[GOFR_BINS]
+    num_bins = len(gofr_bins) - 1
+    num_atoms = len(xyz_coords)
+    stacked_ids = []
+    for a_atoms, b_atoms, gofr_indices in group_gofr_pairs(gofr_pairs, num_atoms):
+        if len(gofr_indices) == 1:
+            # every pair found belongs to the one RDF
+            dists = pbc_neighbor_dists(xyz_coords[a_atoms], xyz_coords[b_atoms], box, gofr_bins[-1])
+            stacked_ids.append(gofr_indices[0] * num_bins + gofr_bin_ids(dists, gofr_bins))
+            continue
+        pair_a, pair_b, dists = pbc_neighbor_pairs(xyz_coords[a_atoms], xyz_coords[b_atoms], box, gofr_bins[-1])
+        bin_ids = gofr_bin_ids(dists, gofr_bins)
+        pair_a = a_atoms[pair_a]
+        pair_b = b_atoms[pair_b]
+        for gofr_index in gofr_indices:
+            bin_count, step_count, a_indices, b_indices = gofr_pairs[gofr_index]
+            in_gofr = atoms_mask(num_atoms, [a_indices])[pair_a] & atoms_mask(num_atoms, [b_indices])[pair_b]
+            stacked_ids.append(gofr_index * num_bins + bin_ids[in_gofr])
+    step_his = np.bincount(np.concatenate(stacked_ids),
+                           minlength=len(gofr_pairs) * num_bins).reshape(len(gofr_pairs), num_bins)
+    for (bin_count, step_count, a_indices, b_indices), gofr_his in zip(gofr_pairs, step_his):
+        num_dens = (len(a_indices) * len(b_indices)) / np.prod(box)
+        gofr_data[bin_count] = np.add(gofr_data[bin_count], np.divide(gofr_his, num_dens))
+        gofr_data[step_count] += 1
+
+
+def find_closest_excess_proton(carboxyl_oxys, prot_h, hydronium, box, h3o_h_type):
+    """
+    Finds the excess proton (the residue proton, or else the hydronium hydrogen closest to a carboxyl oxygen) and the
+    carboxyl oxygen closest to it
+    @param carboxyl_oxys: list of the two carboxyl oxygen atom dicts
+    @param prot_h: the proton on the residue, or None
+    @param hydronium: the list of atoms in the hydronium, if there is a hydronium
+    @param box: the dimensions of the periodic box (assumed 90 degree angles)
+    @param h3o_h_type: (int) lammps type for h3o hydrogen atom
+    @return: the excess proton, the carboxyl oxygen closest to it (o_star), the other carboxyl oxygen, and the
+        o_star to excess proton distance
+    """
     # initialize minimum distance to maximum distance possible in the periodic box (assume 90 degree corners)
     oxy_h_min_dists = np.full(len(carboxyl_oxys), np.linalg.norm(np.divide(box, 2)))
     # excess proton will become None if prot_h is none, then calculated
     excess_proton = prot_h
-    for index, oxy in enumerate(carboxyl_oxys):
-        if prot_h is None:
-            for atom in hydronium:
-                if atom[ATOM_TYPE] == cfg[H3O_H_TYPE]:
-                    dist = pbc_dist(np.asarray(atom[XYZ_COORDS]), np.asarray(oxy[XYZ_COORDS]), box)
-                    if dist < oxy_h_min_dists[index]:
-                        oxy_h_min_dists[index] = dist
-                        excess_proton = atom
-        else:
-            oxy_h_min_dists[index] = pbc_dist(np.asarray(prot_h[XYZ_COORDS]), np.asarray(oxy[XYZ_COORDS]), box)
+    if prot_h is None:
+        hyd_hs = [atom for atom in hydronium if atom[ATOM_TYPE] == h3o_h_type]
+        if len(hyd_hs) > 0:
+            oxy_h_dists = pbc_pair_dists(atom_coords(carboxyl_oxys), atom_coords(hyd_hs), box)
+            for index, index_h in enumerate(np.argmin(oxy_h_dists, axis=1)):
+                if oxy_h_dists[index, index_h] < oxy_h_min_dists[index]:
+                    oxy_h_min_dists[index] = oxy_h_dists[index, index_h]
+                    excess_proton = hyd_hs[index_h]
+    else:
+        oxy_h_min_dists = pbc_dists(atom_coords(carboxyl_oxys), np.asarray(prot_h[XYZ_COORDS]), box)
     index_min = np.argmin(oxy_h_min_dists)
-    o_star = carboxyl_oxys[index_min]
-    min_oh_dist = oxy_h_min_dists[index_min]
-    oh_prop_dict = {OH_MIN: min_oh_dist}
-    if cfg[CALC_OCOH_PROPS] or cfg[CALC_CEC_DIST]:
-        # the following depends on there being exactly 2 carboxylic oxygen atoms
-        index_max = abs(index_min - 1)
-
-        o_star_xyz = np.asarray(o_star[XYZ_COORDS])
-        excess_proton_xyz = np.asarray(excess_proton[XYZ_COORDS])
-        alt_o_xyz = np.asarray(carboxyl_oxys[index_max][XYZ_COORDS])
-        # distance calculated again to ensure that the 2nd return distance uses the same excess proton
-        alt_oh_dist = pbc_dist(excess_proton_xyz, alt_o_xyz, box)
-        oh_prop_dict.update({OH_MAX: alt_oh_dist,
-                             OH_DIFF: alt_oh_dist - min_oh_dist,
-                             })
-        if carboxyl_carbon is not None:
-            carboxyl_c_xyz = np.asarray(carboxyl_carbon[XYZ_COORDS])
-            oh_prop_dict.update(calc_more_ocoh_props(box, carboxyl_c_xyz, o_star_xyz, alt_o_xyz, excess_proton_xyz))
-        if cfg[CALC_CEC_DIST] and cec_xyz is not None:
-            cec_o_dists = np.array([pbc_dist(cec_xyz, o_star_xyz, box), pbc_dist(cec_xyz, alt_o_xyz, box)])
-            oh_prop_dict[CEC_O_MIN] = cec_o_dists.min()
-            oh_prop_dict[CEC_O_MAX] = cec_o_dists.max()
-            oh_prop_dict[CEC_O_DIFF] = oh_prop_dict[CEC_O_MAX] - oh_prop_dict[CEC_O_MIN]
-            oh_prop_dict[CEC_H_DIST] = pbc_dist(cec_xyz, excess_proton_xyz, box)
-            oh_prop_dict[CEC_O_MIN_DIST] = calc_min_dist(np.array([oh_prop_dict[CEC_O_MIN], oh_prop_dict[CEC_O_MAX]]),
-                                                         cfg[MIN_DIST_BETA])
-            if carboxyl_carbon is not None:
-                oh_prop_dict[CEC_COM_DIST] = pbc_dist(cec_xyz, oh_prop_dict[COM_XYZ], box)
-
-    return excess_proton, o_star, oh_prop_dict
+    # the following depends on there being exactly 2 carboxylic oxygen atoms
+    index_max = abs(index_min - 1)
+    return excess_proton, carboxyl_oxys[index_min], carboxyl_oxys[index_max], oxy_h_min_dists[index_min]
 
 
 def calc_more_ocoh_props(box, carboxyl_c_xyz, o_star_xyz, alt_o_xyz, excess_h_xyz):
@@ -635,14 +1097,33 @@ def calc_more_ocoh_props(box, carboxyl_c_xyz, o_star_xyz, alt_o_xyz, excess_h_xy
     return oh_prop_dict
 
 
-def find_closest_o_to_ostar(water_oxys, o_star, hydronium, box, h3o_oxy_atom_type):
+def find_closest_atom(atom_xyz_coords, xyz, box):
+    """
+    Finds the atom closest to a point, searching all the atoms at once
+    @param atom_xyz_coords: N x 3 array of the xyz coordinates of the atoms to search
+    @param xyz: the coordinates of the point
+    @param box: the dimensions of the periodic box (assumed 90 degree angles)
+    @return: the index of the closest atom (None if there are no atoms to search) and the distance to it
+    """
+    if len(atom_xyz_coords) == 0:
+        return None, np.inf
+    dists = pbc_dists(atom_xyz_coords, xyz, box)
+    index_min = np.argmin(dists)
+    return index_min, dists[index_min]
+
+
+def find_closest_o_to_ostar(dump_atom_data, water_oxy_indices, o_star, hydronium, box, h3o_oxy_atom_type,
+                            water_oxy_coords=None):
     """
     Calculate the minimum distance between a water oxygen and the protonatable oxygen atom closest to the excess proton
-    @param water_oxys: list of atom dicts
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param water_oxy_indices: array of the indices of the water oxygen atoms in dump_atom_data
     @param o_star: the protonatable oxygen atom closest to the excess proton
     @param hydronium: the list of atoms in the hydronium, if there is a hydronium
     @param box: the dimensions of the periodic box (assumed 90 degree angles)
     @param h3o_oxy_atom_type: (int) lammps type for h30 oxygen atom
+    @param water_oxy_coords: optional N x 3 array of the water oxygen coordinates, in the order of
+        water_oxy_indices, so that it can be shared by all the searches for a timestep
     @return: the water oxygen (or hydronium oxygen) closest to the o_star, and the distance between them
     """
     # initialize smallest distance to the maximum distance in a periodic box
@@ -650,12 +1131,12 @@ def find_closest_o_to_ostar(water_oxys, o_star, hydronium, box, h3o_oxy_atom_typ
     closest_o = None
     o_star_coord = np.asarray(o_star[XYZ_COORDS])
     if not hydronium:
-        # initialize minimum distance to maximum distance allowed in the PBC
-        for wat_o in water_oxys:
-            dist = pbc_dist(np.asarray(wat_o[XYZ_COORDS]), o_star_coord, box)
-            if dist < min_dist:
-                min_dist = dist
-                closest_o = wat_o
+        if water_oxy_coords is None:
+            water_oxy_coords = dump_atom_data[XYZ_COORDS][water_oxy_indices]
+        index_min, dist = find_closest_atom(water_oxy_coords, o_star_coord, box)
+        if dist < min_dist:
+            min_dist = dist
+            closest_o = frame_atoms(dump_atom_data, water_oxy_indices[[index_min]])[0]
     else:
         for atom in hydronium:
             if atom[ATOM_TYPE] == h3o_oxy_atom_type:
@@ -665,13 +1146,16 @@ def find_closest_o_to_ostar(water_oxys, o_star, hydronium, box, h3o_oxy_atom_typ
     return closest_o, min_dist
 
 
-def find_closest_wat_o_to_hyd_o(water_oxys, hydronium, box, h3o_oxy_atom_type):
+def find_closest_wat_o_to_hyd_o(dump_atom_data, water_oxy_indices, hydronium, box, h3o_oxy_atom_type,
+                                water_oxy_coords=None):
     """
     Calculate the minimum distance between a water oxygen a hydronium oxygen
-    @param water_oxys: list of atom dicts
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param water_oxy_indices: array of the indices of the water oxygen atoms in dump_atom_data
     @param hydronium: the list of atoms in the hydronium, if there is a hydronium
     @param box: the dimensions of the periodic box (assumed 90 degree angles)
     @param h3o_oxy_atom_type: (int) lammps type for h30 oxygen atom
+    @param water_oxy_coords: optional N x 3 array of the water oxygen coordinates, in the order of water_oxy_indices
     @return: the water oxygen closest to the hydronium oxygen and the distance between them; the hydronium oxygen;
        the hydronium hydrogen closes to the water oxygen and the distance between it and the hydronium oxygen
     """
@@ -688,11 +1172,12 @@ def find_closest_wat_o_to_hyd_o(water_oxys, hydronium, box, h3o_oxy_atom_type):
         else:
             hyd_h.append(atom)
     hyd_o_coords = np.asarray(hyd_o[XYZ_COORDS])
-    for wat_o in water_oxys:
-        dist = pbc_dist(np.asarray(wat_o[XYZ_COORDS]), hyd_o_coords, box)
-        if dist < min_oo_dist:
-            min_oo_dist = dist
-            close_wat_o_to_hyd = wat_o
+    if water_oxy_coords is None:
+        water_oxy_coords = dump_atom_data[XYZ_COORDS][water_oxy_indices]
+    index_min, dist = find_closest_atom(water_oxy_coords, hyd_o_coords, box)
+    if dist < min_oo_dist:
+        min_oo_dist = dist
+        close_wat_o_to_hyd = frame_atoms(dump_atom_data, water_oxy_indices[[index_min]])[0]
     close_wat_o_coords = np.asarray(close_wat_o_to_hyd[XYZ_COORDS])
     for h_atom in hyd_h:
         # noinspection PyTypeChecker
@@ -708,40 +1193,489 @@ def find_closest_wat_o_to_hyd_o(water_oxys, hydronium, box, h3o_oxy_atom_type):
     return hyd_wat_dict, hyd_o, close_hyd_h_to_wat, close_wat_o_to_hyd
 
 
-def process_atom_data(cfg, dump_atom_data, box, timestep, gofr_data, result_dict):
-    carboxyl_oxys = []
-    carboxyl_carb = None
-    water_oxys = []
-    # dictionary so can index by mol_num
-    water_hs = []
-    excess_proton = None
-    hydronium = []
-    type1 = []
-    type2 = []
+def frame_atoms(dump_frame, atom_mask):
+    """
+    Creates the per-atom dicts used in the calculations below, only for the atoms selected from a dump frame
+    @param dump_frame: dict of numpy arrays for one timestep, as returned by read_dump_frames
+    @param atom_mask: boolean array, or array of indices, selecting the atoms of interest
+    @return: list of atom dicts, in the order the atoms appear in the dump file
+    """
+    return [{ATOM_NUM: atom_num, MOL_NUM: mol_num, ATOM_TYPE: atom_type, CHARGE: charge, XYZ_COORDS: xyz}
+            for atom_num, mol_num, atom_type, charge, xyz in zip(dump_frame[ATOM_NUM][atom_mask].tolist(),
+                                                                 dump_frame[MOL_NUM][atom_mask].tolist(),
+                                                                 dump_frame[ATOM_TYPE][atom_mask].tolist(),
+                                                                 dump_frame[CHARGE][atom_mask].tolist(),
+                                                                 dump_frame[XYZ_COORDS][atom_mask].tolist())]
+
+
+def classify_atoms(cfg, atom_nums, mol_nums, atom_types):
+    """
+    Finds which of the ATOM_GROUPS each atom belongs to
+    @param cfg: configuration for the run
+    @param atom_nums: array of atom ids
+    @param mol_nums: array of molecule ids
+    @param atom_types: array of atom types
+    @return: array with the index in ATOM_GROUPS for each atom, or NO_GROUP
+    """
+    in_prot_res = mol_nums == cfg[PROT_RES_MOL_ID]
+    other_mol = ~in_prot_res
+    is_carboxyl_o = in_prot_res & np.isin(atom_nums, cfg[PROT_O_IDS])
+    is_carboxyl_c = in_prot_res & (atom_nums == cfg[PROT_C_ID])
+    is_prot_h = in_prot_res & (atom_types == cfg[PROT_H_TYPE]) & ~np.isin(atom_nums, cfg[PROT_H_IGNORE])
+    is_water_o = other_mol & (atom_types == cfg[WAT_O_TYPE])
+    is_water_h = other_mol & (atom_types == cfg[WAT_H_TYPE])
+    is_hydronium = other_mol & ((atom_types == cfg[H3O_O_TYPE]) | (atom_types == cfg[H3O_H_TYPE]))
+    atom_groups = np.full(len(atom_nums), NO_GROUP, dtype=np.int8)
+    # assign in reverse priority order, so that an atom matching more than one group keeps the first group
+    for group_index, group_mask in reversed(list(enumerate([is_carboxyl_o, is_carboxyl_c, is_prot_h, is_water_o,
+                                                            is_water_h, is_hydronium]))):
+        atom_groups[group_mask] = group_index
+    return atom_groups
+
+
+def find_atom_selections(cfg, dump_atom_data, atom_selections=None):
+    """
+    Finds the indices of the atoms in each of the ATOM_GROUPS (and the g(r) atom types, if requested). The
+    selections from the previous timestep of a file are reused: if the atom and molecule ids are in the same order,
+    only the atoms whose type changed (e.g. as the excess proton hops between waters) are classified again.
+    @param cfg: configuration for the run
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param atom_selections: dict of the selections from the previous timestep (empty to start), updated in place
+    @return: dict of arrays of atom indices, keyed by group name
+    """
+    if atom_selections is None:
+        atom_selections = {}
+    atom_nums = dump_atom_data[ATOM_NUM]
+    mol_nums = dump_atom_data[MOL_NUM]
+    atom_types = dump_atom_data[ATOM_TYPE]
+    if (len(atom_selections) > 0 and np.array_equal(atom_nums, atom_selections[ATOM_NUM]) and
+            np.array_equal(mol_nums, atom_selections[MOL_NUM])):
+        changed_atoms = np.flatnonzero(atom_types != atom_selections[ATOM_TYPE])
+        if len(changed_atoms) == 0:
+            return atom_selections
+        atom_groups = atom_selections[SEL_CATEGORIES].copy()
+        atom_groups[changed_atoms] = classify_atoms(cfg, atom_nums[changed_atoms], mol_nums[changed_atoms],
+                                                    atom_types[changed_atoms])
+    else:
+        atom_groups = classify_atoms(cfg, atom_nums, mol_nums, atom_types)
+        # indices found from the previous atom order no longer apply
+        atom_selections.pop(SEL_COORD_ATOMS, None)
+        atom_selections.pop(SEL_MSD_ATOMS, None)
+    atom_selections.update({ATOM_NUM: atom_nums, MOL_NUM: mol_nums, ATOM_TYPE: atom_types,
+                            SEL_CATEGORIES: atom_groups})
+    for group_index, group_name in enumerate(ATOM_GROUPS):
+        atom_selections[group_name] = np.flatnonzero(atom_groups == group_index)
+    if cfg[CALC_TYPE_GOFR]:
+        atom_selections[SEL_GOFR_TYPE1] = np.flatnonzero(atom_types == cfg[GOFR_TYPE1])
+        atom_selections[SEL_GOFR_TYPE2] = np.flatnonzero(atom_types == cfg[GOFR_TYPE2])
+    return atom_selections
+
+
+def find_atom_indices(atom_nums, atom_ids):
+    """
+    Finds where atoms are in the arrays of a dump frame
+    @param atom_nums: array of the atom ids of a frame
+    @param atom_ids: array of atom ids to find (any shape)
+    @return: array of the indices of the atom ids, with the shape of atom_ids
+    """
+    order = np.argsort(atom_nums, kind='mergesort')
+    positions = np.minimum(np.searchsorted(atom_nums, atom_ids, sorter=order), len(atom_nums) - 1)
+    indices = order[positions]
+    missing = atom_nums[indices] != atom_ids
+    if np.any(missing):
+        raise InvalidDataError("Did not find atom ids {} listed in the configuration file."
+                               "".format(np.unique(atom_ids[missing]).tolist()))
+    return indices
+
+
+def calc_internal_coords(cfg, dump_atom_data, box, atom_selections):
+    """
+    Calculates the distances, angles, and dihedrals listed in the configuration file, each kind for all of its
+    listed atom tuples at once
+    @param cfg: configuration for the run
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param box: box lengths
+    @param atom_selections: dict of atom selections (see find_atom_selections); the indices of the listed atoms
+        are kept here until the order of atoms changes
+    @return: dict of the values, keyed by output column name
+    """
+    if SEL_COORD_ATOMS not in atom_selections:
+        atom_selections[SEL_COORD_ATOMS] = dict((section, find_atom_indices(dump_atom_data[ATOM_NUM], atom_ids))
+                                                for section, (names, atom_ids) in cfg[INTERNAL_COORDS].items())
+    coord_results = {}
+    for section, (names, atom_ids) in cfg[INTERNAL_COORDS].items():
+        # array of xyz coords with shape (number of coordinates, atoms per coordinate, 3)
+        xyz = dump_atom_data[XYZ_COORDS][atom_selections[SEL_COORD_ATOMS][section]]
+        if section == DIST_SEC:
+            coord_vals = pbc_dists(xyz[:, 0], xyz[:, 1], box)
+        elif section == ANGLE_SEC:
+            coord_vals = vec_angles(pbc_calc_vectors(xyz[:, 0], xyz[:, 1], box),
+                                    pbc_calc_vectors(xyz[:, 2], xyz[:, 1], box))
+        else:
+            coord_vals = vec_dihedrals(pbc_calc_vectors(xyz[:, 0], xyz[:, 1], box),
+                                       pbc_calc_vectors(xyz[:, 2], xyz[:, 1], box),
+                                       pbc_calc_vectors(xyz[:, 3], xyz[:, 2], box))
+        coord_results.update(zip(names, coord_vals.tolist()))
+    return coord_results
+
+
+def calc_coord_nums(xyz_coords, a_indices, b_indices, box, switch_dist, cutoff):
+    """
+    Calculates the smooth coordination number of each of one set of atoms by another, with the sum of switch_func
+    over the neighbor distances found with a cell list search. An atom in both sets is not counted as its own
+    neighbor.
+    @param xyz_coords: array of the xyz coords of all atoms in the frame
+    @param a_indices: array of the indices of the atoms whose coordination numbers are wanted
+    @param b_indices: array of the indices of the neighboring atoms to count
+    @param box: box lengths
+    @param switch_dist: distance within which neighbors count fully
+    @param cutoff: distance beyond which neighbors are not counted
+    @return: array of the coordination number of each atom in a_indices
+    """
+    pair_a, pair_b, dists = pbc_neighbor_pairs(xyz_coords[a_indices], xyz_coords[b_indices], box, cutoff)
+    not_self = a_indices[pair_a] != b_indices[pair_b]
+    return np.bincount(pair_a[not_self], weights=switch_func(cutoff, switch_dist, dists[not_self]),
+                       minlength=len(a_indices))
+
+
+def msd_columns(cfg):
+    """
+    @param cfg: configuration for the run
+    @return: list of the requested MSD output columns, in the order of the positions found by msd_positions
+    """
+    msd_cols = []
+    if len(cfg[MSD_ATOM_NUMS]) > 0:
+        msd_cols.append(MSD_ATOMS)
+    if cfg[MSD_ATOM_TYPE] > 0:
+        msd_cols.append(MSD_TYPE)
+    if cfg[CALC_CEC_MSD]:
+        msd_cols.append(MSD_CEC)
+    return msd_cols
+
+
+def msd_positions(cfg, dump_atom_data, cec_xyz, timestep, atom_selections):
+    """
+    Finds the (wrapped) positions in one frame of the atoms, or CEC, for each requested MSD. The atoms are kept in the
+    order of their ids, so that each can be followed from frame to frame.
+    @param cfg: configuration for the run
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param cec_xyz: the CEC position read from the evb summary file, if any
+    @param timestep: timestep being processed (for error messages)
+    @param atom_selections: dict of the atom selections for the timestep (see find_atom_selections), updated in place
+    @return: list of arrays of xyz coords, one for each column of msd_columns
+    """
+    xyz_coords = dump_atom_data[XYZ_COORDS]
+    positions = []
+    if len(cfg[MSD_ATOM_NUMS]) > 0:
+        if SEL_MSD_ATOMS not in atom_selections:
+            atom_selections[SEL_MSD_ATOMS] = find_atom_indices(dump_atom_data[ATOM_NUM],
+                                                               np.asarray(cfg[MSD_ATOM_NUMS]))
+        positions.append(xyz_coords[atom_selections[SEL_MSD_ATOMS]])
+    if cfg[MSD_ATOM_TYPE] > 0:
+        type_indices = np.flatnonzero(dump_atom_data[ATOM_TYPE] == cfg[MSD_ATOM_TYPE])
+        type_order = np.argsort(dump_atom_data[ATOM_NUM][type_indices], kind='mergesort')
+        positions.append(xyz_coords[type_indices[type_order]])
+    if cfg[CALC_CEC_MSD]:
+        if cec_xyz is None:
+            raise InvalidDataError("Did not find the CEC position for timestep {}, which is needed for '{}'."
+                                   "".format(timestep, CALC_CEC_MSD))
+        positions.append(np.reshape(cec_xyz, (1, 3)))
+    return positions
+
+
+def res_occupancy(cfg, dump_atom_data, carboxyl_o_indices, box):
+    """
+    Finds which water molecules are within the cutoff distance of each carboxylic oxygen atom. Each water is found by
+    its oxygen atom, which may be a water or hydronium oxygen atom, so that a water is followed as it gains or loses
+    the excess proton.
+    @param cfg: configuration for the run
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param carboxyl_o_indices: array of the indices of the carboxylic oxygen atoms
+    @param box: box lengths
+    @return: the number of waters, and an array of occupancies packed as bits (carboxylic oxygen atoms x bytes),
+        with both the carboxylic oxygen atoms and the waters in atom id order
+    """
+    atom_nums = dump_atom_data[ATOM_NUM]
+    atom_types = dump_atom_data[ATOM_TYPE]
+    water_oxys = np.flatnonzero((atom_types == cfg[WAT_O_TYPE]) | (atom_types == cfg[H3O_O_TYPE]))
+    water_oxys = water_oxys[np.argsort(atom_nums[water_oxys], kind='mergesort')]
+    carboxyl_oxys = carboxyl_o_indices[np.argsort(atom_nums[carboxyl_o_indices], kind='mergesort')]
+    xyz_coords = dump_atom_data[XYZ_COORDS]
+    dists = pbc_pair_dists(xyz_coords[carboxyl_oxys], xyz_coords[water_oxys], box)
+    return len(water_oxys), np.packbits(dists < cfg[RES_CUTOFF], axis=-1)
+
+
+def density_grid_size(cfg):
+    """
+    @param cfg: configuration for the run
+    @return: the number of voxels along each side of the density grid, and the position of the grid's lower
+        edge relative to the carboxylic carbon atom
+    """
+    num_voxels = max(int(round(2 * cfg[DENSITY_HALF_WIDTH] / cfg[DENSITY_SPACING])), 1)
+    return num_voxels, -num_voxels * cfg[DENSITY_SPACING] / 2
+
+
+def density_voxels(cfg, dump_atom_data, carboxyl_c_indices, box, timestep):
+    """
+    Finds the density grid voxel of each atom of the listed types within the grid, from its minimum image vector
+    from the carboxylic carbon atom. The grid axes are those of the simulation box.
+    @param cfg: configuration for the run
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param carboxyl_c_indices: array of the indices of the carboxylic carbon atom (the last one is used)
+    @param box: box lengths
+    @param timestep: timestep being processed (for error messages)
+    @return: array of the flattened voxel indices (C order) of the atoms found in the grid
+    """
+    if len(carboxyl_c_indices) == 0:
+        raise InvalidDataError("Did not find the carboxylic carbon atom ('{}' = {}) at timestep {}, which is "
+                               "required for the density grid.".format(PROT_C_ID, cfg[PROT_C_ID], timestep))
+    xyz_coords = dump_atom_data[XYZ_COORDS]
+    atom_indices = np.flatnonzero(np.isin(dump_atom_data[ATOM_TYPE], cfg[DENSITY_ATOM_TYPES]))
+    num_voxels, grid_min = density_grid_size(cfg)
+    vectors = pbc_calc_vectors(xyz_coords[atom_indices], xyz_coords[carboxyl_c_indices[-1]], box)
+    voxel_ids = np.floor((vectors - grid_min) / cfg[DENSITY_SPACING]).astype(np.int64)
+    in_grid = np.all((voxel_ids >= 0) & (voxel_ids < num_voxels), axis=1)
+    return np.ravel_multi_index(voxel_ids[in_grid].T, (num_voxels,) * 3)
+
+
+def calc_excess_proton_step(cfg, frame_data, box):
+    excess_proton, o_star, alt_o, min_oh_dist = find_closest_excess_proton(frame_data[SEL_CARBOXYL_O],
+                                                                           frame_data[SEL_PROT_H],
+                                                                           frame_data[SEL_HYDRONIUM], box,
+                                                                           cfg[H3O_H_TYPE])
+    frame_data.update({EXCESS_H: excess_proton, O_STAR: o_star, ALT_O: alt_o})
+    return {OH_MIN: min_oh_dist}
+
+
+def calc_oh_dists_step(cfg, frame_data, box):
+    # distance calculated again to ensure that the 2nd return distance uses the same excess proton
+    alt_oh_dist = pbc_dist(np.asarray(frame_data[EXCESS_H][XYZ_COORDS]), np.asarray(frame_data[ALT_O][XYZ_COORDS]),
+                           box)
+    return {OH_MAX: alt_oh_dist, OH_DIFF: alt_oh_dist - frame_data[OH_MIN]}
+
+
+def calc_carboxyl_geom_step(cfg, frame_data, box):
+    if frame_data[SEL_CARBOXYL_C] is None:
+        return {}
+    return calc_more_ocoh_props(box, np.asarray(frame_data[SEL_CARBOXYL_C][XYZ_COORDS]),
+                                np.asarray(frame_data[O_STAR][XYZ_COORDS]), np.asarray(frame_data[ALT_O][XYZ_COORDS]),
+                                np.asarray(frame_data[EXCESS_H][XYZ_COORDS]))
+
+
+def calc_cec_step(cfg, frame_data, box):
+    cec_xyz = frame_data[CEC_XYZ]
+    if cec_xyz is None:
+        return {}
+    cec_o_dists = np.array([pbc_dist(cec_xyz, np.asarray(frame_data[O_STAR][XYZ_COORDS]), box),
+                            pbc_dist(cec_xyz, np.asarray(frame_data[ALT_O][XYZ_COORDS]), box)])
+    cec_dict = {CEC_O_MIN: cec_o_dists.min(), CEC_O_MAX: cec_o_dists.max(),
+                CEC_H_DIST: pbc_dist(cec_xyz, np.asarray(frame_data[EXCESS_H][XYZ_COORDS]), box)}
+    cec_dict[CEC_O_DIFF] = cec_dict[CEC_O_MAX] - cec_dict[CEC_O_MIN]
+    cec_dict[CEC_O_MIN_DIST] = calc_min_dist(np.array([cec_dict[CEC_O_MIN], cec_dict[CEC_O_MAX]]),
+                                             cfg[MIN_DIST_BETA])
+    if frame_data[SEL_CARBOXYL_C] is not None:
+        cec_dict[CEC_COM_DIST] = pbc_dist(cec_xyz, frame_data[COM_XYZ], box)
+    return cec_dict
+
+
+def calc_hij_amino_step(cfg, frame_data, box):
+    r_oh = frame_data[OH_MIN]
+    return {R_OH: r_oh, HIJ_GLU: hij_amino(r_oh, c1_glu, c2_glu, c3_glu),
+            HIJ_ASP: hij_amino(r_oh, c1_asp, c2_asp, c3_asp)}
+
+
+def calc_closest_o_step(cfg, frame_data, box):
+    closest_o, o_ostar_dist = find_closest_o_to_ostar(frame_data[DUMP_ATOM_DATA], frame_data[SEL_WATER_O],
+                                                      frame_data[O_STAR], frame_data[SEL_HYDRONIUM], box,
+                                                      cfg[H3O_O_TYPE], water_oxy_coords=frame_data[WATER_OXY_COORDS])
+    frame_data.update({CLOSEST_O: closest_o, R_OO: o_ostar_dist})
+    return {}
+
+
+def calc_water_q_step(cfg, frame_data, box):
+    q_dot = calc_q(frame_data[CLOSEST_O][XYZ_COORDS], frame_data[O_STAR][XYZ_COORDS],
+                   frame_data[EXCESS_H][XYZ_COORDS], box)
+    return {R_OO: frame_data[R_OO], Q_DOT: q_dot}
+
+
+def calc_hij_water_step(cfg, frame_data, box):
+    hij_wat, term_a1, term_a2, term_a3 = calc_hij_wat(frame_data[R_OO], frame_data[Q_DOT])
+    return {HIJ_WATER: hij_wat, HIJ_A1: term_a1, HIJ_A2: term_a2, HIJ_A3: term_a3}
+
+
+def calc_da_geom_step(cfg, frame_data, box):
+    da_dist, r_dh, r_da = calc_da_vectors(frame_data[CLOSEST_O][XYZ_COORDS], frame_data[O_STAR][XYZ_COORDS],
+                                          frame_data[EXCESS_H][XYZ_COORDS], box)
+    frame_data.update({DA_DH_VEC: r_dh, DA_DA_VEC: r_da})
+    return {DA_DIST: da_dist}
+
+
+def calc_hij_arq_step(cfg, frame_data, box):
+    q_dot_arq = calc_q_dot_arq(frame_data[DA_DIST], frame_data[DA_DH_VEC], frame_data[DA_DA_VEC],
+                               r0_sc=r0_sc_arq, r0_da_q=r0_da, lambda_q=lambda_arq)
+    return {Q_DOT_ARQ: q_dot_arq, HIJ_ARQ: calc_hij_arq(frame_data[R_OO], q_dot_arq)}
+
+
+def calc_hij_new_step(cfg, frame_data, box):
+    q_dot_arq = calc_q_dot_arq(frame_data[DA_DIST], frame_data[DA_DH_VEC], frame_data[DA_DA_VEC],
+                               r0_sc=cfg[R0SC_NEW], r0_da_q=cfg[R0_DA_NEW], lambda_q=cfg[LAMBDA_NEW])
+    g_of_q = np.exp(-cfg[GAMMA_NEW] * q_dot_arq)
+    f_of_roo1, f_of_roo2 = calc_f_da_new(cfg[ALPHA_NEW], cfg[A_DA_NEW], cfg[EPS_NEW], cfg[C_DA_NEW],
+                                         frame_data[R_OO])
+    f_of_roo = f_of_roo1 * f_of_roo2
+    h_ij_new = cfg[VIJ_NEW] * g_of_q * f_of_roo
+    return {Q_DOT_NEW: q_dot_arq, G_Q_NEW: g_of_q, F_ROO1_NEW: f_of_roo1, F_ROO2_NEW: f_of_roo2,
+            F_ROO_NEW: f_of_roo, FG_NEW: g_of_q * f_of_roo, HIJ_NEW: h_ij_new}
+
+
+def calc_hij_new_sweep_step(cfg, frame_data, box):
+    da_dist = frame_data[DA_DIST]
+    # each parameter set gets a leading axis, in front of any axis over frames
+    params = dict((key, np.reshape(vals, (-1,) + (1,) * np.ndim(da_dist))) for key, vals in cfg[NEW_SWEEP].items())
+    q_dot_arq = calc_q_dot_arq(da_dist, frame_data[DA_DH_VEC], frame_data[DA_DA_VEC], r0_sc=params[R0SC_NEW],
+                               r0_da_q=params[R0_DA_NEW], lambda_q=params[LAMBDA_NEW])
+    f_of_roo1, f_of_roo2 = calc_f_da_new(params[ALPHA_NEW], params[A_DA_NEW], params[EPS_NEW], params[C_DA_NEW],
+                                         frame_data[R_OO])
+    h_ij_new = params[VIJ_NEW] * np.exp(-params[GAMMA_NEW] * q_dot_arq) * f_of_roo1 * f_of_roo2
+    return dict((new_sweep_fieldname(set_index), set_hij) for set_index, set_hij in enumerate(h_ij_new))
+
+
+def calc_hyd_wat_step(cfg, frame_data, box):
+    hydronium = frame_data[SEL_HYDRONIUM]
+    if len(hydronium) == 0:
+        return {R_OO_HYD_WAT: np.nan, R_OH_HYD: np.nan, R_OH_WAT_HYD: np.nan, HIJ_WAT: np.nan}
+    hyd_wat_dict, hyd_o, hyd_h, wat_o = find_closest_wat_o_to_hyd_o(frame_data[DUMP_ATOM_DATA],
+                                                                    frame_data[SEL_WATER_O], hydronium, box,
+                                                                    cfg[H3O_O_TYPE],
+                                                                    water_oxy_coords=frame_data[WATER_OXY_COORDS])
+    # noinspection PyTypeChecker
+    q_dot = calc_q(wat_o[XYZ_COORDS], hyd_o[XYZ_COORDS], hyd_h[XYZ_COORDS], box)
+    hyd_wat_dict[HIJ_WAT] = calc_hij_wat(hyd_wat_dict[R_OO_HYD_WAT], q_dot)[0]
+    return hyd_wat_dict
+
+
+# The per-frame calculation steps: name, function, the steps it uses, and the output fields it provides. A step must
+#     be listed after the steps it uses. Each function takes the cfg, a dict of the atoms and values found so far for
+#     the frame (updated in place with intermediate values), and the box, and returns a dict of results.
+CALC_STEPS = [(STEP_EXCESS_H, calc_excess_proton_step, [], [OH_MIN]),
+              (STEP_OH_DISTS, calc_oh_dists_step, [STEP_EXCESS_H], [OH_MAX, OH_DIFF]),
+              (STEP_CARBOXYL_GEOM, calc_carboxyl_geom_step, [STEP_EXCESS_H], [COM_H_DIST, OCO_ANGLE, OCOH_DIH]),
+              (STEP_CEC, calc_cec_step, [STEP_EXCESS_H, STEP_CARBOXYL_GEOM], CEC_DIST_FIELDNAMES),
+              (STEP_HIJ_AMINO, calc_hij_amino_step, [STEP_EXCESS_H], HIJ_AMINO_FIELDNAMES),
+              (STEP_CLOSEST_O, calc_closest_o_step, [STEP_EXCESS_H], []),
+              (STEP_WATER_Q, calc_water_q_step, [STEP_CLOSEST_O], [R_OO, Q_DOT]),
+              (STEP_HIJ_WATER, calc_hij_water_step, [STEP_WATER_Q], [HIJ_WATER] + EXTRA_WATER_FIELDNAMES),
+              (STEP_DA_GEOM, calc_da_geom_step, [STEP_CLOSEST_O], [DA_DIST]),
+              (STEP_HIJ_ARQ, calc_hij_arq_step, [STEP_DA_GEOM], [Q_DOT_ARQ, HIJ_ARQ]),
+              (STEP_HIJ_NEW, calc_hij_new_step, [STEP_DA_GEOM], [Q_DOT_NEW, G_Q_NEW, F_ROO1_NEW, F_ROO2_NEW,
+                                                                 F_ROO_NEW, FG_NEW, HIJ_NEW]),
+              # every sweep has a first parameter set, so its column is requested whenever the sweep is
+              (STEP_HIJ_NEW_SWEEP, calc_hij_new_sweep_step, [STEP_DA_GEOM], [new_sweep_fieldname(0)]),
+              (STEP_HYD_WAT, calc_hyd_wat_step, [], HYD_WAT_FIELDNAMES),
+              ]
+CALC_STEP_FUNCS = dict((step_name, step_func) for step_name, step_func, step_uses, step_fields in CALC_STEPS)
+# Steps that only apply the EVB coupling formulas to values found by earlier steps; with BATCH_HIJ, these
+#     are evaluated once for all frames collected from a file (see batch_calcs), using these per-frame values
+BATCH_STEP_INPUTS = {STEP_HIJ_AMINO: [OH_MIN],
+                     STEP_HIJ_WATER: [R_OO, Q_DOT],
+                     STEP_HIJ_ARQ: [R_OO, DA_DIST, DA_DH_VEC, DA_DA_VEC],
+                     STEP_HIJ_NEW: [R_OO, DA_DIST, DA_DH_VEC, DA_DA_VEC],
+                     STEP_HIJ_NEW_SWEEP: [R_OO, DA_DIST, DA_DH_VEC, DA_DA_VEC],
+                     }
+
+
+def plan_calcs(requested_fields):
+    """
+    Finds the calculation steps needed to provide the requested per-frame output, so that each intermediate is
+    calculated once per frame and nothing is calculated that is not needed
+    @param requested_fields: the names of the per-frame output fields
+    @return: list of the names of the needed steps, in the order they are to be run
+    """
+    requested_fields = set(requested_fields)
+    needed_steps = set()
+    # since steps are listed after the steps they use, one pass in reverse finds everything needed
+    for step_name, step_func, step_uses, step_fields in reversed(CALC_STEPS):
+        if step_name in needed_steps or not requested_fields.isdisjoint(step_fields):
+            needed_steps.add(step_name)
+            needed_steps.update(step_uses)
+    return [step[0] for step in CALC_STEPS if step[0] in needed_steps]
+
+
+def get_calc_plan(cfg):
+    """
+    Returns the planned per-frame calculation steps (see plan_calcs), planning them if not already in the cfg
+    @param cfg: configuration for the run
+    @return: list of the names of the steps to run
+    """
+    if CALC_PLAN in cfg:
+        return cfg[CALC_PLAN]
+    elif cfg[PER_FRAME_OUTPUT]:
+        return plan_calcs(setup_per_frame_output(cfg))
+    return []
+
+
+def batch_calcs(cfg, data_to_print):
+    """
+    Evaluates the EVB coupling formulas for many frames at once, from the per-frame values collected (and then
+    removed here) by process_atom_data when BATCH_HIJ is set
+    @param cfg: configuration for the run
+    @param data_to_print: list of per-frame results, updated in place
+    """
+    if not cfg[BATCH_HIJ]:
+        return
+    batch_plan = [step_name for step_name in get_calc_plan(cfg) if step_name in BATCH_STEP_INPUTS]
+    if len(batch_plan) == 0 or len(data_to_print) == 0:
+        return
+    frame_data = {}
+    for step_name in batch_plan:
+        for input_key in BATCH_STEP_INPUTS[step_name]:
+            if input_key not in frame_data:
+                frame_data[input_key] = np.array([result[input_key] for result in data_to_print])
+    for step_name in batch_plan:
+        step_results = CALC_STEP_FUNCS[step_name](cfg, frame_data, None)
+        frame_data.update(step_results)
+        for result_key, result_values in step_results.items():
+            for result, result_value in zip(data_to_print, result_values):
+                result[result_key] = result_value
+    for result in data_to_print:
+        result.pop(DA_DH_VEC, None)
+        result.pop(DA_DA_VEC, None)
+
+
+def process_atom_data(cfg, dump_atom_data, box, timestep, gofr_data, result_dict, atom_selections=None,
+                      density_data=None):
+    """
+    Finds the atoms of interest in one timestep and performs the requested calculations
+    @param cfg: configuration for the run
+    @param dump_atom_data: dict of numpy arrays for the timestep, as returned by read_dump_frames
+    @param box: box lengths
+    @param timestep: timestep being processed (for error messages)
+    @param gofr_data: dict of histogram data, updated in place
+    @param result_dict: dict of data already collected for this timestep
+    @param atom_selections: optional dict of the atom selections from the previous timestep of the same file (see
+        find_atom_selections), updated in place
+    @param density_data: dict of density grid accumulators, updated in place (None if not used)
+    @return: dict of calculation results
+    """
     calc_results = {}
     if CEC_XYZ in result_dict:
         cec_xyz = result_dict[CEC_XYZ]
     else:
         cec_xyz = None
-    for atom in dump_atom_data:
-        if atom[MOL_NUM] == cfg[PROT_RES_MOL_ID]:
-            if atom[ATOM_NUM] in cfg[PROT_O_IDS]:
-                carboxyl_oxys.append(atom)
-            elif atom[ATOM_NUM] == cfg[PROT_C_ID]:
-                carboxyl_carb = atom
-            elif (atom[ATOM_TYPE] == cfg[PROT_H_TYPE]) and (atom[ATOM_NUM] not in cfg[PROT_H_IGNORE]):
-                excess_proton = atom
-        elif atom[ATOM_TYPE] == cfg[WAT_O_TYPE]:
-            water_oxys.append(atom)
-        elif atom[ATOM_TYPE] == cfg[WAT_H_TYPE]:
-            water_hs.append(atom)
-        elif atom[ATOM_TYPE] == cfg[H3O_O_TYPE] or atom[ATOM_TYPE] == cfg[H3O_H_TYPE]:
-            hydronium.append(atom)
-        if cfg[CALC_TYPE_GOFR]:
-            if atom[ATOM_TYPE] == cfg[GOFR_TYPE1]:
-                type1.append(atom)
-            if atom[ATOM_TYPE] == cfg[GOFR_TYPE2]:
-                type2.append(atom)
+
+    # Only the few atoms used individually are converted to python objects; the water and g(r) type atoms
+    #     are used through their coordinate arrays
+    selections = find_atom_selections(cfg, dump_atom_data, atom_selections)
+    xyz_coords = dump_atom_data[XYZ_COORDS]
+    carboxyl_oxys = frame_atoms(dump_atom_data, selections[SEL_CARBOXYL_O])
+    # if more than one atom matches, as when reading line-by-line, the last one is kept
+    carboxyl_carb = (frame_atoms(dump_atom_data, selections[SEL_CARBOXYL_C]) or [None])[-1]
+    excess_proton = (frame_atoms(dump_atom_data, selections[SEL_PROT_H]) or [None])[-1]
+    hydronium = frame_atoms(dump_atom_data, selections[SEL_HYDRONIUM])
+    water_oxy_indices = selections[SEL_WATER_O]
+    # shared by all the closest water oxygen searches for this timestep
+    water_oxy_coords = xyz_coords[water_oxy_indices]
+    num_water_hs = len(selections[SEL_WATER_H])
 
     # Data checking
     if excess_proton is None:
@@ -763,195 +1697,362 @@ def process_atom_data(cfg, dump_atom_data, box, timestep, gofr_data, result_dict
                                "Check input data, including '{}' and '{}'."
                                "".format(cfg[PROT_O_IDS], cfg[PROT_RES_MOL_ID],
                                          len(carboxyl_oxys), timestep, PROT_RES_MOL_ID, PROT_O_IDS))
-    if len(water_oxys) == 0:
+    if len(water_oxy_indices) == 0:
         raise InvalidDataError("The configuration file listed '{}' = {}, however no such atoms were found. "
                                "Check input data.".format(WAT_O_TYPE, cfg[WAT_O_TYPE]))
-    if len(water_hs) == 0:
+    if num_water_hs == 0:
         raise InvalidDataError("The configuration file listed '{}' = {}, however no such atoms were found. "
                                "Check input data.".format(WAT_H_TYPE, cfg[WAT_H_TYPE]))
 
     # Now start looking for data to report
-    if cfg[CALC_OCOH_PROPS] or (cfg[CALC_HIJ_DA_GAUSS_FORM] or cfg[CALC_HIJ_WATER_FORM] or cfg[CALC_HIJ_ARQ_FORM] or
-                                cfg[CALC_HIJ_NEW] or cfg[CALC_CEC_DIST]):
-        closest_excess_h, o_star, oh_prop_dict = find_closest_excess_proton(carboxyl_oxys, excess_proton,
-                                                                            hydronium, box, cfg,
-                                                                            carboxyl_carb, cec_xyz)
-        if cfg[CALC_OCOH_PROPS] or cfg[CALC_CEC_DIST]:
-            calc_results.update(oh_prop_dict)
-        if cfg[CALC_HIJ_WATER_FORM] or cfg[CALC_HIJ_ARQ_FORM] or cfg[CALC_HIJ_NEW]:
-            closest_o_to_ostar, o_ostar_dist = find_closest_o_to_ostar(water_oxys, o_star, hydronium, box,
-                                                                       cfg[H3O_O_TYPE])
-            if cfg[CALC_HIJ_WATER_FORM]:
-                q_dot = calc_q(closest_o_to_ostar[XYZ_COORDS], o_star[XYZ_COORDS], closest_excess_h[XYZ_COORDS], box)
-                hij_wat, term_a1, term_a2, term_a3 = calc_hij_wat(o_ostar_dist, q_dot)
-                calc_results.update({R_OO: o_ostar_dist, Q_DOT: q_dot, HIJ_WATER: hij_wat,
-                                     HIJ_A1: term_a1, HIJ_A2: term_a2, HIJ_A3: term_a3, })
-            if cfg[CALC_HIJ_ARQ_FORM]:
-                da_dist, q_dot_arq = calc_q_arq(closest_o_to_ostar[XYZ_COORDS], o_star[XYZ_COORDS],
-                                                closest_excess_h[XYZ_COORDS], box, r0_sc_arq, r0_da, lambda_arq,
-                                                )
-                hij_arq = calc_hij_arq(o_ostar_dist, q_dot_arq)
-                calc_results.update({Q_DOT_ARQ: q_dot_arq, HIJ_ARQ: hij_arq, DA_DIST: da_dist})
-            if cfg[CALC_HIJ_NEW]:
-                da_dist, q_dot_arq = calc_q_arq(closest_o_to_ostar[XYZ_COORDS], o_star[XYZ_COORDS],
-                                                closest_excess_h[XYZ_COORDS], box, cfg[R0SC_NEW], cfg[R0_DA_NEW],
-                                                cfg[LAMBDA_NEW])
-                g_of_q = np.exp(-cfg[GAMMA_NEW] * q_dot_arq)
-                f_of_roo1, f_of_roo2 = calc_f_da_new(cfg[ALPHA_NEW], cfg[A_DA_NEW], cfg[EPS_NEW],
-                                                     cfg[C_DA_NEW], o_ostar_dist)
-                f_of_roo = f_of_roo1 * f_of_roo2
-                h_ij_new = cfg[VIJ_NEW] * g_of_q * f_of_roo
-                calc_results.update({DA_DIST: da_dist, Q_DOT_NEW: q_dot_arq, G_Q_NEW: g_of_q,
-                                     F_ROO1_NEW: f_of_roo1, F_ROO2_NEW: f_of_roo2,
-                                     F_ROO_NEW: f_of_roo, FG_NEW: g_of_q * f_of_roo, HIJ_NEW: h_ij_new})
-
-        if cfg[CALC_HIJ_DA_GAUSS_FORM]:
-            r_oh = oh_prop_dict[OH_MIN]
-            hij_glu = hij_amino(r_oh, c1_glu, c2_glu, c3_glu)
-            hij_asp = hij_amino(r_oh, c1_asp, c2_asp, c3_asp)
-            calc_results.update({R_OH: oh_prop_dict[OH_MIN], HIJ_GLU: hij_glu, HIJ_ASP: hij_asp})
-    if cfg[CALC_HYD_WAT]:
-        if len(hydronium) == 0:
-            calc_results.update({R_OO_HYD_WAT: np.nan, R_OH_HYD: np.nan, R_OH_WAT_HYD: np.nan, HIJ_WAT: np.nan})
-        else:
-            hyd_wat_dict, hyd_o, hyd_h, wat_o = find_closest_wat_o_to_hyd_o(water_oxys, hydronium, box,
-                                                                            cfg[H3O_O_TYPE])
-            # noinspection PyTypeChecker
-            q_dot = calc_q(wat_o[XYZ_COORDS], hyd_o[XYZ_COORDS], hyd_h[XYZ_COORDS], box)
-            hij_hyd_wat, term_a1, term_a2, term_a3 = calc_hij_wat(hyd_wat_dict[R_OO_HYD_WAT], q_dot)
-            calc_results[HIJ_WAT] = hij_hyd_wat
-            calc_results.update(hyd_wat_dict)
-
-    # For calcs requiring H* (proton on protonated residue) skip timesteps when there is no H* (residue deprotonated)
+    calc_plan = get_calc_plan(cfg)
+    if cfg[BATCH_HIJ]:
+        batch_plan = [step_name for step_name in calc_plan if step_name in BATCH_STEP_INPUTS]
+        calc_plan = [step_name for step_name in calc_plan if step_name not in BATCH_STEP_INPUTS]
+    else:
+        batch_plan = []
+    frame_data = {DUMP_ATOM_DATA: dump_atom_data, SEL_CARBOXYL_O: carboxyl_oxys, SEL_CARBOXYL_C: carboxyl_carb,
+                  SEL_PROT_H: excess_proton, SEL_HYDRONIUM: hydronium, SEL_WATER_O: water_oxy_indices,
+                  WATER_OXY_COORDS: water_oxy_coords, CEC_XYZ: cec_xyz}
+    for step_name in calc_plan:
+        step_results = CALC_STEP_FUNCS[step_name](cfg, frame_data, box)
+        frame_data.update(step_results)
+        calc_results.update(step_results)
+    # keep what batch_calcs will need, once the file's frames have been read
+    for step_name in batch_plan:
+        for input_key in BATCH_STEP_INPUTS[step_name]:
+            calc_results[input_key] = frame_data[input_key]
+    if len(cfg[INTERNAL_COORDS]) > 0:
+        calc_results.update(calc_internal_coords(cfg, dump_atom_data, box, selections))
+    for coord_name, a_sel, b_sel, switch_dist, cutoff in cfg[CALC_COORD_NUM]:
+        a_indices, b_indices = [selections[atom_sel] if atom_sel in ATOM_GROUPS else
+                                np.flatnonzero(dump_atom_data[ATOM_TYPE] == atom_sel) for atom_sel in [a_sel, b_sel]]
+        calc_results[coord_name] = calc_coord_nums(xyz_coords, a_indices, b_indices, box, switch_dist, cutoff).sum()
+
+    if cfg[MSD_OUTPUT]:
+        calc_results[MSD_XYZ] = msd_positions(cfg, dump_atom_data, cec_xyz, timestep, selections)
+        calc_results[MSD_BOX] = box
+    if cfg[CALC_RES_TIME]:
+        calc_results[RES_NUM_WATERS], calc_results[RES_OCC] = res_occupancy(cfg, dump_atom_data,
+                                                                            selections[SEL_CARBOXYL_O], box)
+    if density_data is not None:
+        add_frame_density(density_data, density_voxels(cfg, dump_atom_data, selections[SEL_CARBOXYL_C], box,
+                                                       timestep))
+
     if cfg[GOFR_OUTPUT]:
+        gofr_pairs = []
+        # For calcs requiring H* (proton on protonated residue) skip timesteps when there is no H* (residue
+        #     deprotonated)
         if excess_proton is not None:
+            excess_proton_index = selections[SEL_PROT_H][-1:]
             if cfg[CALC_HO_GOFR]:
-                num_dens = len(water_oxys) / np.prod(box)
-                ho_dists = (calc_pair_dists([excess_proton], water_oxys, box))
-                step_his = np.histogram(ho_dists, gofr_data[GOFR_BINS])
-                gofr_data[HO_BIN_COUNT] = np.add(gofr_data[HO_BIN_COUNT], np.divide(step_his[0], num_dens))
-                gofr_data[HO_STEPS_COUNTED] += 1
+                gofr_pairs.append((HO_BIN_COUNT, HO_STEPS_COUNTED, excess_proton_index, water_oxy_indices))
             if cfg[CALC_HH_GOFR]:
-                num_dens = len(water_hs) / np.prod(box)
-                hh_dists = (calc_pair_dists([excess_proton], water_hs, box))
-                step_his = np.histogram(hh_dists, gofr_data[GOFR_BINS])
-                gofr_data[HH_BIN_COUNT] = np.add(gofr_data[HH_BIN_COUNT], np.divide(step_his[0], num_dens))
-                gofr_data[HH_STEPS_COUNTED] += 1
+                gofr_pairs.append((HH_BIN_COUNT, HH_STEPS_COUNTED, excess_proton_index, selections[SEL_WATER_H]))
         if cfg[CALC_OO_GOFR]:
-            num_dens = (len(carboxyl_oxys) * len(water_oxys)) / np.prod(box)
-            oo_dists = (calc_pair_dists(carboxyl_oxys, water_oxys, box))
-            step_his = np.histogram(oo_dists, gofr_data[GOFR_BINS])
-            gofr_data[OO_BIN_COUNT] = np.add(gofr_data[OO_BIN_COUNT], np.divide(step_his[0], num_dens))
-            gofr_data[OO_STEPS_COUNTED] += 1
+            gofr_pairs.append((OO_BIN_COUNT, OO_STEPS_COUNTED, selections[SEL_CARBOXYL_O], water_oxy_indices))
         if cfg[CALC_OH_GOFR]:
-            num_dens = (len(carboxyl_oxys) * len(water_hs)) / np.prod(box)
-            oh_dists = (calc_pair_dists(carboxyl_oxys, water_hs, box))
-            step_his = np.histogram(oh_dists, gofr_data[GOFR_BINS])
-            gofr_data[OH_BIN_COUNT] = np.add(gofr_data[OH_BIN_COUNT], np.divide(step_his[0], num_dens))
-            gofr_data[OH_STEPS_COUNTED] += 1
+            gofr_pairs.append((OH_BIN_COUNT, OH_STEPS_COUNTED, selections[SEL_CARBOXYL_O], selections[SEL_WATER_H]))
         if cfg[CALC_TYPE_GOFR]:
+            type1 = selections[SEL_GOFR_TYPE1]
+            type2 = selections[SEL_GOFR_TYPE2]
             if len(type1) > 0 and len(type2) > 0:
-                num_dens = (len(type1) * len(type2)) / np.prod(box)
-                type_dists = (calc_pair_dists(type1, type2, box))
-                step_his = np.histogram(type_dists, gofr_data[GOFR_BINS])
-                gofr_data[TYPE_BIN_COUNT] = np.add(gofr_data[TYPE_BIN_COUNT], np.divide(step_his[0], num_dens))
-                gofr_data[TYPE_STEPS_COUNTED] += 1
+                gofr_pairs.append((TYPE_BIN_COUNT, TYPE_STEPS_COUNTED, type1, type2))
+        add_frame_gofrs(xyz_coords, box, gofr_data, gofr_pairs)
 
     return calc_results
 
 
-def read_dump_file(dump_file, cfg, data_to_print, gofr_data, out_fieldnames, write_mode, evb_dict):
-    with open(dump_file) as d:
-        # spaces here allow file name to line up with the "completed reading" print line
-        if cfg[PRINT_PROGRESS]:
-            print("{:>17}: {}".format('Reading', dump_file))
-        section = None
-        box = np.zeros((3,))
-        box_counter = 1
-        atom_counter = 1
-        timesteps_read = 0
-        num_atoms = 0
-        timestep = None
-        for line in d:
-            line = line.strip()
-            if section is None:
-                section = find_dump_section_state(line)
-                if section is None and len(line) > 0:
-                    raise InvalidDataError('Unexpected line in file {}: {}'.format(dump_file, line))
-            elif section == SEC_TIMESTEP:
-                # Reset variables
-                section = None
-                dump_atom_data = []
-                try:
-                    timestep = int(line)
-                except ValueError as e:
-                    raise InvalidDataError("In attempting to read an integer timestep, encountered error: {}".format(e))
-                timesteps_read += 1
-                if timesteps_read > cfg[MAX_TIMESTEPS]:
-                    print("Reached the maximum timesteps per dumpfile ({}). "
-                          "To increase this number, set a larger value for {}. "
-                          "Continuing program.".format(cfg[MAX_TIMESTEPS], MAX_TIMESTEPS))
-                    break
-                if timesteps_read % cfg[PRINT_TIMESTEPS] == 0:
-                    if cfg[PER_FRAME_OUTPUT]:
-                        print_per_frame(dump_file, cfg, data_to_print, out_fieldnames, write_mode)
-                        data_to_print = []
-                        write_mode = 'a'
-                    if cfg[GOFR_OUTPUT]:
-                        print_gofr(cfg, gofr_data)
-                result = {FILE_NAME: os.path.basename(dump_file),
-                          TIMESTEP: timestep}
-                if cfg[EVB_SUM_FILE] is not None:
-                    if cfg[ALIGN_COL] == FILE_NAME:
-                        align_val = os.path.splitext(result[cfg[ALIGN_COL]])[0] + cfg[EVB_FILE_EXT]
-                    else:
-                        align_val = result[cfg[ALIGN_COL]]
-                    if align_val in evb_dict:
-                        step_dict = evb_dict[align_val]
-                        for evb_header in cfg[EVB_SUM_HEADERS]:
-                            result[evb_header] = step_dict[evb_header]
-                        if cfg[CALC_CEC_DIST]:
-                            result[CEC_XYZ] = np.asarray([step_dict[CEC_X], step_dict[CEC_Y], step_dict[CEC_Z]])
-                    else:
-                        warning("Did not find '{}' value {} in the data read from: {}"
-                                .format(cfg[ALIGN_COL], result[cfg[ALIGN_COL]], cfg[EVB_SUM_FILE]))
-
-            elif section == SEC_NUM_ATOMS:
-                num_atoms = int(line)
-                section = None
-            elif section == SEC_BOX_SIZE:
-                split_line = line.split()
-                diff = float(split_line[1]) - float(split_line[0])
-                box[box_counter - 1] = diff
-                if box_counter == 3:
-                    box_counter = 0
-                    section = None
-                box_counter += 1
-            elif section == SEC_ATOMS:
-                split_line = line.split()
-                # If there is an incomplete line in a dump file, move on to the next file
-                if len(split_line) < 7:
-                    break
-                atom_num = int(split_line[0])
-                mol_num = int(split_line[1])
-                atom_type = int(split_line[2])
-                charge = float(split_line[3])
-                x, y, z = map(float, split_line[4:7])
-                # Here, the atoms counting starts at 1. However, the template counted from zero
-                atom_struct = {ATOM_NUM: atom_num,
-                               MOL_NUM: mol_num,
-                               ATOM_TYPE: atom_type,
-                               CHARGE: charge,
-                               XYZ_COORDS: [x, y, z], }
-                dump_atom_data.append(atom_struct)
-                if atom_counter == num_atoms:
-                    if len(cfg[ONLY_STEPS]) == 0 or timestep in cfg[ONLY_STEPS]:
-                        result.update(process_atom_data(cfg, dump_atom_data, box, timestep, gofr_data, result))
-                        data_to_print.append(result)
-                    atom_counter = 0
-                    section = None
-                atom_counter += 1
-    if atom_counter == 1:
+def evb_align_val(raw_val):
+    """
+    @param raw_val: string read from the alignment column of the evb summary file
+    @return: the value as an integer (as for timesteps) if possible, otherwise the string
+    """
+    try:
+        return int(float(raw_val))
+    except ValueError:
+        return raw_val
+
+
+def evb_sum_val(raw_val):
+    """
+    @param raw_val: string read from the evb summary file (or None, if the row is short)
+    @return: the value as a float if possible, otherwise unchanged
+    """
+    try:
+        return float(raw_val)
+    except (TypeError, ValueError):
+        return raw_val
+
+
+def split_csv_line(line):
+    """
+    @param line: one line (as bytes) of a csv file
+    @return: the list of the line's values (empty for a blank line); the csv module is only needed for quoted values
+    """
+    line = line.decode('utf-8')
+    if '"' in line:
+        return next(csv.reader([line]), [])
+    line = line.rstrip('\r\n')
+    if len(line) == 0:
+        return []
+    return line.split(',')
+
+
+def read_evb_rows(evb_file, evb_sum, offset, first_row_num):
+    """
+    Reads the evb summary file one row at a time, converting only the alignment value (the values needed are
+    converted with evb_row_vals, only for the rows used)
+    @param evb_file: name of the evb summary file
+    @param evb_sum: dict describing the evb summary file, as returned by setup_evb_sum
+    @param offset: byte offset of the first row to read
+    @param first_row_num: the number of the first row to read (counting from 0 for the first row after the header)
+    @return: generator of tuples of the row number, the alignment value, and the list of the row's strings
+    """
+    align_index = evb_sum[EVB_ALIGN_INDEX]
+    num_cols = max(evb_sum[EVB_COL_INDICES] + [align_index]) + 1
+    row_num = first_row_num
+    with open_input(evb_file, 'rb') as csv_file:
+        csv_file.seek(offset)
+        for line in csv_file:
+            row = split_csv_line(line)
+            # blank lines are skipped, as by csv.DictReader
+            if len(row) == 0:
+                continue
+            if len(row) < num_cols:
+                row += [None] * (num_cols - len(row))
+            yield row_num, evb_align_val(row[align_index]), row
+            row_num += 1
+
+
+def evb_row_vals(evb_sum, row):
+    """
+    @param evb_sum: dict describing the evb summary file, as returned by setup_evb_sum
+    @param row: list of the strings read from a row of the evb summary file, as yielded by read_evb_rows
+    @return: the list of the EVB_SUM_HEADERS values of the row
+    """
+    return [evb_sum_val(row[col_index]) for col_index in evb_sum[EVB_COL_INDICES]]
+
+
+def setup_evb_sum(cfg, out_fieldnames):
+    """
+    Finds the columns of the evb summary file to add to the per-frame output (setting EVB_SUM_HEADERS). For timestep
+    alignment, one pass over the file checks that it is sorted by timestep and records where every EVB_INDEX_STRIDE-th
+    row starts, so that the file can be read along with the dump frames without keeping it in memory. Otherwise
+    (including alignment by file name, with one row per dump file), the needed values of every row are kept in a dict.
+    @param cfg: configuration for the run
+    @param out_fieldnames: the per-frame output column names found before adding the evb summary columns
+    @return: dict describing the evb summary file
+    """
+    evb_file = cfg[EVB_SUM_FILE]
+    evb_headers = read_csv_header(evb_file)
+    cfg[EVB_SUM_HEADERS] = []
+    for header in evb_headers:
+        if header not in out_fieldnames:
+            cfg[EVB_SUM_HEADERS].append(header)
+    for cec_flag in [CALC_CEC_DIST, CALC_CEC_MSD]:
+        if cfg[cec_flag]:
+            for header in [CEC_X, CEC_Y, CEC_Z]:
+                if header not in cfg[EVB_SUM_HEADERS]:
+                    raise InvalidDataError("If '{}' is set to True, these headers must be found in the '{}': {}."
+                                           "".format(cec_flag, EVB_SUM_FILE, [CEC_X, CEC_Y, CEC_Z]))
+    if cfg[ALIGN_COL] not in evb_headers:
+        raise InvalidDataError("Could not find the '{}' column '{}' in file {}".format(ALIGN_COL, cfg[ALIGN_COL],
+                                                                                       evb_file))
+    evb_sum = {EVB_ALIGN_INDEX: evb_headers.index(cfg[ALIGN_COL]),
+               EVB_COL_INDICES: [evb_headers.index(header) for header in cfg[EVB_SUM_HEADERS]],
+               EVB_KEYS: [], EVB_OFFSETS: [], EVB_DICT: None}
+
+    with open_input(evb_file, 'rb') as csv_file:
+        first_offset = len(csv_file.readline())
+        if cfg[ALIGN_COL] == TIMESTEP:
+            offset = first_offset
+            row_num = 0
+            prev_timestep = None
+            for line in csv_file:
+                row = split_csv_line(line)
+                if len(row) > 0:
+                    try:
+                        timestep = int(float(row[evb_sum[EVB_ALIGN_INDEX]]))
+                    except (IndexError, ValueError):
+                        timestep = None
+                    if timestep is None or (prev_timestep is not None and timestep < prev_timestep):
+                        warning("The '{}' {} is not sorted by '{}'; the needed values of all its rows will be "
+                                "read before reading the dump files.".format(EVB_SUM_FILE, evb_file, TIMESTEP))
+                        break
+                    if row_num % EVB_INDEX_STRIDE == 0:
+                        evb_sum[EVB_KEYS].append(timestep)
+                        evb_sum[EVB_OFFSETS].append(offset)
+                    prev_timestep = timestep
+                    row_num += 1
+                offset += len(line)
+            else:
+                return evb_sum
+
+    evb_dict = {}
+    for row_num, align_val, row in read_evb_rows(evb_file, evb_sum, first_offset, 0):
+        if align_val in evb_dict:
+            warning("Duplicate values found for {}. Value for key will be overwritten.".format(align_val))
+        evb_dict[align_val] = evb_row_vals(evb_sum, row)
+    evb_sum[EVB_DICT] = evb_dict
+    return evb_sum
+
+
+def new_evb_cursor():
+    """
+    @return: dict for following a sorted evb summary file along with the dump frames (see find_evb_vals)
+    """
+    return {EVB_ROWS: None, EVB_NEXT_ROW: None, EVB_LAST_VAL: None, EVB_MATCH_KEY: None, EVB_MATCH_VALS: None}
+
+
+def close_evb_cursor(evb_cursor):
+    """
+    Closes the evb summary file, if open
+    @param evb_cursor: dict for following the evb summary file, as returned by new_evb_cursor
+    """
+    if evb_cursor[EVB_ROWS] is not None:
+        evb_cursor[EVB_ROWS].close()
+        evb_cursor[EVB_ROWS] = None
+
+
+def find_evb_vals(cfg, evb_sum, evb_cursor, align_val):
+    """
+    Finds the EVB_SUM_HEADERS values for an alignment value. For a sorted evb summary file, rows are read forward from
+    the last row read, as long as the alignment values do not decrease; otherwise, reading restarts from the indexed
+    row before the requested value. If there are rows with the same alignment value, the last one is used.
+    @param cfg: configuration for the run
+    @param evb_sum: dict describing the evb summary file, as returned by setup_evb_sum
+    @param evb_cursor: dict for following the evb summary file, as returned by new_evb_cursor, updated in place
+    @param align_val: the alignment value (timestep) to find
+    @return: the list of the EVB_SUM_HEADERS values, or None if the alignment value was not found
+    """
+    if evb_sum[EVB_DICT] is not None:
+        return evb_sum[EVB_DICT].get(align_val)
+    if align_val == evb_cursor[EVB_MATCH_KEY]:
+        return evb_cursor[EVB_MATCH_VALS]
+    if len(evb_sum[EVB_KEYS]) == 0:
+        return None
+    index_entry = max(bisect_left(evb_sum[EVB_KEYS], align_val) - 1, 0)
+    next_row = evb_cursor[EVB_NEXT_ROW]
+    if evb_cursor[EVB_ROWS] is not None and align_val >= evb_cursor[EVB_LAST_VAL]:
+        # the rows read for the last value requested end with the last row with a value no larger than it
+        if next_row is None or align_val < next_row[1]:
+            evb_cursor[EVB_LAST_VAL] = align_val
+            return None
+    if (evb_cursor[EVB_ROWS] is None or align_val < evb_cursor[EVB_LAST_VAL] or
+            index_entry * EVB_INDEX_STRIDE > next_row[0]):
+        close_evb_cursor(evb_cursor)
+        evb_cursor[EVB_ROWS] = read_evb_rows(cfg[EVB_SUM_FILE], evb_sum, evb_sum[EVB_OFFSETS][index_entry],
+                                             index_entry * EVB_INDEX_STRIDE)
+        next_row = next(evb_cursor[EVB_ROWS])
+    evb_cursor[EVB_LAST_VAL] = align_val
+    rows = evb_cursor[EVB_ROWS]
+    while next_row is not None and next_row[1] < align_val:
+        next_row = next(rows, None)
+    step_row = None
+    while next_row is not None and next_row[1] == align_val:
+        if step_row is not None:
+            warning("Duplicate values found for {}. Value for key will be overwritten.".format(align_val))
+        step_row = next_row[2]
+        next_row = next(rows, None)
+    evb_cursor[EVB_NEXT_ROW] = next_row
+    if step_row is None:
+        return None
+    evb_cursor[EVB_MATCH_KEY] = align_val
+    evb_cursor[EVB_MATCH_VALS] = evb_row_vals(evb_sum, step_row)
+    return evb_cursor[EVB_MATCH_VALS]
+
+
+def process_dump_frames(dump_frames, dump_file, cfg, gofr_data, msd_data, res_data, density_data, evb_sum,
+                        flush_output=None, frames_done=0):
+    """
+    Performs the requested calculations for each frame read from a dump file. The voxels found for the density grid
+    are counted as each frame is processed, and what is needed for the MSDs and residence times is added to their
+    accumulators every MIN_CORR_CHUNK frames, so that it is not kept for the whole file.
+    @param dump_frames: iterable of frames, as returned by read_dump_frames
+    @param dump_file: name of the dump file the frames were read from
+    @param cfg: configuration for the run
+    @param gofr_data: dict of histogram data, updated in place
+    @param msd_data: dict of MSD accumulators, updated in place
+    @param res_data: dict of residence time accumulators, updated in place
+    @param density_data: dict of density grid accumulators, updated in place (None if not used)
+    @param evb_sum: dict describing the evb summary file, as returned by setup_evb_sum (None if not used)
+    @param flush_output: optional function, called with the per-frame results collected so far, gofr_data, and the
+        number of frames read before the current one every PRINT_TIMESTEPS timesteps so that intermediate output can
+        be written
+    @param frames_done: the number of frames of the dump file already processed (in an earlier run) and not included
+        in dump_frames
+    @return: list of per-frame results not yet passed to flush_output, whether more than MAX_TIMESTEPS frames were
+        found, whether all frames read were complete, and the last timestep read
+    """
+    data_to_print = []
+    # frames not yet added to the accumulators
+    new_frames = []
+    timesteps_read = frames_done
+    timestep = None
+    full_frame = True
+    reached_max_steps = False
+    # atom selections are carried from one frame to the next
+    atom_selections = {}
+    evb_cursor = new_evb_cursor()
+    for dump_frame in dump_frames:
+        timestep = dump_frame[TIMESTEP]
+        timesteps_read += 1
+        if timesteps_read > cfg[MAX_TIMESTEPS]:
+            reached_max_steps = True
+            break
+        if timesteps_read % cfg[PRINT_TIMESTEPS] == 0 and flush_output is not None:
+            batch_calcs(cfg, data_to_print)
+            flush_output(data_to_print, gofr_data, timesteps_read - 1)
+            data_to_print = []
+        result = {FILE_NAME: os.path.basename(dump_file),
+                  TIMESTEP: timestep}
+        if cfg[EVB_SUM_FILE] is not None:
+            if cfg[ALIGN_COL] == FILE_NAME:
+                align_val = os.path.splitext(result[cfg[ALIGN_COL]])[0] + cfg[EVB_FILE_EXT]
+            else:
+                align_val = result[cfg[ALIGN_COL]]
+            step_vals = find_evb_vals(cfg, evb_sum, evb_cursor, align_val)
+            if step_vals is not None:
+                step_dict = dict(zip(cfg[EVB_SUM_HEADERS], step_vals))
+                result.update(step_dict)
+                if cfg[CALC_CEC_DIST] or cfg[CALC_CEC_MSD]:
+                    result[CEC_XYZ] = np.asarray([step_dict[CEC_X], step_dict[CEC_Y], step_dict[CEC_Z]])
+            else:
+                warning("Did not find '{}' value {} in the data read from: {}"
+                        .format(cfg[ALIGN_COL], result[cfg[ALIGN_COL]], cfg[EVB_SUM_FILE]))
+        # If there is an incomplete line in a dump file, move on to the next file
+        if len(dump_frame[ATOM_NUM]) < dump_frame[NUM_ATOMS]:
+            full_frame = False
+            break
+        if len(cfg[ONLY_STEPS]) == 0 or timestep in cfg[ONLY_STEPS]:
+            result.update(process_atom_data(cfg, dump_frame, dump_frame[BOX], timestep, gofr_data, result,
+                                            atom_selections=atom_selections, density_data=density_data))
+            data_to_print.append(result)
+            new_frames.append(result)
+            if len(new_frames) == MIN_CORR_CHUNK:
+                add_accumulated_frames(cfg, msd_data, res_data, new_frames)
+                new_frames = []
+    add_accumulated_frames(cfg, msd_data, res_data, new_frames)
+    close_evb_cursor(evb_cursor)
+    batch_calcs(cfg, data_to_print)
+    return data_to_print, reached_max_steps, full_frame, timestep
+
+
+def report_dump_file_read(cfg, dump_file, reached_max_steps, full_frame, timestep):
+    """
+    Lets the user know how reading a dump file ended
+    @param cfg: configuration for the run
+    @param dump_file: name of the dump file read
+    @param reached_max_steps: boolean, whether there were more than MAX_TIMESTEPS frames in the file
+    @param full_frame: boolean, False if a frame did not have the full list of atoms
+    @param timestep: the last timestep read
+    """
+    if reached_max_steps:
+        print("Reached the maximum timesteps per dumpfile ({}). "
+              "To increase this number, set a larger value for {}. "
+              "Continuing program.".format(cfg[MAX_TIMESTEPS], MAX_TIMESTEPS))
+    if full_frame:
         if cfg[PRINT_PROGRESS]:
             print("Completed reading: {}".format(dump_file))
     else:
@@ -959,6 +2060,48 @@ def read_dump_file(dump_file, cfg, data_to_print, gofr_data, out_fieldnames, wri
                 "Continuing to next dump file.".format(dump_file, timestep))
 
 
+def print_reading(cfg, dump_file):
+    # spaces here allow file name to line up with the "completed reading" print line
+    if cfg[PRINT_PROGRESS]:
+        print("{:>17}: {}".format('Reading', dump_file))
+
+
+def read_dump_file(dump_file, cfg, gofr_data, msd_data, res_data, density_data, evb_sum, flush_output=None,
+                   frames_done=0):
+    """
+    Reads one dump file, performing the requested calculations for each timestep
+    @param dump_file: name of the dump file to read
+    @param cfg: configuration for the run
+    @param gofr_data: dict of histogram data, updated in place
+    @param msd_data: dict of MSD accumulators, updated in place
+    @param res_data: dict of residence time accumulators, updated in place
+    @param density_data: dict of density grid accumulators, updated in place (None if not used)
+    @param evb_sum: dict describing the evb summary file, as returned by setup_evb_sum (None if not used)
+    @param flush_output: optional function, called with the per-frame results collected so far, gofr_data, and the
+        number of frames read every PRINT_TIMESTEPS timesteps so that intermediate output can be written
+    @param frames_done: the number of frames to skip because they were processed in an earlier run
+    @return: list of per-frame results not yet passed to flush_output
+    """
+    print_reading(cfg, dump_file)
+    if len(cfg[ONLY_STEPS]) > 0 or frames_done > 0:
+        # Use the dump file index to seek to only the requested timesteps (within the max timesteps to read)
+        dump_index = get_dump_index(dump_file)
+        frame_offsets = dump_index[IDX_OFFSETS][:cfg[MAX_TIMESTEPS]]
+        if len(cfg[ONLY_STEPS]) > 0:
+            frame_offsets = frame_offsets[np.isin(dump_index[IDX_TIMESTEPS][:cfg[MAX_TIMESTEPS]], cfg[ONLY_STEPS])]
+        dump_frames = read_dump_frames(dump_file, frame_offsets=frame_offsets[frames_done:],
+                                       single=cfg[SINGLE_DUMP_BIN])
+        index_max_steps = len(dump_index[IDX_TIMESTEPS]) > cfg[MAX_TIMESTEPS]
+    else:
+        dump_frames = read_dump_frames(dump_file, single=cfg[SINGLE_DUMP_BIN])
+        index_max_steps = False
+    data_to_print, reached_max_steps, full_frame, timestep = process_dump_frames(
+        dump_frames, dump_file, cfg, gofr_data, msd_data, res_data, density_data, evb_sum, flush_output=flush_output,
+        frames_done=frames_done)
+    report_dump_file_read(cfg, dump_file, reached_max_steps or index_max_steps, full_frame, timestep)
+    return data_to_print
+
+
 def setup_per_frame_output(cfg):
     out_fieldnames = []
     if cfg[COMBINE_OUTPUT]:
@@ -973,7 +2116,12 @@ def setup_per_frame_output(cfg):
     if cfg[CALC_HIJ_ARQ_FORM]:
         out_fieldnames.extend(HIJ_ARQ_FIELDNAMES)
     if cfg[CALC_HIJ_NEW]:
-        out_fieldnames.extend(HIJ_NEW_FIELDNAMES)
+        if cfg[NEW_SWEEP] is None:
+            out_fieldnames.extend(HIJ_NEW_FIELDNAMES)
+        else:
+            out_fieldnames.append(DA_DIST)
+            out_fieldnames.extend([new_sweep_fieldname(set_index)
+                                   for set_index in range(len(cfg[NEW_SWEEP][GAMMA_NEW]))])
     if cfg[CALC_HIJ_WATER_FORM]:
         out_fieldnames.extend(HIJ_WATER_FIELDNAMES)
     if cfg[WATER_TERMS_PRINT]:
@@ -982,50 +2130,132 @@ def setup_per_frame_output(cfg):
         out_fieldnames.extend(HYD_WAT_FIELDNAMES)
     if cfg[CALC_CEC_DIST]:
         out_fieldnames.extend(CEC_DIST_FIELDNAMES)
+    for section, num_atoms in INTERNAL_COORD_SECS:
+        if section in cfg[INTERNAL_COORDS]:
+            out_fieldnames.extend(cfg[INTERNAL_COORDS][section][0])
+    out_fieldnames.extend([coord_num[0] for coord_num in cfg[CALC_COORD_NUM]])
     return out_fieldnames
 
 
-def print_gofr(cfg, gofr_data):
-    g_dr = cfg[GOFR_DR]
+def gofr_table(gofr_data, g_dr):
+    """
+    Normalizes the accumulated RDF histograms: each bin count (already divided by the number density of the second
+    set of atoms in each frame) is divided by the number of steps counted and the volume of the spherical shell
+    @param gofr_data: dict of histogram data
+    @param g_dr: the histogram bin width
+    @return: the output column names and an array with the bin centers and the g(r) of each RDF found in gofr_data
+    """
     dr_array = gofr_data[GOFR_BINS][1:] - g_dr / 2
     gofr_out_fieldnames = [GOFR_R]
     gofr_output = dr_array
-    if cfg[CALC_HO_GOFR]:
-        normal_fac = np.square(dr_array) * gofr_data[HO_STEPS_COUNTED] * 4 * np.pi * g_dr
-        gofr_ho = np.divide(gofr_data[HO_BIN_COUNT], normal_fac)
-        gofr_out_fieldnames.append(GOFR_HO)
-        gofr_output = np.column_stack((gofr_output, gofr_ho))
-    if cfg[CALC_OO_GOFR]:
-        normal_fac = np.square(dr_array) * gofr_data[OO_STEPS_COUNTED] * 4 * np.pi * g_dr
-        gofr_oo = np.divide(gofr_data[OO_BIN_COUNT], normal_fac)
-        gofr_out_fieldnames.append(GOFR_OO)
-        gofr_output = np.column_stack((gofr_output, gofr_oo))
-    if cfg[CALC_HH_GOFR]:
-        normal_fac = np.square(dr_array) * gofr_data[HH_STEPS_COUNTED] * 4 * np.pi * g_dr
-        gofr_hh = np.divide(gofr_data[HH_BIN_COUNT], normal_fac)
-        gofr_out_fieldnames.append(GOFR_HH)
-        gofr_output = np.column_stack((gofr_output, gofr_hh))
-    if cfg[CALC_OH_GOFR]:
-        normal_fac = np.square(dr_array) * gofr_data[OH_STEPS_COUNTED] * 4 * np.pi * g_dr
-        gofr_oh = np.divide(gofr_data[OH_BIN_COUNT], normal_fac)
-        gofr_out_fieldnames.append(GOFR_OH)
-        gofr_output = np.column_stack((gofr_output, gofr_oh))
-    if cfg[CALC_TYPE_GOFR]:
-        if gofr_data[TYPE_STEPS_COUNTED] > 0:
-            normal_fac = np.square(dr_array) * gofr_data[TYPE_STEPS_COUNTED] * 4 * np.pi * g_dr
-            gofr_type = np.divide(gofr_data[TYPE_BIN_COUNT], normal_fac)
-            gofr_out_fieldnames.append(GOFR_TYPE)
-            gofr_output = np.column_stack((gofr_output, gofr_type))
+    for flag, bin_count, step_count, gofr_col in GOFR_ACCUMULATORS:
+        if bin_count not in gofr_data:
+            continue
+        if gofr_data[step_count] > 0:
+            normal_fac = np.square(dr_array) * gofr_data[step_count] * 4 * np.pi * g_dr
+            gofr_out_fieldnames.append(gofr_col)
+            gofr_output = np.column_stack((gofr_output, np.divide(gofr_data[bin_count], normal_fac)))
         else:
             warning("Did not find any timesteps with the pairs in {}. "
-                    "This output will not be printed.".format(CALC_TYPE_GOFR))
+                    "This output will not be printed.".format(flag))
+    return gofr_out_fieldnames, gofr_output
 
-    f_out = create_out_fname(cfg[DUMP_FILE_LIST], suffix='_gofrs', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
+
+def write_gofr(gofr_data, g_dr, f_out, print_message=True):
+    """
+    Writes the normalized RDFs
+    @param gofr_data: dict of histogram data
+    @param g_dr: the histogram bin width
+    @param f_out: name of the file to write
+    @param print_message: boolean to print a message when the file is written
+    """
+    gofr_out_fieldnames, gofr_output = gofr_table(gofr_data, g_dr)
     # am not using the dict writer because the gofr output is a np.array
-    list_to_csv([gofr_out_fieldnames] + gofr_output.tolist(), f_out, print_message=cfg[PRINT_PROGRESS],
+    list_to_csv([gofr_out_fieldnames] + gofr_output.tolist(), f_out, print_message=print_message,
                 round_digits=ROUND_DIGITS)
 
 
+def print_gofr(cfg, gofr_data):
+    f_out = create_out_fname(cfg[DUMP_FILE_LIST], suffix='_gofrs', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
+    write_gofr(gofr_data, cfg[GOFR_DR], f_out, print_message=cfg[PRINT_PROGRESS])
+
+
+def write_gofr_checkpoint(f_name, gofr_data, g_dr, done_files, partial_file='', partial_frames=0):
+    """
+    Saves the RDF accumulators (the bins, and for each RDF the bin counts, already divided by the number density of
+    the second set of atoms in each frame, and the number of steps counted) with the progress through the dump files.
+    The file is written under a temporary name and then renamed, so an interrupted write does not clobber the last
+    good checkpoint.
+    @param f_name: name of the checkpoint file
+    @param gofr_data: dict of histogram data
+    @param g_dr: the histogram bin width
+    @param done_files: list of the dump files fully read, in order
+    @param partial_file: the dump file being read, if any
+    @param partial_frames: the number of frames of partial_file whose results are included
+    """
+    checkpoint = dict(gofr_data)
+    checkpoint[GOFR_DR] = g_dr
+    checkpoint[CHK_DONE_FILES] = np.array(done_files, dtype=str)
+    checkpoint[CHK_PARTIAL_FILE] = partial_file
+    checkpoint[CHK_PARTIAL_FRAMES] = partial_frames
+    tmp_name = f_name + '.tmp'
+    with open(tmp_name, 'wb') as chk_file:
+        np.savez(chk_file, **checkpoint)
+    getattr(os, 'replace', os.rename)(tmp_name, f_name)
+
+
+def read_gofr_checkpoint(f_name):
+    """
+    Reads a checkpoint written by write_gofr_checkpoint
+    @param f_name: name of the checkpoint file
+    @return: dict of histogram data (as made by new_gofr_data), the histogram bin width, the list of dump files fully
+        read, the name of the dump file partly read (an empty string if none), and the number of its frames read
+    """
+    try:
+        with np.load(f_name) as saved_chk:
+            checkpoint = {key: saved_chk[key] for key in saved_chk.files}
+        gofr_data = {GOFR_BINS: checkpoint[GOFR_BINS]}
+        for flag, bin_count, step_count, gofr_col in GOFR_ACCUMULATORS:
+            if bin_count in checkpoint:
+                gofr_data[bin_count] = checkpoint[bin_count]
+                gofr_data[step_count] = int(checkpoint[step_count])
+        return (gofr_data, float(checkpoint[GOFR_DR]), checkpoint[CHK_DONE_FILES].tolist(),
+                str(checkpoint[CHK_PARTIAL_FILE]), int(checkpoint[CHK_PARTIAL_FRAMES]))
+    except (ValueError, KeyError) as e:
+        raise InvalidDataError("Could not read g(r) checkpoint file {}: {}".format(f_name, e))
+
+
+def check_gofr_match(gofr_data, other_gofr_data, other_name):
+    """
+    Makes sure that two sets of gofr data have the same bins and RDFs, so that they can be combined
+    @param gofr_data: dict of histogram data
+    @param other_gofr_data: dict of histogram data to be combined with gofr_data
+    @param other_name: name of the source of other_gofr_data, for the error message
+    """
+    if set(gofr_data.keys()) != set(other_gofr_data.keys()):
+        raise InvalidDataError("The RDFs in {} ({}) do not match the RDFs expected ({}).".format(
+            other_name, sorted(key for key in other_gofr_data if key != GOFR_BINS),
+            sorted(key for key in gofr_data if key != GOFR_BINS)))
+    if not np.array_equal(gofr_data[GOFR_BINS], other_gofr_data[GOFR_BINS]):
+        raise InvalidDataError("The RDF bins in {} do not match the bins expected. Check the values for '{}' and "
+                               "'{}'.".format(other_name, GOFR_MAX, GOFR_DR))
+
+
+def print_new_sweep(base_out_file_name, cfg):
+    """
+    Writes the parameters of each set in the "new" parameter sweep, with the name of its output column
+    @param base_out_file_name: name on which the output file name is based
+    @param cfg: configuration for the run
+    """
+    f_out = create_out_fname(base_out_file_name, suffix='_new_sweep', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
+    param_sets = []
+    for set_index in range(len(cfg[NEW_SWEEP][GAMMA_NEW])):
+        param_set = dict((key, cfg[NEW_SWEEP][key][set_index]) for key in NEW_PARAMS)
+        param_set[NEW_SWEEP_COL] = new_sweep_fieldname(set_index)
+        param_sets.append(param_set)
+    write_csv(param_sets, f_out, [NEW_SWEEP_COL] + NEW_PARAMS, print_message=cfg[PRINT_PROGRESS])
+
+
 def print_per_frame(dump_file, cfg, data_to_print, out_fieldnames, write_mode):
     f_out = create_out_fname(dump_file, suffix='_sum', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
     write_csv(data_to_print, f_out, out_fieldnames, extrasaction="ignore", mode=write_mode, round_digits=ROUND_DIGITS,
@@ -1037,6 +2267,692 @@ def ini_gofr_data(gofr_data, bin_count, bins, step_count):
     gofr_data[step_count] = 0
 
 
+def new_gofr_data(cfg):
+    """
+    Creates the empty data structures for the requested RDFs
+    @param cfg: configuration for the run
+    @return: dict with the bins, and zeroed bin counts and step counts for each requested RDF
+    """
+    gofr_data = {}
+    if cfg[GOFR_OUTPUT]:
+        g_dr = cfg[GOFR_DR]
+        g_max = cfg[GOFR_MAX]
+        gofr_data[GOFR_BINS] = np.arange(0.0, g_max + g_dr, g_dr)
+        if len(gofr_data[GOFR_BINS]) < 2:
+            raise InvalidDataError("Insufficient number of bins to calculate RDFs. Check input: "
+                                   "{}: {}, {}: {},".format(GOFR_DR, cfg[GOFR_DR], GOFR_MAX, cfg[GOFR_MAX]))
+        for flag, bin_count, step_count, gofr_col in GOFR_ACCUMULATORS:
+            if cfg[flag]:
+                ini_gofr_data(gofr_data, bin_count, GOFR_BINS, step_count)
+    return gofr_data
+
+
+def add_gofr_data(gofr_data, other_gofr_data):
+    """
+    Adds the histogram bin counts and step counts from one set of gofr data to another, so that results collected
+    separately (e.g. for each dump file) can be combined
+    @param gofr_data: dict of histogram data, updated in place
+    @param other_gofr_data: dict of histogram data to add
+    """
+    for flag, bin_count, step_count, gofr_col in GOFR_ACCUMULATORS:
+        if bin_count in other_gofr_data:
+            gofr_data[bin_count] = np.add(gofr_data[bin_count], other_gofr_data[bin_count])
+            gofr_data[step_count] += other_gofr_data[step_count]
+
+
+def new_msd_data(cfg):
+    """
+    Creates the empty MSD accumulators
+    @param cfg: configuration for the run
+    @return: dict of MSD accumulators, which are sized when the first frame is added
+    """
+    return {MSD_COLS: msd_columns(cfg), MSD_COL_SIZES: None, MSD_NUM_FRAMES: 0, MSD_PREV_XYZ: None,
+            MSD_UNWRAPPED: None, MSD_PENDING: [], MSD_LAST_FRAMES: None, MSD_HEAD_FRAMES: None, MSD_XYZ_SUM: None,
+            MSD_SQ_SUM: None, MSD_CORR: None, MSD_FIRST_STEP: None, MSD_FIRST_XYZ: None, MSD_FIRST_BOX: None}
+
+
+def add_lagged_products(lagged_sums, frames, num_prev):
+    """
+    For streaming time correlation functions: adds, for each lag m, the products of each new frame with the frame m
+    frames before it (if in frames), found at once for all lags by FFT. If only the last max_lag frames are kept
+    between chunks of new frames, every pair of frames up to max_lag apart is counted once, and the cost grows as
+    T log(max_lag) rather than T^2.
+    @param lagged_sums: array of the sums for each lag (lags x items), updated in place; lags beyond its length are
+        not calculated
+    @param frames: array of the earlier frames followed by the new frames (frames x items x values); the products are
+        summed over the last axis (e.g. the dot product of two positions)
+    @param num_prev: the number of earlier frames (already counted) at the start of frames
+    """
+    chunk = frames[num_prev:]
+    # padded so that the circular correlation does not wrap around
+    fft_len = 1 << int(len(frames) + len(chunk) - 1).bit_length()
+    chunk_fft = np.fft.rfft(chunk, n=fft_len, axis=0)
+    frames_fft = np.fft.rfft(frames, n=fft_len, axis=0)
+    # corr[k] is the sum over j of chunk[j].frames[j + k]; as chunk[j] is frames[num_prev + j], lag m is at
+    #     k = num_prev - m
+    corr = np.fft.irfft(np.sum(np.conj(chunk_fft) * frames_fft, axis=-1), n=fft_len, axis=0)
+    lags = np.arange(min(len(lagged_sums) - 1, len(frames) - 1) + 1)
+    lagged_sums[lags] += corr[(num_prev - lags) % fft_len]
+
+
+def add_msd_chunk(msd_data, chunk, max_lag):
+    """
+    Adds a chunk of unwrapped positions to the MSD accumulators. The MSD at lag m over T frames is
+    (sum_{t<T-m} r(t)^2 + sum_{t>=m} r(t)^2 - 2 sum_t r(t).r(t+m)) / (T-m). The squares are summed (keeping the
+    first max_lag frames, and the last max_lag frames, to remove those at the end), and the products found with
+    add_lagged_products.
+    @param msd_data: dict of MSD accumulators, updated in place
+    @param chunk: array of the unwrapped positions in the new frames (frames x atoms x 3)
+    @param max_lag: the largest lag (in frames) to calculate
+    """
+    if msd_data[MSD_CORR] is None:
+        msd_data[MSD_LAST_FRAMES] = chunk[:0]
+        msd_data[MSD_HEAD_FRAMES] = chunk[:0]
+        msd_data[MSD_XYZ_SUM] = np.zeros(chunk.shape[1:])
+        msd_data[MSD_SQ_SUM] = np.zeros(chunk.shape[1])
+        msd_data[MSD_CORR] = np.zeros((max_lag + 1, chunk.shape[1]))
+    frames = np.concatenate((msd_data[MSD_LAST_FRAMES], chunk))
+    add_lagged_products(msd_data[MSD_CORR], frames, len(msd_data[MSD_LAST_FRAMES]))
+    msd_data[MSD_SQ_SUM] += np.sum(np.square(chunk), axis=-1).sum(axis=0)
+    msd_data[MSD_XYZ_SUM] += chunk.sum(axis=0)
+    msd_data[MSD_HEAD_FRAMES] = np.concatenate((msd_data[MSD_HEAD_FRAMES],
+                                                chunk[:max_lag - len(msd_data[MSD_HEAD_FRAMES])]))
+    msd_data[MSD_LAST_FRAMES] = frames[-max_lag:]
+    msd_data[MSD_NUM_FRAMES] += len(chunk)
+
+
+def add_msd_frames(cfg, msd_data, data_to_print):
+    """
+    Unwraps, in order, the positions collected from each frame by msd_positions (removing them from the per-frame
+    results) and adds them to the MSD accumulators, a chunk at a time. Positions are unwrapped by adding the minimum
+    image vector from the previous frame, so atoms must move less than half a box length between frames processed.
+    @param cfg: configuration for the run
+    @param msd_data: dict of MSD accumulators, updated in place
+    @param data_to_print: list of per-frame results, in frame order
+    """
+    chunk_size = max(cfg[MSD_MAX_LAG], MIN_CORR_CHUNK)
+    for result in data_to_print:
+        if MSD_XYZ not in result:
+            continue
+        positions = result.pop(MSD_XYZ)
+        box = result.pop(MSD_BOX)
+        xyz = np.concatenate(positions)
+        if msd_data[MSD_PREV_XYZ] is None:
+            # displacements are measured from the first frame
+            msd_data[MSD_UNWRAPPED] = np.zeros_like(xyz)
+            msd_data[MSD_COL_SIZES] = [len(col_xyz) for col_xyz in positions]
+            if 0 in msd_data[MSD_COL_SIZES]:
+                raise InvalidDataError("Found no atoms for '{}' at timestep {}. Check input data, including '{}'."
+                                       "".format(MSD_TYPE, result[TIMESTEP], MSD_ATOM_TYPE))
+            msd_data[MSD_FIRST_STEP] = result[TIMESTEP]
+            msd_data[MSD_FIRST_XYZ] = xyz
+            msd_data[MSD_FIRST_BOX] = box
+        elif len(xyz) != len(msd_data[MSD_PREV_XYZ]):
+            raise InvalidDataError("Found {} positions for the MSDs at timestep {}, but {} in earlier frames. Check "
+                                   "that the atoms selected for the MSDs are in every frame."
+                                   "".format(len(xyz), result[TIMESTEP], len(msd_data[MSD_PREV_XYZ])))
+        else:
+            msd_data[MSD_UNWRAPPED] = msd_data[MSD_UNWRAPPED] + pbc_calc_vectors(xyz, msd_data[MSD_PREV_XYZ], box)
+        msd_data[MSD_PREV_XYZ] = xyz
+        msd_data[MSD_PENDING].append(msd_data[MSD_UNWRAPPED])
+        if len(msd_data[MSD_PENDING]) == chunk_size:
+            add_msd_pending(cfg, msd_data)
+
+
+def add_msd_pending(cfg, msd_data):
+    """
+    Correlates the unwrapped positions not yet in a chunk
+    @param cfg: configuration for the run
+    @param msd_data: dict of MSD accumulators, updated in place
+    """
+    if len(msd_data[MSD_PENDING]) > 0:
+        add_msd_chunk(msd_data, np.array(msd_data[MSD_PENDING]), cfg[MSD_MAX_LAG])
+        msd_data[MSD_PENDING] = []
+
+
+def add_msd_data(cfg, msd_data, other_msd_data):
+    """
+    Adds the MSD accumulators for a later range of frames (e.g. read by a worker process) to those of the frames
+    before it, giving the same result as adding all the frames in order. The other positions were unwrapped from the
+    first frame of their range, so they are shifted by the unwrapped position of that frame: for lag m over T frames,
+    sum_t (r(t) + c).(r(t+m) + c) adds c.(2 sum_t r(t) - (sum of the first m) - (sum of the last m)) + (T-m) c^2 to
+    the products. Products of frames in different ranges are found from the last max_lag frames of the earlier range
+    and the first max_lag frames of the later one.
+    @param cfg: configuration for the run
+    @param msd_data: dict of MSD accumulators, updated in place
+    @param other_msd_data: dict of MSD accumulators for the frames that follow (its pending frames are correlated)
+    """
+    add_msd_pending(cfg, msd_data)
+    add_msd_pending(cfg, other_msd_data)
+    num_other = other_msd_data[MSD_NUM_FRAMES]
+    if num_other == 0:
+        return
+    if msd_data[MSD_PREV_XYZ] is None:
+        msd_data.update(other_msd_data)
+        return
+    if len(other_msd_data[MSD_FIRST_XYZ]) != len(msd_data[MSD_PREV_XYZ]):
+        raise InvalidDataError("Found {} positions for the MSDs at timestep {}, but {} in earlier frames. Check "
+                               "that the atoms selected for the MSDs are in every frame."
+                               "".format(len(other_msd_data[MSD_FIRST_XYZ]), other_msd_data[MSD_FIRST_STEP],
+                                         len(msd_data[MSD_PREV_XYZ])))
+    max_lag = cfg[MSD_MAX_LAG]
+    shift = msd_data[MSD_UNWRAPPED] + pbc_calc_vectors(other_msd_data[MSD_FIRST_XYZ], msd_data[MSD_PREV_XYZ],
+                                                       other_msd_data[MSD_FIRST_BOX])
+    shift_sq = np.sum(np.square(shift), axis=-1)
+    xyz_sum = other_msd_data[MSD_XYZ_SUM]
+    # products of frames both in the later range
+    lags = np.arange(min(max_lag, num_other - 1) + 1)
+    no_sum = np.zeros((1,) + xyz_sum.shape)
+    head_sums = np.concatenate((no_sum, np.cumsum(other_msd_data[MSD_HEAD_FRAMES][:lags[-1]], axis=0)))
+    tail_sums = np.concatenate((no_sum, np.cumsum(other_msd_data[MSD_LAST_FRAMES][::-1][:lags[-1]], axis=0)))
+    msd_data[MSD_CORR][lags] += (other_msd_data[MSD_CORR][lags] +
+                                 np.sum(shift * (2 * xyz_sum - head_sums - tail_sums), axis=-1) +
+                                 (num_other - lags)[:, np.newaxis] * shift_sq)
+    # products of frames in different ranges: those found with the earlier frames, less those within the head
+    head = other_msd_data[MSD_HEAD_FRAMES] + shift
+    head_corr = np.zeros_like(msd_data[MSD_CORR])
+    add_lagged_products(head_corr, head, 0)
+    add_lagged_products(msd_data[MSD_CORR], np.concatenate((msd_data[MSD_LAST_FRAMES], head)),
+                        len(msd_data[MSD_LAST_FRAMES]))
+    msd_data[MSD_CORR] -= head_corr
+    msd_data[MSD_SQ_SUM] += other_msd_data[MSD_SQ_SUM] + 2 * np.sum(shift * xyz_sum, axis=-1) + num_other * shift_sq
+    msd_data[MSD_XYZ_SUM] += xyz_sum + num_other * shift
+    msd_data[MSD_HEAD_FRAMES] = np.concatenate((msd_data[MSD_HEAD_FRAMES],
+                                                head[:max_lag - len(msd_data[MSD_HEAD_FRAMES])]))
+    msd_data[MSD_LAST_FRAMES] = np.concatenate((msd_data[MSD_LAST_FRAMES],
+                                                other_msd_data[MSD_LAST_FRAMES] + shift))[-max_lag:]
+    msd_data[MSD_NUM_FRAMES] += num_other
+    msd_data[MSD_UNWRAPPED] = other_msd_data[MSD_UNWRAPPED] + shift
+    msd_data[MSD_PREV_XYZ] = other_msd_data[MSD_PREV_XYZ]
+
+
+def calc_msd(cfg, msd_data):
+    """
+    Completes the MSDs from the accumulators (after correlating any frames not yet in a chunk)
+    @param cfg: configuration for the run
+    @param msd_data: dict of MSD accumulators, updated in place
+    @return: array of the lags (in frames), and array of the MSD of each column of msd_columns at each lag
+    """
+    add_msd_pending(cfg, msd_data)
+    num_frames = msd_data[MSD_NUM_FRAMES]
+    lags = np.arange(min(cfg[MSD_MAX_LAG], num_frames - 1) + 1)
+    no_sum = np.zeros((1, msd_data[MSD_SQ_SUM].shape[0]))
+    # sums of the squares of the first m, and of the last m, frames for each lag m
+    head_sq = np.sum(np.square(msd_data[MSD_HEAD_FRAMES][:lags[-1]]), axis=-1)
+    head_sums = np.concatenate((no_sum, np.cumsum(head_sq, axis=0)))
+    tail_sq = np.sum(np.square(msd_data[MSD_LAST_FRAMES][::-1][:lags[-1]]), axis=-1)
+    tail_sums = np.concatenate((no_sum, np.cumsum(tail_sq, axis=0)))
+    atom_msds = ((2 * msd_data[MSD_SQ_SUM] - head_sums - tail_sums - 2 * msd_data[MSD_CORR][lags]) /
+                 (num_frames - lags)[:, np.newaxis])
+    col_ends = np.cumsum(msd_data[MSD_COL_SIZES])
+    msds = np.column_stack([atom_msds[:, col_end - col_size:col_end].mean(axis=1)
+                            for col_size, col_end in zip(msd_data[MSD_COL_SIZES], col_ends)])
+    return lags, msds
+
+
+def print_msd(cfg, msd_data):
+    """
+    Writes the MSDs, and if requested, the diffusion coefficients (MSD = 6 D t) fit to them
+    @param cfg: configuration for the run
+    @param msd_data: dict of MSD accumulators, updated in place
+    """
+    if msd_data[MSD_NUM_FRAMES] + len(msd_data[MSD_PENDING]) < 2:
+        warning("At least two frames are needed to calculate MSDs. No MSD output will be printed.")
+        return
+    lags, msds = calc_msd(cfg, msd_data)
+    times = lags * cfg[FRAME_TIME]
+    msd_rows = [[lag] + row for lag, row in zip(lags.tolist(), np.column_stack((times, msds)).tolist())]
+    f_out = create_out_fname(cfg[DUMP_FILE_LIST], suffix='_msd', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
+    list_to_csv([[MSD_LAG, MSD_TIME] + msd_data[MSD_COLS]] + msd_rows, f_out, print_message=cfg[PRINT_PROGRESS],
+                round_digits=ROUND_DIGITS)
+    if len(cfg[MSD_FIT_LAGS]) == 0:
+        return
+    first_lag, last_lag = cfg[MSD_FIT_LAGS]
+    if last_lag > lags[-1]:
+        warning("Found MSDs only up to a lag of {} frames, so could not fit diffusion coefficients over lags {} to {} "
+                "('{}').".format(lags[-1], first_lag, last_lag, MSD_FIT_LAGS))
+        return
+    slopes = np.polyfit(times[first_lag:last_lag + 1], msds[first_lag:last_lag + 1], 1)[0]
+    f_out = create_out_fname(cfg[DUMP_FILE_LIST], suffix='_diffusion', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
+    list_to_csv([[MSD_COLUMN, DIFF_COEF]] + [[msd_col, slope / 6] for msd_col, slope in
+                                             zip(msd_data[MSD_COLS], slopes.tolist())],
+                f_out, print_message=cfg[PRINT_PROGRESS])
+
+
+def new_res_data():
+    """
+    @return: dict of empty residence time accumulators, which are sized when the first frame is added
+    """
+    return {RES_NUM_WATERS: None, RES_NUM_FRAMES: 0, RES_PENDING: [], RES_LAST_FRAMES: None, RES_OCC_SUM: None,
+            RES_CORR_SUMS: None, RES_FIRST_STEP: None, RES_HEAD_FRAMES: None}
+
+
+def res_lagged_sums(frames, num_prev, max_lag):
+    """
+    For each lag m up to max_lag, finds the sum over waters and time origins t of h(t) h(t+m), where h is 1 if the
+    water is within the cutoff of the carboxylic oxygen atom and 0 otherwise, for the pairs of frames with the later
+    frame after the first num_prev frames. Only the waters found within the cutoff in these frames are unpacked and
+    correlated (with add_lagged_products).
+    @param frames: array of occupancies packed as bits (frames x carboxylic oxygen atoms x bytes)
+    @param num_prev: the number of earlier frames (already counted) at the start of frames
+    @param max_lag: the largest lag (in frames) to calculate
+    @return: array of the sums for each lag and carboxylic oxygen atom, and array of the total occupancy of each
+        carboxylic oxygen atom in the frames after the first num_prev frames
+    """
+    num_carboxyl_oxys = frames.shape[1]
+    corr_sums = np.zeros((max_lag + 1, num_carboxyl_oxys))
+    occ_sums = np.zeros(num_carboxyl_oxys)
+    carboxyl_ids, byte_ids = np.nonzero(frames.any(axis=0))
+    if len(byte_ids) > 0:
+        occupied = np.unpackbits(frames[:, carboxyl_ids, byte_ids], axis=-1)
+        carboxyl_ids = np.repeat(carboxyl_ids, 8)
+        # waters within the cutoff in any of these frames
+        visited = occupied.any(axis=0)
+        occupied = occupied[:, visited].astype(float)
+        carboxyl_ids = carboxyl_ids[visited]
+        water_sums = np.zeros((max_lag + 1, occupied.shape[1]))
+        add_lagged_products(water_sums, occupied[:, :, np.newaxis], num_prev)
+        new_occupied = occupied[num_prev:].sum(axis=0)
+        for carboxyl_index in range(num_carboxyl_oxys):
+            carboxyl_waters = carboxyl_ids == carboxyl_index
+            corr_sums[:, carboxyl_index] = water_sums[:, carboxyl_waters].sum(axis=1)
+            occ_sums[carboxyl_index] = new_occupied[carboxyl_waters].sum()
+    return corr_sums, occ_sums
+
+
+def add_res_chunk(res_data, chunk, max_lag):
+    """
+    Adds a chunk of occupancies to the residence time accumulators: the total occupancy, and the sums of the lagged
+    products of the occupancies (see res_lagged_sums) with the frames in the chunk or the max_lag frames before it
+    @param res_data: dict of residence time accumulators, updated in place
+    @param chunk: array of occupancies packed as bits (frames x carboxylic oxygen atoms x bytes)
+    @param max_lag: the largest lag (in frames) to calculate
+    """
+    if res_data[RES_CORR_SUMS] is None:
+        res_data[RES_LAST_FRAMES] = chunk[:0]
+        res_data[RES_HEAD_FRAMES] = chunk[:0]
+        res_data[RES_OCC_SUM] = np.zeros(chunk.shape[1])
+        res_data[RES_CORR_SUMS] = np.zeros((max_lag + 1, chunk.shape[1]))
+    frames = np.concatenate((res_data[RES_LAST_FRAMES], chunk))
+    corr_sums, occ_sums = res_lagged_sums(frames, len(res_data[RES_LAST_FRAMES]), max_lag)
+    res_data[RES_CORR_SUMS] += corr_sums
+    res_data[RES_OCC_SUM] += occ_sums
+    res_data[RES_HEAD_FRAMES] = np.concatenate((res_data[RES_HEAD_FRAMES],
+                                                chunk[:max_lag - len(res_data[RES_HEAD_FRAMES])]))
+    res_data[RES_LAST_FRAMES] = frames[-max_lag:]
+    res_data[RES_NUM_FRAMES] += len(chunk)
+
+
+def add_res_frames(cfg, res_data, data_to_print):
+    """
+    Adds, in order, the occupancies found for each frame by res_occupancy (removing them from the per-frame results)
+    to the residence time accumulators, a chunk at a time
+    @param cfg: configuration for the run
+    @param res_data: dict of residence time accumulators, updated in place
+    @param data_to_print: list of per-frame results, in frame order
+    """
+    chunk_size = max(cfg[RES_MAX_LAG], MIN_CORR_CHUNK)
+    for result in data_to_print:
+        if RES_OCC not in result:
+            continue
+        num_waters = result.pop(RES_NUM_WATERS)
+        if res_data[RES_NUM_WATERS] is None:
+            res_data[RES_NUM_WATERS] = num_waters
+            res_data[RES_FIRST_STEP] = result[TIMESTEP]
+        elif num_waters != res_data[RES_NUM_WATERS]:
+            raise InvalidDataError("Found {} water and hydronium oxygen atoms at timestep {}, but {} in earlier "
+                                   "frames. The residence time calculation requires the same waters in every frame."
+                                   "".format(num_waters, result[TIMESTEP], res_data[RES_NUM_WATERS]))
+        res_data[RES_PENDING].append(result.pop(RES_OCC))
+        if len(res_data[RES_PENDING]) == chunk_size:
+            add_res_pending(cfg, res_data)
+
+
+def add_res_pending(cfg, res_data):
+    """
+    Correlates the occupancies not yet in a chunk
+    @param cfg: configuration for the run
+    @param res_data: dict of residence time accumulators, updated in place
+    """
+    if len(res_data[RES_PENDING]) > 0:
+        add_res_chunk(res_data, np.array(res_data[RES_PENDING]), cfg[RES_MAX_LAG])
+        res_data[RES_PENDING] = []
+
+
+def add_res_data(cfg, res_data, other_res_data):
+    """
+    Adds the residence time accumulators for a later range of frames (e.g. read by a worker process) to those of the
+    frames before it, giving the same result as adding all the frames in order. Products of frames in different
+    ranges are found from the last max_lag frames of the earlier range and the first max_lag frames of the later one.
+    @param cfg: configuration for the run
+    @param res_data: dict of residence time accumulators, updated in place
+    @param other_res_data: dict of residence time accumulators for the frames that follow (its pending frames are
+        correlated)
+    """
+    add_res_pending(cfg, res_data)
+    add_res_pending(cfg, other_res_data)
+    if other_res_data[RES_NUM_FRAMES] == 0:
+        return
+    if res_data[RES_NUM_FRAMES] == 0:
+        res_data.update(other_res_data)
+        return
+    if other_res_data[RES_NUM_WATERS] != res_data[RES_NUM_WATERS]:
+        raise InvalidDataError("Found {} water and hydronium oxygen atoms at timestep {}, but {} in earlier "
+                               "frames. The residence time calculation requires the same waters in every frame."
+                               "".format(other_res_data[RES_NUM_WATERS], other_res_data[RES_FIRST_STEP],
+                                         res_data[RES_NUM_WATERS]))
+    max_lag = cfg[RES_MAX_LAG]
+    head = other_res_data[RES_HEAD_FRAMES]
+    # products of frames in different ranges: those found with the earlier frames, less those within the head
+    cross_sums = res_lagged_sums(np.concatenate((res_data[RES_LAST_FRAMES], head)), len(res_data[RES_LAST_FRAMES]),
+                                 max_lag)[0] - res_lagged_sums(head, 0, max_lag)[0]
+    res_data[RES_CORR_SUMS] += other_res_data[RES_CORR_SUMS] + cross_sums
+    res_data[RES_OCC_SUM] += other_res_data[RES_OCC_SUM]
+    res_data[RES_HEAD_FRAMES] = np.concatenate((res_data[RES_HEAD_FRAMES],
+                                                head[:max_lag - len(res_data[RES_HEAD_FRAMES])]))
+    res_data[RES_LAST_FRAMES] = np.concatenate((res_data[RES_LAST_FRAMES],
+                                                other_res_data[RES_LAST_FRAMES]))[-max_lag:]
+    res_data[RES_NUM_FRAMES] += other_res_data[RES_NUM_FRAMES]
+
+
+def calc_res_corr(cfg, res_data):
+    """
+    Completes the residence time correlation functions, C(m) = <h(t) h(t+m)> / <h(t)>, averaged over the waters and
+    time origins, from the accumulators (after correlating any frames not yet in a chunk)
+    @param cfg: configuration for the run
+    @param res_data: dict of residence time accumulators, updated in place
+    @return: array of the lags (in frames), and array of the correlation for each carboxylic oxygen atom at each lag
+    """
+    add_res_pending(cfg, res_data)
+    num_frames = res_data[RES_NUM_FRAMES]
+    lags = np.arange(min(cfg[RES_MAX_LAG], num_frames - 1) + 1)
+    mean_occ = res_data[RES_OCC_SUM] / num_frames
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res_corr = res_data[RES_CORR_SUMS][lags] / (num_frames - lags)[:, np.newaxis] / mean_occ
+    return lags, res_corr
+
+
+def print_res_time(cfg, res_data):
+    """
+    Writes the residence time correlation functions, and the residence times found by integrating them (with the
+    trapezoid rule) up to the largest lag calculated
+    @param cfg: configuration for the run
+    @param res_data: dict of residence time accumulators, updated in place
+    """
+    if res_data[RES_NUM_FRAMES] + len(res_data[RES_PENDING]) < 2:
+        warning("At least two frames are needed to calculate residence times. No residence time output will be "
+                "printed.")
+        return
+    lags, res_corr = calc_res_corr(cfg, res_data)
+    res_cols = [RES_CORR.format(atom_id) for atom_id in sorted(cfg[PROT_O_IDS])]
+    for res_col, occ_sum in zip(res_cols, res_data[RES_OCC_SUM]):
+        if occ_sum == 0:
+            warning("No waters were found within {} of the carboxylic oxygen atom for '{}'."
+                    "".format(cfg[RES_CUTOFF], res_col))
+    lag_times = lags * cfg[FRAME_TIME]
+    corr_rows = [[lag] + row for lag, row in zip(lags.tolist(), np.column_stack((lag_times, res_corr)).tolist())]
+    f_out = create_out_fname(cfg[DUMP_FILE_LIST], suffix='_res_corr', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
+    list_to_csv([[RES_LAG, RES_LAG_TIME] + res_cols] + corr_rows, f_out, print_message=cfg[PRINT_PROGRESS],
+                round_digits=ROUND_DIGITS)
+    res_times = np.sum(res_corr[1:] + res_corr[:-1], axis=0) / 2 * cfg[FRAME_TIME]
+    f_out = create_out_fname(cfg[DUMP_FILE_LIST], suffix='_res_times', ext='.csv', base_dir=cfg[OUT_BASE_DIR])
+    list_to_csv([[RES_COLUMN, RES_TIME]] + [[res_col, res_time] for res_col, res_time in
+                                            zip(res_cols, res_times.tolist())],
+                f_out, print_message=cfg[PRINT_PROGRESS], round_digits=ROUND_DIGITS)
+
+
+def new_density_data(cfg):
+    """
+    Creates the empty density grid accumulators
+    @param cfg: configuration for the run
+    @return: dict of density grid accumulators
+    """
+    num_voxels, grid_min = density_grid_size(cfg)
+    return {DENSITY_COUNTS: np.zeros(num_voxels ** 3, dtype=np.int64), DENSITY_NUM_FRAMES: 0}
+
+
+def add_frame_density(density_data, voxels):
+    """
+    Adds the voxels found for one frame by density_voxels to the voxel counts
+    @param density_data: dict of density grid accumulators, updated in place
+    @param voxels: array of the flattened voxel indices of the atoms found in the grid
+    """
+    np.add.at(density_data[DENSITY_COUNTS], voxels, 1)
+    density_data[DENSITY_NUM_FRAMES] += 1
+
+
+def add_density_data(density_data, other_density_data):
+    """
+    Adds the voxel counts collected separately (e.g. by a worker process) to the density grid accumulators
+    @param density_data: dict of density grid accumulators, updated in place
+    @param other_density_data: dict of density grid accumulators to add
+    """
+    density_data[DENSITY_COUNTS] += other_density_data[DENSITY_COUNTS]
+    density_data[DENSITY_NUM_FRAMES] += other_density_data[DENSITY_NUM_FRAMES]
+
+
+def add_accumulated_frames(cfg, msd_data, res_data, frame_results):
+    """
+    Adds the positions and occupancies collected for the MSDs and residence times from each frame to their
+    accumulators (removing them from the per-frame results)
+    @param cfg: configuration for the run
+    @param msd_data: dict of MSD accumulators, updated in place
+    @param res_data: dict of residence time accumulators, updated in place
+    @param frame_results: list of per-frame results, in frame order
+    """
+    if cfg[MSD_OUTPUT]:
+        add_msd_frames(cfg, msd_data, frame_results)
+    if cfg[CALC_RES_TIME]:
+        add_res_frames(cfg, res_data, frame_results)
+
+
+def print_density(cfg, density_data):
+    """
+    Writes the average number density (atoms per cubic length unit) in each voxel as an OpenDX grid (as read by
+    VMD), with the carboxylic carbon atom at the origin
+    @param cfg: configuration for the run
+    @param density_data: dict of density grid accumulators
+    """
+    num_frames = density_data[DENSITY_NUM_FRAMES]
+    if num_frames == 0:
+        warning("No frames were read for the density grid. No density grid output will be printed.")
+        return
+    num_voxels, grid_min = density_grid_size(cfg)
+    spacing = cfg[DENSITY_SPACING]
+    densities = density_data[DENSITY_COUNTS] / (float(num_frames) * spacing ** 3)
+    f_out = create_out_fname(cfg[DUMP_FILE_LIST], suffix='_density', ext='.dx', base_dir=cfg[OUT_BASE_DIR])
+    grid_counts = ' '.join([str(num_voxels)] * 3)
+    # positions are the voxel centers; the data is in C order (the last axis varies fastest)
+    lines = ['# Density of atom types {} from {} frames'.format(','.join(map(str, cfg[DENSITY_ATOM_TYPES])),
+                                                                num_frames),
+             'object 1 class gridpositions counts {}'.format(grid_counts),
+             'origin {0} {0} {0}'.format(repr(grid_min + spacing / 2)),
+             'delta {} 0 0'.format(repr(spacing)), 'delta 0 {} 0'.format(repr(spacing)),
+             'delta 0 0 {}'.format(repr(spacing)),
+             'object 2 class gridconnections counts {}'.format(grid_counts),
+             'object 3 class array type double rank 0 items {} data follows'.format(len(densities))]
+    with open(f_out, 'w') as d_file:
+        d_file.write('\n'.join(lines) + '\n')
+        full_rows = len(densities) // 3 * 3
+        np.savetxt(d_file, densities[:full_rows].reshape(-1, 3), fmt='%.6g')
+        if full_rows < len(densities):
+            np.savetxt(d_file, densities[full_rows:].reshape(1, -1), fmt='%.6g')
+        d_file.write('attribute "dep" string "positions"\nobject "density" class field\n'
+                     'component "positions" value 1\ncomponent "connections" value 2\ncomponent "data" value 3\n')
+    if cfg[PRINT_PROGRESS]:
+        print("Wrote file: {}".format(f_out))
+
+
+def print_per_frame_output(base_out_file_name, cfg, data_to_print, out_fieldnames, write_modes):
+    """
+    Writes per-frame results, creating the output file the first time it is written and appending after that
+    @param base_out_file_name: name on which the output file name is based
+    @param cfg: configuration for the run
+    @param data_to_print: list of per-frame results
+    @param out_fieldnames: output columns
+    @param write_modes: dict of base names already written, updated in place
+    """
+    print_per_frame(base_out_file_name, cfg, data_to_print, out_fieldnames,
+                    write_modes.get(base_out_file_name, 'w'))
+    write_modes[base_out_file_name] = 'a'
+
+
+def flush_intermediate_output(cfg, base_out_file_name, out_fieldnames, write_modes, gofr_data, done_files, dump_file,
+                              data_to_print, file_gofr_data, frames_read):
+    """
+    Writes the output collected so far while a dump file is being read
+    @param cfg: configuration for the run
+    @param base_out_file_name: name on which the per-frame output file name is based
+    @param out_fieldnames: per-frame output columns
+    @param write_modes: dict of base names already written, updated in place
+    @param gofr_data: histogram data from the dump files already read
+    @param done_files: list of the dump files already read
+    @param dump_file: name of the dump file being read
+    @param data_to_print: list of per-frame results collected from the current dump file
+    @param file_gofr_data: histogram data collected from the current dump file
+    @param frames_read: number of frames of the current dump file included in file_gofr_data
+    """
+    if cfg[PER_FRAME_OUTPUT]:
+        print_per_frame_output(base_out_file_name, cfg, data_to_print, out_fieldnames, write_modes)
+    if cfg[GOFR_OUTPUT]:
+        gofr_so_far = copy.deepcopy(gofr_data)
+        add_gofr_data(gofr_so_far, file_gofr_data)
+        print_gofr(cfg, gofr_so_far)
+        if cfg[GOFR_CHECKPOINT] is not None:
+            write_gofr_checkpoint(cfg[GOFR_CHECKPOINT], gofr_so_far, cfg[GOFR_DR], done_files,
+                                  partial_file=dump_file, partial_frames=frames_read)
+
+
+def init_worker(cfg, evb_sum):
+    """
+    Stores the data shared by all dump files in a worker process, so it is only sent to each process once
+    @param cfg: configuration for the run
+    @param evb_sum: dict describing the evb summary file, as returned by setup_evb_sum (None if not used)
+    """
+    WORKER_INPUT[CFG] = cfg
+    WORKER_INPUT[EVB_SUM] = evb_sum
+
+
+def read_dump_file_worker(dump_task):
+    """
+    Processes one dump file, or one range of frames from a dump file, in a worker process. Intermediate output is not
+    written, since the results are combined in order by the parent process.
+    @param dump_task: tuple of the name of the dump file to read and either None (to read the whole file) or an array
+        of the byte offsets of the frames to read (see split_dump_frames)
+    @return: the per-frame results, gofr data, and MSD, residence time, and density grid accumulators collected,
+        whether more than MAX_TIMESTEPS frames were found, whether all frames read were complete, and the last
+        timestep read
+    """
+    dump_file, frame_offsets = dump_task
+    cfg = WORKER_INPUT[CFG]
+    file_gofr_data = new_gofr_data(cfg)
+    task_msd_data = new_msd_data(cfg)
+    task_res_data = new_res_data()
+    task_density_data = new_density_data(cfg) if len(cfg[DENSITY_ATOM_TYPES]) > 0 else None
+    dump_frames = read_dump_frames(dump_file, frame_offsets=frame_offsets, single=cfg[SINGLE_DUMP_BIN])
+    data_to_print, reached_max_steps, full_frame, timestep = process_dump_frames(
+        dump_frames, dump_file, cfg, file_gofr_data, task_msd_data, task_res_data, task_density_data,
+        WORKER_INPUT[EVB_SUM])
+    # the frames left over are correlated here, rather than in the parent process
+    if cfg[MSD_OUTPUT]:
+        add_msd_pending(cfg, task_msd_data)
+    if cfg[CALC_RES_TIME]:
+        add_res_pending(cfg, task_res_data)
+    return (data_to_print, file_gofr_data, task_msd_data, task_res_data, task_density_data, reached_max_steps,
+            full_frame, timestep)
+
+
+def setup_dump_tasks(cfg, dump_file_list):
+    """
+    Divides the work of reading the dump files among worker processes. If there are at least as many dump files as
+    workers, each dump file is a task. Otherwise, each dump file is split into contiguous ranges of frames (found
+    with the dump file index) so that all the workers have frames to process.
+    @param cfg: configuration for the run
+    @param dump_file_list: names of the dump files to read
+    @return: a list, in dump file order, of the list of tasks for each dump file, and a list of the number of frames
+        in each dump file (None if the file was not split)
+    """
+    file_tasks = []
+    file_num_frames = []
+    if len(dump_file_list) >= cfg[NUM_WORKERS]:
+        for dump_file in dump_file_list:
+            file_tasks.append([(dump_file, None)])
+            file_num_frames.append(None)
+        return file_tasks, file_num_frames
+    chunks_per_file = -(-cfg[NUM_WORKERS] // len(dump_file_list))
+    for dump_file in dump_file_list:
+        frame_chunks, num_frames = split_dump_frames(dump_file, chunks_per_file, max_frames=cfg[MAX_TIMESTEPS],
+                                                     timesteps=cfg[ONLY_STEPS])
+        file_tasks.append([(dump_file, frame_offsets) for frame_offsets in frame_chunks])
+        file_num_frames.append(num_frames)
+    return file_tasks, file_num_frames
+
+
+def collect_dump_results(cfg, dump_file, task_results, num_frames, msd_data, res_data, density_data):
+    """
+    Combines, in order, the results from the tasks for one dump file. As when reading the file in series, results
+    after the first incomplete frame are discarded.
+    @param cfg: configuration for the run
+    @param dump_file: name of the dump file read
+    @param task_results: iterator of results from read_dump_file_worker, in frame order
+    @param num_frames: number of frames in the dump file if it was split into ranges of frames, otherwise None
+    @param msd_data: dict of MSD accumulators for the frames before this dump file, updated in place
+    @param res_data: dict of residence time accumulators for the frames before this dump file, updated in place
+    @param density_data: dict of density grid accumulators, updated in place (None if not used)
+    @return: the per-frame results and gofr data for the dump file
+    """
+    data_to_print = []
+    file_gofr_data = new_gofr_data(cfg)
+    reached_max_steps = False
+    full_frame = True
+    timestep = None
+    for (task_data, task_gofr_data, task_msd_data, task_res_data, task_density_data, task_max_steps,
+         task_full_frame, task_timestep) in task_results:
+        if not full_frame:
+            continue
+        data_to_print += task_data
+        add_gofr_data(file_gofr_data, task_gofr_data)
+        if cfg[MSD_OUTPUT]:
+            add_msd_data(cfg, msd_data, task_msd_data)
+        if cfg[CALC_RES_TIME]:
+            add_res_data(cfg, res_data, task_res_data)
+        if density_data is not None:
+            add_density_data(density_data, task_density_data)
+        reached_max_steps = reached_max_steps or task_max_steps
+        full_frame = task_full_frame
+        if task_timestep is not None:
+            timestep = task_timestep
+    if num_frames is not None and full_frame:
+        reached_max_steps = num_frames > cfg[MAX_TIMESTEPS]
+    report_dump_file_read(cfg, dump_file, reached_max_steps, full_frame, timestep)
+    return data_to_print, file_gofr_data
+
+
+def resume_gofr_checkpoint(cfg, dump_file_list, gofr_data):
+    """
+    Reads the g(r) checkpoint to resume from, making sure it was written for the same RDFs and list of dump files
+    @param cfg: configuration for the run
+    @param dump_file_list: names of the dump files to read
+    @param gofr_data: empty histogram data for the requested RDFs, as made by new_gofr_data
+    @return: the histogram data from the checkpoint, the number of dump files already read, and the number of frames
+        already read from the next dump file
+    """
+    chk_gofr_data, g_dr, done_files, partial_file, partial_frames = read_gofr_checkpoint(cfg[GOFR_CHECKPOINT])
+    check_gofr_match(gofr_data, chk_gofr_data, cfg[GOFR_CHECKPOINT])
+    num_done = len(done_files)
+    if done_files != dump_file_list[:num_done] or (partial_frames > 0 and dump_file_list[num_done:num_done + 1] !=
+                                                   [partial_file]):
+        raise InvalidDataError("The g(r) checkpoint file {} was not written while reading the dump files listed "
+                               "for this run.".format(cfg[GOFR_CHECKPOINT]))
+    if partial_frames > 0 and cfg[NUM_WORKERS] > 1:
+        raise InvalidDataError("The g(r) checkpoint file {} was written part way through dump file {}. To "
+                               "resume, set '{}' to 1.".format(cfg[GOFR_CHECKPOINT], partial_file, NUM_WORKERS))
+    if cfg[PRINT_PROGRESS]:
+        print("Resuming from g(r) checkpoint {}: {} dump file(s) and {} frame(s) of the next already read."
+              "".format(cfg[GOFR_CHECKPOINT], num_done, partial_frames))
+    return chk_gofr_data, num_done, partial_frames
+
+
 def process_dump_files(cfg):
     """
     @param cfg: configuration data read from ini file
@@ -1054,62 +2970,94 @@ def process_dump_files(cfg):
                                "of a single dump file with the keyword '{}' or a file listing dump files with the "
                                "keyword '{}'.".format(DUMP_FILE, DUMP_FILE_LIST))
 
-    gofr_data = {}
-    evb_dict = {}
-    out_fieldnames = None
+    evb_sum = None
+    out_fieldnames = []
 
     # If RDFs are to be calculated, initialize empty data structures
-    if cfg[GOFR_OUTPUT]:
-        g_dr = cfg[GOFR_DR]
-        g_max = cfg[GOFR_MAX]
-        gofr_data[GOFR_BINS] = np.arange(0.0, g_max + g_dr, g_dr)
-        if len(gofr_data[GOFR_BINS]) < 2:
-            raise InvalidDataError("Insufficient number of bins to calculate RDFs. Check input: "
-                                   "{}: {}, {}: {},".format(GOFR_DR, cfg[GOFR_DR], GOFR_MAX, cfg[GOFR_MAX]))
-        if cfg[CALC_HO_GOFR]:
-            ini_gofr_data(gofr_data, HO_BIN_COUNT, GOFR_BINS, HO_STEPS_COUNTED)
-        if cfg[CALC_OO_GOFR]:
-            ini_gofr_data(gofr_data, OO_BIN_COUNT, GOFR_BINS, OO_STEPS_COUNTED)
-        if cfg[CALC_HH_GOFR]:
-            ini_gofr_data(gofr_data, HH_BIN_COUNT, GOFR_BINS, HH_STEPS_COUNTED)
-        if cfg[CALC_OH_GOFR]:
-            ini_gofr_data(gofr_data, OH_BIN_COUNT, GOFR_BINS, OH_STEPS_COUNTED)
-        if cfg[CALC_TYPE_GOFR]:
-            ini_gofr_data(gofr_data, TYPE_BIN_COUNT, GOFR_BINS, TYPE_STEPS_COUNTED)
+    gofr_data = new_gofr_data(cfg)
+    msd_data = new_msd_data(cfg)
+    res_data = new_res_data()
+    if len(cfg[DENSITY_ATOM_TYPES]) > 0:
+        density_data = new_density_data(cfg)
+    else:
+        density_data = None
 
     if cfg[PER_FRAME_OUTPUT]:
         out_fieldnames = setup_per_frame_output(cfg)
+        cfg[CALC_PLAN] = plan_calcs(out_fieldnames)
+    else:
+        cfg[CALC_PLAN] = []
 
     if cfg[EVB_SUM_FILE] is not None:
-        evb_dict = read_csv_to_dict(cfg[EVB_SUM_FILE], cfg[ALIGN_COL])
-        evb_headers = read_csv_header(cfg[EVB_SUM_FILE])
-        cfg[EVB_SUM_HEADERS] = []
-        for header in evb_headers:
-            if header not in out_fieldnames:
-                cfg[EVB_SUM_HEADERS].append(header)
-        if cfg[CALC_CEC_DIST]:
-            for header in [CEC_X, CEC_Y, CEC_Z]:
-                if header not in cfg[EVB_SUM_HEADERS]:
-                    raise InvalidDataError("If '{}' is set to True, these headers must be found in the '{}': {}."
-                                           "".format(CALC_CEC_DIST, EVB_SUM_FILE, [CEC_X, CEC_Y, CEC_Z]))
+        evb_sum = setup_evb_sum(cfg, out_fieldnames)
         out_fieldnames += cfg[EVB_SUM_HEADERS]
 
-    per_frame_write_mode = 'w'
-    base_out_file_name = cfg[DUMP_FILE_LIST]
-    for dump_file in dump_file_list:
-        data_to_print = []
-        # output file base name to change at each iteration if not combining output
-        if cfg[COMBINE_OUTPUT] is False:
-            base_out_file_name = dump_file
-        read_dump_file(dump_file, cfg, data_to_print, gofr_data, out_fieldnames, per_frame_write_mode, evb_dict)
-        if cfg[PER_FRAME_OUTPUT]:
-            print_per_frame(base_out_file_name, cfg, data_to_print, out_fieldnames, per_frame_write_mode)
-        # if combining files, after first loop, always append to file
-        if cfg[COMBINE_OUTPUT]:
-            per_frame_write_mode = 'a'
+    # output file base name is the dump file name unless combining output
+    if cfg[COMBINE_OUTPUT]:
+        base_out_file_names = [cfg[DUMP_FILE_LIST]] * len(dump_file_list)
+    else:
+        base_out_file_names = dump_file_list
+    per_frame_write_modes = {}
+    if cfg[CALC_HIJ_NEW] and cfg[NEW_SWEEP] is not None:
+        print_new_sweep(base_out_file_names[0], cfg)
+
+    done_files = []
+    frames_done = 0
+    if cfg[GOFR_RESUME]:
+        gofr_data, num_done, frames_done = resume_gofr_checkpoint(cfg, dump_file_list, gofr_data)
+        done_files = dump_file_list[:num_done]
+        # per-frame output already written is appended to
+        for base_out_file_name in base_out_file_names[:num_done + (frames_done > 0)]:
+            per_frame_write_modes[base_out_file_name] = 'a'
+
+    if cfg[MAKE_DUMP_BIN]:
+        for dump_file in dump_file_list[len(done_files):]:
+            get_dump_bin(dump_file, single=cfg[SINGLE_DUMP_BIN])
+
+    pool = None
+    file_tasks = []
+    if cfg[NUM_WORKERS] > 1 and len(done_files) < len(dump_file_list):
+        # Results are collected in the order of the dump file list, and of the frames within each dump file
+        file_tasks, file_num_frames = setup_dump_tasks(cfg, dump_file_list[len(done_files):])
+        all_tasks = [dump_task for dump_tasks in file_tasks for dump_task in dump_tasks]
+        pool = Pool(max(min(cfg[NUM_WORKERS], len(all_tasks)), 1), initializer=init_worker,
+                    initargs=(cfg, evb_sum))
+        task_results = pool.imap(read_dump_file_worker, all_tasks)
+
+    try:
+        for task_index, dump_file in enumerate(dump_file_list[len(done_files):]):
+            base_out_file_name = base_out_file_names[len(done_files)]
+            if pool is None:
+                file_gofr_data = new_gofr_data(cfg)
+                flush_output = partial(flush_intermediate_output, cfg, base_out_file_name, out_fieldnames,
+                                       per_frame_write_modes, gofr_data, done_files, dump_file)
+                data_to_print = read_dump_file(dump_file, cfg, file_gofr_data, msd_data, res_data, density_data,
+                                               evb_sum, flush_output=flush_output, frames_done=frames_done)
+                frames_done = 0
+            else:
+                print_reading(cfg, dump_file)
+                data_to_print, file_gofr_data = collect_dump_results(
+                    cfg, dump_file, islice(task_results, len(file_tasks[task_index])), file_num_frames[task_index],
+                    msd_data, res_data, density_data)
+            add_gofr_data(gofr_data, file_gofr_data)
+            if cfg[PER_FRAME_OUTPUT]:
+                print_per_frame_output(base_out_file_name, cfg, data_to_print, out_fieldnames, per_frame_write_modes)
+            done_files.append(dump_file)
+            if cfg[GOFR_CHECKPOINT] is not None:
+                write_gofr_checkpoint(cfg[GOFR_CHECKPOINT], gofr_data, cfg[GOFR_DR], done_files)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
     if cfg[GOFR_OUTPUT]:
         print_gofr(cfg, gofr_data)
+    if cfg[MSD_OUTPUT]:
+        print_msd(cfg, msd_data)
+    if cfg[CALC_RES_TIME]:
+        print_res_time(cfg, res_data)
+    if density_data is not None:
+        print_density(cfg, density_data)
 
 
 def main(argv=None):
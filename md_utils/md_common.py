@@ -7,6 +7,7 @@ Common methods for this project.
 from __future__ import print_function, division
 # Util Methods #
 import argparse
+import bz2
 import collections
 import csv
 import difflib
@@ -16,14 +17,31 @@ import re
 import shutil
 import errno
 import fnmatch
-from itertools import chain, islice
+import gzip
+import hashlib
+import io
+from itertools import chain, islice, product
 import math
+import mmap
 import numpy as np
 import os
 from shutil import copy2, Error, copystat
 import six
+from six.moves import queue
 import sys
+import tempfile
+import threading
 from contextlib import contextmanager
+from io import BytesIO
+
+try:
+    import lzma
+except ImportError:
+    # python 2 only has lzma (for xz files) if backports.lzma is installed
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
 
 
 # Constants #
@@ -59,6 +77,49 @@ HEAD_CONTENT = 'head_content'
 ATOMS_CONTENT = 'atoms_content'
 TAIL_CONTENT = 'tail_content'
 
+# For dump frames read into numpy arrays
+TIMESTEP = 'timestep'
+BOX = 'box'
+ATOM_NUM = 'atom_num'
+MOL_NUM = 'mol_num'
+ATOM_TYPE = 'atom_type'
+CHARGE = 'charge'
+XYZ_COORDS = 'xyz'
+# id mol type q x y z
+DUMP_ATOM_COLS = 7
+
+# For indexing dump files
+DUMP_INDEX_EXT = '.idx.npz'
+DUMP_TIMESTEP_BYTES = b'ITEM: TIMESTEP'
+DUMP_HEAD_LINES = 9
+DUMP_HEAD_SECTIONS = [(0, SEC_TIMESTEP), (2, SEC_NUM_ATOMS), (4, SEC_BOX_SIZE), (8, SEC_ATOMS)]
+IDX_TIMESTEPS = 'timesteps'
+IDX_OFFSETS = 'offsets'
+IDX_NUM_ATOMS = 'num_atoms'
+IDX_BOXES = 'boxes'
+IDX_FILE_SIZE = 'file_size'
+IDX_MTIME = 'mtime'
+# For reading only some of the atom lines of sorted dump file timesteps
+MAX_INTERP_PROBES = 8
+MAX_SPARSE_ATOM_FRAC = 0.2
+
+# For binary caches of dump files (see make_dump_bin)
+DUMP_BIN_EXT = '.bin'
+DUMP_BIN_VERSION = 3
+NPY_MAGIC = b'\x93NUMPY'
+DUMP_BIN_META_DTYPE = np.dtype([('version', '<i8'), ('src_size', '<i8'), ('src_mtime', '<f8'),
+                                ('coord_dtype', 'S3')])
+DUMP_BIN_DOUBLE = np.dtype('<f8')
+DUMP_BIN_TABLE_DTYPE = np.dtype([('id', '<i8'), ('mol', '<i8'), ('type', '<i8'), ('q', '<f8')])
+
+# For reading compressed files
+GZIP = 'gzip'
+BZ2 = 'bz2'
+XZ = 'xz'
+COMPRESS_MAGIC = [(b'\x1f\x8b', GZIP), (b'BZh', BZ2), (b'\xfd7zXZ\x00', XZ)]
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+DECOMPRESS_QUEUE_LEN = 4
+
 # Lammps-specific sections
 MASSES = 'Masses'
 PAIR_COEFFS = 'Pair Coeffs'
@@ -191,7 +252,132 @@ def pbc_calc_vector(a, b, box):
     @return: returns the vector a - b
     """
     vec = np.subtract(a, b)
-    return vec - np.multiply(box, np.asarray(list(map(round, vec / box))))
+    return vec - np.multiply(box, np.rint(vec / box))
+
+
+def pbc_calc_vectors(a, b, box, dtype=None):
+    """
+    Finds the vectors between points, applying the minimum image convention, for many points at once. The
+    coordinate arrays are broadcast against each other, so they can be paired (N x 3 and N x 3), one-to-many
+    (3 and N x 3), or, with an added axis, many-to-many (N x 1 x 3 and M x 3; see pbc_pair_dists).
+    @param a: xyz coords (last axis has length 3)
+    @param b: xyz coords (last axis has length 3)
+    @param box: vector with PBC box dimensions
+    @param dtype: optional numpy dtype (e.g. np.float32) for the calculation; by default, float64 is used
+    @return: array of the vectors a - b
+    """
+    if dtype is None:
+        dtype = np.float64
+    vec = np.subtract(np.asarray(a, dtype=dtype), np.asarray(b, dtype=dtype))
+    box = np.asarray(box, dtype=dtype)
+    vec -= box * np.rint(vec / box)
+    return vec
+
+
+def pbc_dists(a, b, box, dtype=None):
+    """
+    Finds the minimum image distances between points; see pbc_calc_vectors for the allowed input shapes
+    @param a: xyz coords (last axis has length 3)
+    @param b: xyz coords (last axis has length 3)
+    @param box: vector with PBC box dimensions
+    @param dtype: optional numpy dtype (e.g. np.float32) for the calculation
+    @return: array of distances, with the broadcast shape of the inputs without their last axis
+    """
+    vec = pbc_calc_vectors(a, b, box, dtype=dtype)
+    return np.sqrt(np.einsum('...i,...i->...', vec, vec))
+
+
+def pbc_pair_dists(a_coords, b_coords, box, dtype=None):
+    """
+    Finds the minimum image distances between each point in one set and each point in another
+    @param a_coords: N x 3 array of xyz coords
+    @param b_coords: M x 3 array of xyz coords
+    @param box: vector with PBC box dimensions
+    @param dtype: optional numpy dtype (e.g. np.float32) for the calculation
+    @return: N x M array of distances
+    """
+    a_coords = np.asarray(a_coords).reshape(-1, 3)
+    b_coords = np.asarray(b_coords).reshape(-1, 3)
+    return pbc_dists(a_coords[:, np.newaxis, :], b_coords[np.newaxis, :, :], box, dtype=dtype)
+
+
+def pbc_cells(coords, box, num_cells):
+    """
+    Finds the cell of a grid over the periodic box that each point is in
+    @param coords: N x 3 array of xyz coords
+    @param box: vector with PBC box dimensions
+    @param num_cells: array with the number of cells along each box dimension
+    @return: N x 3 integer array of the cell indices of the points (each from 0 to num_cells - 1)
+    """
+    frac_coords = coords / box
+    frac_coords -= np.floor(frac_coords)
+    # the modulo catches points that round to exactly the upper edge of the box
+    return np.floor(frac_coords * num_cells).astype(int) % num_cells
+
+
+def pbc_neighbor_pairs(a_coords, b_coords, box, cutoff, dtype=None):
+    """
+    Finds the pairs of points, one from each set, within the cutoff minimum image distance of each other, using a
+    cell list (linked-cell) search so that only the points in neighboring cells are compared. The box is divided
+    into cells at least as wide as the cutoff; if there are fewer than three cells along any dimension, all pairs
+    are compared instead.
+    @param a_coords: N x 3 array of xyz coords
+    @param b_coords: M x 3 array of xyz coords
+    @param box: vector with PBC box dimensions (orthorhombic box)
+    @param cutoff: the largest distance to return
+    @param dtype: optional numpy dtype (e.g. np.float32) for the distance calculation
+    @return: flat arrays of the indices into a_coords and into b_coords of each pair, and of the pair distances (in
+        no particular order)
+    """
+    a_coords = np.asarray(a_coords, dtype=float).reshape(-1, 3)
+    b_coords = np.asarray(b_coords, dtype=float).reshape(-1, 3)
+    box = np.asarray(box, dtype=float)
+    num_cells = np.floor(box / cutoff).astype(int)
+    if len(a_coords) == 0 or len(b_coords) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+    if np.any(num_cells < 3):
+        dists = pbc_pair_dists(a_coords, b_coords, box, dtype=dtype)
+        pair_a, pair_b = np.nonzero(dists <= cutoff)
+        return pair_a, pair_b, dists[pair_a, pair_b]
+
+    # sort the b points by cell, noting where each cell's points start in the sorted list
+    b_cell_ids = np.ravel_multi_index(pbc_cells(b_coords, box, num_cells).T, num_cells)
+    b_order = np.argsort(b_cell_ids, kind='mergesort')
+    cell_starts = np.searchsorted(b_cell_ids[b_order], np.arange(np.prod(num_cells) + 1))
+    a_cells = pbc_cells(a_coords, box, num_cells)
+    a_indices = np.arange(len(a_coords))
+
+    pairs = []
+    for cell_shift in product((-1, 0, 1), repeat=3):
+        nbr_cell_ids = np.ravel_multi_index(((a_cells + cell_shift) % num_cells).T, num_cells)
+        starts = cell_starts[nbr_cell_ids]
+        counts = cell_starts[nbr_cell_ids + 1] - starts
+        num_pairs = counts.sum()
+        if num_pairs == 0:
+            continue
+        # pair each a point with every b point in the neighboring cell
+        pair_a = np.repeat(a_indices, counts)
+        pair_b = b_order[np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(num_pairs)]
+        shift_dists = pbc_dists(a_coords[pair_a], b_coords[pair_b], box, dtype=dtype)
+        in_cutoff = shift_dists <= cutoff
+        pairs.append((pair_a[in_cutoff], pair_b[in_cutoff], shift_dists[in_cutoff]))
+    if len(pairs) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+    return tuple(np.concatenate(pair_vals) for pair_vals in zip(*pairs))
+
+
+def pbc_neighbor_dists(a_coords, b_coords, box, cutoff, dtype=None):
+    """
+    Finds the minimum image distances, no larger than the cutoff, between the points in one set and the points in
+    another (see pbc_neighbor_pairs)
+    @param a_coords: N x 3 array of xyz coords
+    @param b_coords: M x 3 array of xyz coords
+    @param box: vector with PBC box dimensions (orthorhombic box)
+    @param cutoff: the largest distance to return
+    @param dtype: optional numpy dtype (e.g. np.float32) for the distance calculation
+    @return: flat array of the distances (in no particular order)
+    """
+    return pbc_neighbor_pairs(a_coords, b_coords, box, cutoff, dtype=dtype)[2]
 
 
 def first_pbc_image(xyz_coords, box):
@@ -265,6 +451,35 @@ def vec_dihedral(vec_ba, vec_bc, vec_cd):
     return np.degrees(np.arctan2(y, x))
 
 
+def vec_angles(vecs_1, vecs_2):
+    """
+    Calculates the angles between many pairs of vectors at once (see vec_angle)
+    Note: assumes the vector calculation accounted for the PBC
+    @param vecs_1: array of vectors (last axis has length 3)
+    @param vecs_2: array of vectors, broadcast against vecs_1
+    @return: array of the angles between the vectors, in degrees
+    """
+    cos_angles = np.einsum('...i,...i->...', vecs_1, vecs_2) / (np.linalg.norm(vecs_1, axis=-1) *
+                                                                np.linalg.norm(vecs_2, axis=-1))
+    return np.rad2deg(np.arccos(np.clip(cos_angles, -1.0, 1.0)))
+
+
+def vec_dihedrals(vecs_ba, vecs_bc, vecs_cd):
+    """
+    Calculates many dihedral angles at once (see vec_dihedral)
+    @param vecs_ba: array of the vectors connecting points b --> a, accounting for pbc (last axis has length 3)
+    @param vecs_bc: b --> c
+    @param vecs_cd: c --> d
+    @return: array of dihedral angles in degrees
+    """
+    vecs_bc = vecs_bc / np.linalg.norm(vecs_bc, axis=-1, keepdims=True)
+    v = vecs_ba - np.einsum('...i,...i->...', vecs_ba, vecs_bc)[..., np.newaxis] * vecs_bc
+    w = vecs_cd - np.einsum('...i,...i->...', vecs_cd, vecs_bc)[..., np.newaxis] * vecs_bc
+    x = np.einsum('...i,...i->...', v, w)
+    y = np.einsum('...i,...i->...', np.cross(vecs_bc, v), w)
+    return np.degrees(np.arctan2(y, x))
+
+
 # Other #
 
 def chunk(seq, chunk_size, process=iter):
@@ -284,6 +499,155 @@ def chunk(seq, chunk_size, process=iter):
 
 # I/O #
 
+def compression_type(fname):
+    """
+    Checks the first bytes of a file for the signature of the compression formats that can be read with open_input
+    @param fname: name of the file to check
+    @return: GZIP, BZ2, or XZ, or None if the file is not compressed in one of these formats
+    :raises: IOError if the file can't be opened for reading.
+    """
+    with open(fname, 'rb') as f:
+        file_start = f.read(max(len(magic) for magic, c_type in COMPRESS_MAGIC))
+    for magic, c_type in COMPRESS_MAGIC:
+        if file_start.startswith(magic):
+            return c_type
+    return None
+
+
+class BackgroundDecompressor(io.RawIOBase):
+    """
+    A read-only binary stream of the decompressed contents of a gzip, bz2, or xz file. A background thread reads
+    the file in DECOMPRESS_CHUNK_SIZE chunks of decompressed data, keeping up to DECOMPRESS_QUEUE_LEN chunks ready,
+    so that decompressing (which does not hold the GIL) overlaps parsing the data already read. As with the
+    gzip, bz2, and lzma modules, seeking is emulated: seeking forward reads and discards data, and seeking backward
+    starts again from the beginning of the file.
+    """
+    def __init__(self, fname, c_type):
+        io.RawIOBase.__init__(self)
+        self.name = fname
+        self.c_type = c_type
+        self._pos = 0
+        self._chunk = memoryview(b'')
+        self._chunk_pos = 0
+        self._start()
+
+    def _start(self):
+        self._queue = queue.Queue(DECOMPRESS_QUEUE_LEN)
+        self._stop = threading.Event()
+        self._eof = False
+        self._thread = threading.Thread(target=self._decompress, args=(self._queue, self._stop))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _end(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _decompress(self, chunk_queue, stop):
+        c_open = {GZIP: gzip.open, BZ2: bz2.BZ2File, XZ: lzma.open if lzma else None}[self.c_type]
+        try:
+            with c_open(self.name, 'rb') as c_file:
+                while not stop.is_set():
+                    chunk = c_file.read(DECOMPRESS_CHUNK_SIZE)
+                    self._put(chunk_queue, stop, chunk)
+                    if len(chunk) == 0:
+                        return
+        except Exception as e:
+            # passed on to be raised when the data is read
+            self._put(chunk_queue, stop, e)
+
+    @staticmethod
+    def _put(chunk_queue, stop, item):
+        while not stop.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _next_chunk(self):
+        """
+        @return: False if the end of the data was reached, after making the next decompressed chunk current
+        """
+        if self._eof:
+            return False
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            self._eof = True
+            raise IOError("Could not decompress {} file {}: {}".format(self.c_type, self.name, item))
+        if len(item) == 0:
+            self._eof = True
+            return False
+        self._chunk = memoryview(item)
+        self._chunk_pos = 0
+        return True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        if self._chunk_pos == len(self._chunk) and not self._next_chunk():
+            return 0
+        num_bytes = min(len(b), len(self._chunk) - self._chunk_pos)
+        b[:num_bytes] = self._chunk[self._chunk_pos:self._chunk_pos + num_bytes]
+        self._chunk_pos += num_bytes
+        self._pos += num_bytes
+        return num_bytes
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            self._pos += len(self._chunk) - self._chunk_pos
+            while self._next_chunk():
+                self._pos += len(self._chunk)
+            self._chunk_pos = len(self._chunk)
+            offset += self._pos
+        if offset < self._pos:
+            self._end()
+            self._pos = 0
+            self._chunk = memoryview(b'')
+            self._chunk_pos = 0
+            self._start()
+        while self._pos < offset and (self._chunk_pos < len(self._chunk) or self._next_chunk()):
+            num_bytes = min(offset - self._pos, len(self._chunk) - self._chunk_pos)
+            self._chunk_pos += num_bytes
+            self._pos += num_bytes
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._end()
+        io.RawIOBase.close(self)
+
+
+def open_input(fname, mode='r'):
+    """
+    Opens a file for reading like open(), except that files compressed with gzip, bz2, or xz (as found from their
+    first bytes by compression_type) are decompressed as they are read, in a background thread (see
+    BackgroundDecompressor). Compressed input can thus be read directly, without first decompressing it to disk.
+    @param fname: name of the file to read
+    @param mode: 'r' (text) or 'rb' (binary)
+    @return: a file object that can be used as a context manager
+    :raises: IOError if the file can't be opened for reading (or the xz module is not available for an xz file).
+    """
+    c_type = compression_type(fname)
+    if c_type is None:
+        return open(fname, mode)
+    if c_type == XZ and lzma is None:
+        raise IOError("Reading xz file {} requires the lzma module (backports.lzma for python 2)".format(fname))
+    c_stream = io.BufferedReader(BackgroundDecompressor(fname, c_type), DECOMPRESS_CHUNK_SIZE)
+    if 'b' in mode:
+        return c_stream
+    return io.TextIOWrapper(c_stream)
+
+
 def read_tpl(tpl_loc):
     """Attempts to read the given template location and throws A
     TemplateNotReadableError if it can't read the given location.
@@ -369,7 +733,7 @@ def np_float_array_from_file(data_file, delimiter=" ", header=False, gather_hist
     """
     header_row = None
     hist_data = {}
-    with open(data_file) as csv_file:
+    with open_input(data_file) as csv_file:
         csv_list = list(csv.reader(csv_file, delimiter=delimiter))
     if header:
         header_row = csv_list[0]
@@ -431,7 +795,7 @@ def read_csv_to_list(data_file, delimiter=',', header=False):
     @return: a list containing the data (removing header row, if one is specified) and a list containing the
              header row (empty if no header row specified)
     """
-    with open(data_file) as csv_file:
+    with open_input(data_file) as csv_file:
         csv_list = list(csv.reader(csv_file, delimiter=delimiter, quoting=csv.QUOTE_NONNUMERIC))
 
     header_row = []
@@ -638,7 +1002,7 @@ def read_csv_header(src_file):
     @param src_file: The CSV file to read.
     @return: The first row or None if empty.
     """
-    with open(src_file) as csv_file:
+    with open_input(src_file) as csv_file:
         for row in csv.reader(csv_file):
             return list(row)
 
@@ -677,7 +1041,7 @@ def read_csv(src_file, data_conv=None, all_conv=None, quote_style=csv.QUOTE_MINI
     @return: A list of dicts containing the file's data.
     """
     result = []
-    with open(src_file) as csv_file:
+    with open_input(src_file) as csv_file:
         csv_reader = csv.DictReader(csv_file, quoting=quote_style)
         for line in csv_reader:
             result.append(convert_dict_line(all_conv, data_conv, line))
@@ -698,7 +1062,7 @@ def read_csv_to_dict(src_file, col_name, data_conv=None, all_conv=None):
     @return: A list of dicts containing the file's data.
     """
     result = {}
-    with open(src_file) as csv_file:
+    with open_input(src_file) as csv_file:
         try:
             csv_reader = csv.DictReader(csv_file, quoting=csv.QUOTE_NONNUMERIC)
             create_dict(all_conv, col_name, csv_reader, data_conv, result, src_file)
@@ -1238,6 +1602,805 @@ def find_dump_section_state(line, sec_timestep=SEC_TIMESTEP, sec_num_atoms=SEC_N
         return sec_atoms
 
 
+def dump_atom_columns(atom_array):
+    """
+    Splits an array of dump atom rows into columns
+    @param atom_array: (n, 7) array of "id mol type q x y z" values
+    @return: dict of numpy arrays for the atom ids, molecule ids, atom types, charges, and (n, 3) xyz coordinates
+    """
+    return {ATOM_NUM: atom_array[:, 0].astype(int),
+            MOL_NUM: atom_array[:, 1].astype(int),
+            ATOM_TYPE: atom_array[:, 2].astype(int),
+            CHARGE: atom_array[:, 3],
+            XYZ_COORDS: np.ascontiguousarray(atom_array[:, 4:DUMP_ATOM_COLS]),
+            }
+
+
+def parse_dump_atoms(atom_lines, dump_file, timestep):
+    """
+    Converts the atom lines of one dump file timestep into columns of numpy arrays. Reading stops at the first line
+    with fewer than the expected number of columns (as happens at the end of a dump file that was cut off), so the
+    arrays may be shorter than the number of atoms in the timestep's header.
+    @param atom_lines: list of strings, each with "id mol type q x y z" (additional columns are ignored)
+    @param dump_file: name of the file being read (for error messages)
+    @param timestep: timestep being read (for error messages)
+    @return: dict of numpy arrays, as returned by dump_atom_columns
+    """
+    num_complete = len(atom_lines)
+    try:
+        atom_array = np.loadtxt(atom_lines, usecols=range(DUMP_ATOM_COLS), ndmin=2) if num_complete else None
+    except ValueError:
+        # Either an incomplete line (only expected at the end of a file) or a line that cannot be read
+        for line_num, line in enumerate(atom_lines):
+            if len(line.split()) < DUMP_ATOM_COLS:
+                num_complete = line_num
+                break
+        try:
+            atom_array = np.loadtxt(atom_lines[:num_complete], usecols=range(DUMP_ATOM_COLS),
+                                    ndmin=2) if num_complete else None
+        except ValueError as e:
+            raise InvalidDataError("Could not read atom data in file {} timestep {}: {}".format(dump_file,
+                                                                                                timestep, e))
+    if atom_array is None:
+        atom_array = np.empty((0, DUMP_ATOM_COLS))
+    return dump_atom_columns(atom_array)
+
+
+def read_dump_atom_block(dump_map, num_atoms, dump_file, timestep):
+    """
+    Parses the atoms section of one timestep directly from a memory-mapped dump file. The section ends at the next
+    "ITEM: TIMESTEP" (or the end of the file), so the whole byte range is handed to numpy at once. If that range
+    holds anything other than exactly num_atoms complete atom lines (a cut-off file or unexpected lines), the atoms
+    are instead read line by line so that the same checks as before are applied.
+    @param dump_map: mmap of the dump file, positioned at the first atom line
+    @param num_atoms: the number of atoms listed in the timestep header
+    @param dump_file: name of the file being read (for error messages)
+    @param timestep: timestep being read (for error messages)
+    @return: dict of numpy arrays, as returned by dump_atom_columns; the mmap is left positioned after the atoms
+    """
+    block_start = dump_map.tell()
+    block_end = dump_map.find(DUMP_TIMESTEP_BYTES, block_start)
+    if block_end < 0:
+        block_end = dump_map.size()
+    try:
+        atom_array = np.loadtxt(BytesIO(dump_map[block_start:block_end]), usecols=range(DUMP_ATOM_COLS), ndmin=2)
+        if len(atom_array) == num_atoms:
+            dump_map.seek(block_end)
+            return dump_atom_columns(atom_array)
+    except ValueError:
+        pass
+    atom_lines = []
+    for _ in range(num_atoms):
+        line = dump_map.readline()
+        if len(line) == 0:
+            break
+        atom_lines.append(line.decode())
+    return parse_dump_atoms(atom_lines, dump_file, timestep)
+
+
+def read_dump_atom_stream(dump_stream, num_atoms, dump_file, timestep):
+    """
+    Like read_dump_atom_block, but for a dump file that can only be read as a stream (a compressed dump file, see
+    open_dump), so the next num_atoms lines are read and handed to numpy at once
+    @param dump_stream: binary stream of the dump file, positioned at the first atom line
+    @param num_atoms: the number of atoms listed in the timestep header
+    @param dump_file: name of the file being read (for error messages)
+    @param timestep: timestep being read (for error messages)
+    @return: dict of numpy arrays, as returned by dump_atom_columns; the stream is left positioned after the atoms
+    """
+    atom_lines = list(islice(dump_stream, num_atoms))
+    try:
+        atom_array = np.loadtxt(BytesIO(b''.join(atom_lines)), usecols=range(DUMP_ATOM_COLS), ndmin=2)
+        if len(atom_array) == num_atoms:
+            return dump_atom_columns(atom_array)
+    except ValueError:
+        pass
+    return parse_dump_atoms([line.decode() for line in atom_lines], dump_file, timestep)
+
+
+@contextmanager
+def open_dump(dump_file):
+    """
+    Opens a dump file for reading by the dump file readers: an uncompressed file is memory-mapped, and a compressed
+    one (see open_input) is read as a stream, which the readers can only seek by reading through
+    @param dump_file: name of the dump file
+    @return: context manager giving the mmap or binary stream of the dump file
+    """
+    if compression_type(dump_file) is not None:
+        with open_input(dump_file, 'rb') as dump_stream:
+            yield dump_stream
+        return
+    with open(dump_file, 'rb') as d:
+        if os.fstat(d.fileno()).st_size == 0:
+            yield BytesIO()
+            return
+        dump_map = mmap.mmap(d.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield dump_map
+        finally:
+            dump_map.close()
+
+
+def read_dump_frames(dump_file, frame_offsets=None, single=False, read_bin=True):
+    """
+    Reads a lammps dump file (atoms written as "id mol type q x y z"), one timestep at a time. Instead of creating
+    python objects for each atom, each timestep's atom data is returned as columns of numpy arrays, parsed from a
+    memory map of the file (or, for a compressed file, from the stream of its decompressed data; see open_dump).
+    If the dump file has an up-to-date binary cache, or is one (see find_dump_bin), it is read instead, without
+    parsing (see read_dump_bin).
+    @param dump_file: name of the dump file to read
+    @param frame_offsets: optional byte offsets (from get_dump_index) of the timesteps to read; if None, all
+        timesteps are read in order
+    @param single: if True, a binary cache with 32-bit coordinates may be read in place of the dump file (see
+        find_dump_bin)
+    @param read_bin: if False, the dump file itself is parsed even if it has a binary cache (as when making one)
+    @return: generator of dicts, one per timestep, with the timestep, the number of atoms from the header, box
+        lengths, header lines, and the atom arrays from dump_atom_columns. If the dump file was cut off, the last
+        timestep returned will have fewer atoms than its header specified.
+    """
+    bin_file = find_dump_bin(dump_file, single=single) if read_bin else None
+    if bin_file is not None:
+        for frame in read_dump_bin(bin_file, frame_offsets=frame_offsets, single=single):
+            yield frame
+        return
+    with open_dump(dump_file) as dump_map:
+        if frame_offsets is None:
+            for frame in iter_dump_frames(dump_map, dump_file):
+                yield frame
+        else:
+            for offset in frame_offsets:
+                dump_map.seek(int(offset))
+                for frame in iter_dump_frames(dump_map, dump_file):
+                    yield frame
+                    break
+
+
+def iter_dump_frames(dump_map, dump_file):
+    """
+    Reads timesteps from the current position of a memory-mapped dump file (or the stream of a compressed one)
+    @param dump_map: mmap or binary stream of the dump file, as from open_dump
+    @param dump_file: name of the dump file (for error messages)
+    @return: generator of frame dicts, as described in read_dump_frames
+    """
+    read_atoms = read_dump_atom_block if isinstance(dump_map, mmap.mmap) else read_dump_atom_stream
+    section = None
+    frame = None
+    box_counter = 0
+    while True:
+        line = dump_map.readline()
+        if len(line) == 0:
+            break
+        line = line.decode().strip()
+        if section is None:
+            section = find_dump_section_state(line)
+            if section is None:
+                if len(line) == 0:
+                    continue
+                raise InvalidDataError('Unexpected line in file {}: {}'.format(dump_file, line))
+            if section == SEC_TIMESTEP:
+                frame = {TIMESTEP: None, NUM_ATOMS: None, BOX: np.zeros(3), HEAD_CONTENT: []}
+            elif frame is None:
+                raise InvalidDataError('Expected a timestep before line in file {}: {}'.format(dump_file, line))
+            frame[HEAD_CONTENT].append(line)
+            if section == SEC_ATOMS:
+                if frame[NUM_ATOMS] is None:
+                    raise InvalidDataError("Did not find the number of atoms for timestep {} in file "
+                                           "{}".format(frame[TIMESTEP], dump_file))
+                frame.update(read_atoms(dump_map, frame[NUM_ATOMS], dump_file, frame[TIMESTEP]))
+                yield frame
+                section = None
+                frame = None
+        else:
+            frame[HEAD_CONTENT].append(line)
+            if section == SEC_TIMESTEP:
+                try:
+                    frame[TIMESTEP] = int(line)
+                except ValueError as e:
+                    raise InvalidDataError("In attempting to read an integer timestep, "
+                                           "encountered error: {}".format(e))
+                section = None
+            elif section == SEC_NUM_ATOMS:
+                frame[NUM_ATOMS] = int(line)
+                section = None
+            elif section == SEC_BOX_SIZE:
+                split_line = line.split()
+                frame[BOX][box_counter] = float(split_line[1]) - float(split_line[0])
+                box_counter += 1
+                if box_counter == 3:
+                    box_counter = 0
+                    section = None
+
+
+def iter_dump_headers(dump_map):
+    """
+    Finds the start of each timestep of a dump file. In a memory-mapped file, the atom lines are skipped without
+    being read; a compressed file's stream is read line by line.
+    @param dump_map: mmap or binary stream of the dump file, as from open_dump
+    @return: generator of tuples of the byte offset of each timestep and its DUMP_HEAD_LINES (stripped) header lines
+    """
+    if isinstance(dump_map, mmap.mmap):
+        offset = dump_map.find(DUMP_TIMESTEP_BYTES)
+        while offset >= 0:
+            if offset == 0 or dump_map[offset - 1:offset] == b'\n':
+                dump_map.seek(offset)
+                yield offset, [dump_map.readline().decode().strip() for _ in range(DUMP_HEAD_LINES)]
+            offset = dump_map.find(DUMP_TIMESTEP_BYTES, offset + 1)
+    else:
+        offset = 0
+        for line in dump_map:
+            if line.startswith(DUMP_TIMESTEP_BYTES):
+                header = [line] + [dump_map.readline() for _ in range(DUMP_HEAD_LINES - 1)]
+                yield offset, [head_line.decode().strip() for head_line in header]
+                offset += sum(len(head_line) for head_line in header)
+            else:
+                offset += len(line)
+
+
+def build_dump_index(dump_file):
+    """
+    Finds where each timestep starts in a dump file, without reading the atom lines, so that timesteps can be read
+    by seeking directly to them. For a compressed dump file, the offsets are of its decompressed data.
+    @param dump_file: name of the dump file to index
+    @return: dict with numpy arrays of the timesteps, their byte offsets, numbers of atoms, and box lengths, plus the
+        size and modification time of the file that was indexed
+    """
+    timesteps = []
+    offsets = []
+    atom_counts = []
+    boxes = []
+    with open_dump(dump_file) as dump_map:
+        for offset, header in iter_dump_headers(dump_map):
+            # A header cut off at the end of the file has no atoms to read
+            if len(header[-1]) == 0:
+                break
+            for line_num, sec_state in DUMP_HEAD_SECTIONS:
+                if find_dump_section_state(header[line_num]) != sec_state:
+                    raise InvalidDataError('Unexpected line in file {}: {}'.format(dump_file, header[line_num]))
+            try:
+                timesteps.append(int(header[1]))
+            except ValueError as e:
+                raise InvalidDataError("In attempting to read an integer timestep, "
+                                       "encountered error: {}".format(e))
+            offsets.append(offset)
+            atom_counts.append(int(header[3]))
+            boxes.append([float(line.split()[1]) - float(line.split()[0]) for line in header[5:8]])
+    return {IDX_TIMESTEPS: np.array(timesteps, dtype=np.int64),
+            IDX_OFFSETS: np.array(offsets, dtype=np.int64),
+            IDX_NUM_ATOMS: np.array(atom_counts, dtype=np.int64),
+            IDX_BOXES: np.array(boxes, dtype=float).reshape(-1, 3),
+            IDX_FILE_SIZE: os.path.getsize(dump_file),
+            IDX_MTIME: os.path.getmtime(dump_file),
+            }
+
+
+def get_dump_index(dump_file):
+    """
+    Returns the timestep index for a dump file. The index is saved next to the dump file (with DUMP_INDEX_EXT
+    appended to its name) so it only needs to be built once; it is rebuilt if the dump file's size or modification
+    time changes. If the index cannot be saved, it is still returned. If the dump file has an up-to-date binary
+    cache, or is one (see find_dump_bin), the index is instead taken from the cache.
+    @param dump_file: name of the dump file
+    @return: dict as described in build_dump_index
+    """
+    # the index does not depend on the precision of the coordinates in the cache
+    bin_file = find_dump_bin(dump_file, single=True)
+    if bin_file is not None:
+        return dump_bin_index(bin_file)
+    index_file = dump_file + DUMP_INDEX_EXT
+    if os.path.isfile(index_file):
+        try:
+            with np.load(index_file) as saved_index:
+                dump_index = {key: saved_index[key] for key in saved_index.files}
+            if (dump_index[IDX_FILE_SIZE] == os.path.getsize(dump_file) and
+                    dump_index[IDX_MTIME] == os.path.getmtime(dump_file)):
+                return dump_index
+        except (IOError, OSError, ValueError, KeyError) as e:
+            warning("Could not read dump file index {}: {}. Rebuilding the index.".format(index_file, e))
+    dump_index = build_dump_index(dump_file)
+    try:
+        with open(index_file, 'wb') as i_file:
+            np.savez(i_file, **dump_index)
+    except (IOError, OSError) as e:
+        warning("Could not save dump file index {}: {}".format(index_file, e))
+    return dump_index
+
+
+def split_dump_frames(dump_file, num_chunks, max_frames=None, timesteps=None):
+    """
+    Uses the dump file index to split the frames of a dump file into contiguous ranges that can be read
+    independently (e.g. by separate processes) and then combined in order. A compressed dump file can only be read
+    from its start (see open_dump), so its frames are not split.
+    @param dump_file: name of the dump file
+    @param num_chunks: the maximum number of frame ranges to return
+    @param max_frames: if given, only the first max_frames frames are included
+    @param timesteps: if not empty, only frames with these timesteps are included
+    @return: list of numpy arrays of frame byte offsets (one per non-empty range, in file order), and the total
+        number of frames in the file
+    """
+    dump_index = get_dump_index(dump_file)
+    num_frames = len(dump_index[IDX_OFFSETS])
+    frame_positions = np.arange(num_frames)
+    if max_frames is not None:
+        frame_positions = frame_positions[:max_frames]
+    if timesteps is not None and len(timesteps) > 0:
+        frame_positions = frame_positions[np.isin(dump_index[IDX_TIMESTEPS][frame_positions], list(timesteps))]
+    if len(frame_positions) == 0:
+        return [], num_frames
+    if compression_type(dump_file) is not None:
+        num_chunks = 1
+    chunks = np.array_split(frame_positions, min(max(num_chunks, 1), len(frame_positions)))
+    return [dump_index[IDX_OFFSETS][chunk] for chunk in chunks], num_frames
+
+
+def read_dump_line_id(dump_map, line_start, block_end):
+    """
+    Reads one atom line of a memory-mapped dump file
+    @param dump_map: mmap of the dump file
+    @param line_start: byte offset of the start of the line
+    @param block_end: byte offset of the end of the atoms section
+    @return: the line (bytes), the byte offset of the next line, and the atom id (int) at the start of the line
+    @raise: ValueError or IndexError if the line does not start with an integer
+    """
+    line_end = dump_map.find(b'\n', line_start, block_end)
+    line_end = block_end if line_end < 0 else line_end + 1
+    line = dump_map[line_start:line_end]
+    return line, line_end, int(line.split(None, 1)[0])
+
+
+def find_dump_atom_line(dump_map, atom_id, block_start, block_end, start_id, end_id):
+    """
+    Finds the line of one atom in the atoms section of a timestep of a memory-mapped dump file, relying on the atom
+    lines being sorted by atom id (as written with LAMMPS "dump_modify sort id"). The position of the line is
+    interpolated from the atom ids at the ends of the byte range left to search (which takes only one or two probes
+    when, as usual, the atom ids are evenly spaced), switching to bisection after MAX_INTERP_PROBES probes, so that
+    only a few lines are read however many atoms there are.
+    @param dump_map: mmap of the dump file
+    @param atom_id: the atom id (int) to find
+    @param block_start: byte offset of the start of the atom line to search from
+    @param block_end: byte offset of the end of the atoms section
+    @param start_id: the atom id of the line at block_start, or a lower bound for it
+    @param end_id: an atom id greater than that of the last atom line before block_end
+    @return: the atom line (bytes) and the byte offset of the line after it, or None if the atom line was not
+        found (which, if the atom lines are not sorted, does not mean that it is not in the section)
+    """
+    lo = block_start
+    hi = block_end
+    num_probes = 0
+    while lo < hi and start_id <= atom_id < end_id:
+        if num_probes < MAX_INTERP_PROBES:
+            probe = lo + (atom_id - start_id) * (hi - lo) // (end_id - start_id)
+        else:
+            probe = (lo + hi) // 2
+        num_probes += 1
+        line_start = max(dump_map.rfind(b'\n', lo, probe) + 1, lo)
+        try:
+            line, line_end, line_id = read_dump_line_id(dump_map, line_start, hi)
+        except (IndexError, ValueError):
+            return None
+        if line_id < atom_id:
+            lo = line_end
+            start_id = line_id + 1
+        elif line_id > atom_id:
+            hi = line_start
+            end_id = line_id
+        else:
+            return line, line_end
+    return None
+
+
+def read_dump_atom_lines(dump_map, atom_ids, block_start, block_end):
+    """
+    Finds the lines of the given atoms in the atoms section of a timestep of a memory-mapped dump file without
+    reading the other atom lines (see find_dump_atom_line)
+    @param dump_map: mmap of the dump file
+    @param atom_ids: sorted list of unique atom ids (ints) to find
+    @param block_start: byte offset of the first atom line
+    @param block_end: byte offset of the end of the atoms section
+    @return: list of the split "id mol type q x y z" columns (bytes) of each atom, in the order of atom_ids, or
+        None if not all of the atoms were found this way
+    """
+    try:
+        start_id = read_dump_line_id(dump_map, block_start, block_end)[2]
+        last_start = max(dump_map.rfind(b'\n', block_start, block_end - 1) + 1, block_start)
+        end_id = read_dump_line_id(dump_map, last_start, block_end)[2] + 1
+    except (IndexError, ValueError):
+        return None
+    atom_rows = []
+    for atom_id in atom_ids:
+        found = find_dump_atom_line(dump_map, atom_id, block_start, block_end, start_id, end_id)
+        if found is None:
+            return None
+        atom_line, block_start = found
+        start_id = atom_id + 1
+        atom_row = atom_line.split()[:DUMP_ATOM_COLS]
+        if len(atom_row) < DUMP_ATOM_COLS:
+            return None
+        atom_rows.append(atom_row)
+    return atom_rows
+
+
+def read_dump_atoms(dump_file, atom_ids, frame_offsets=None, single=False):
+    """
+    Like read_dump_frames, but only reads the atom lines of the given atom ids, so that when only a few of the atoms
+    of a large system are needed, the cost of reading a timestep depends on the number of atoms needed rather than
+    on the number of atoms in the timestep. The dump file index (see get_dump_index) gives where the atom lines of
+    each timestep start (after its header) and end (at the start of the next timestep), and the atom lines needed
+    are found within that range by read_dump_atom_lines. A timestep in which not all of the atoms are found this way
+    (because its atom lines are not sorted by id, atoms are missing, or it was cut off at the end of the file) is
+    instead read in full, as by read_dump_frames, so that the same checks can be applied. If its atom lines are not
+    sorted by id, the rest of the file is also read in full. The whole timestep is also read when more than
+    MAX_SPARSE_ATOM_FRAC of its atoms are needed, as parsing all of the atom lines at once is then faster, when
+    the dump file is compressed (see open_dump), and when it has a binary cache (see find_dump_bin).
+    @param dump_file: name of the dump file to read
+    @param atom_ids: array or list of the atom ids (ints) needed; ids may be repeated
+    @param frame_offsets: optional byte offsets (from get_dump_index) of the timesteps to read; if None, all
+        timesteps are read in order
+    @param single: if True, a binary cache with 32-bit coordinates may be read in place of the dump file (see
+        find_dump_bin)
+    @return: generator of dicts, one per timestep, as described in read_dump_frames. When only the lines of the
+        atoms needed were read, the atom arrays only have the rows of those atoms (in order of atom id).
+    """
+    if find_dump_bin(dump_file, single=single) is not None or compression_type(dump_file) is not None:
+        # a binary cache needs no parsing, and a compressed file can only be read through, so whole timesteps are read
+        for frame in read_dump_frames(dump_file, frame_offsets=frame_offsets, single=single):
+            yield frame
+        return
+    atom_ids = np.unique(np.asarray(atom_ids, dtype=int)).tolist()
+    dump_index = get_dump_index(dump_file)
+    frame_starts = dump_index[IDX_OFFSETS]
+    if len(frame_starts) == 0:
+        return
+    frame_ends = np.append(frame_starts[1:], dump_index[IDX_FILE_SIZE]).tolist()
+    if frame_offsets is None:
+        frame_positions = range(len(frame_starts))
+    else:
+        frame_positions = np.searchsorted(frame_starts, np.asarray(frame_offsets, dtype=np.int64)).tolist()
+    with open(dump_file, 'rb') as d:
+        dump_map = mmap.mmap(d.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            sorted_atoms = True
+            for frame_pos in frame_positions:
+                frame_start = int(frame_starts[frame_pos])
+                num_atoms = int(dump_index[IDX_NUM_ATOMS][frame_pos])
+                atom_rows = None
+                if sorted_atoms and len(atom_ids) <= MAX_SPARSE_ATOM_FRAC * num_atoms:
+                    dump_map.seek(frame_start)
+                    header = [dump_map.readline().decode().strip() for _ in range(DUMP_HEAD_LINES)]
+                    atom_rows = read_dump_atom_lines(dump_map, atom_ids, dump_map.tell(), frame_ends[frame_pos])
+                if atom_rows is not None:
+                    frame = {TIMESTEP: int(dump_index[IDX_TIMESTEPS][frame_pos]),
+                             NUM_ATOMS: num_atoms,
+                             BOX: np.array(dump_index[IDX_BOXES][frame_pos], dtype=float),
+                             HEAD_CONTENT: header,
+                             }
+                    frame.update(dump_atom_columns(np.array(atom_rows, dtype=float).reshape(-1, DUMP_ATOM_COLS)))
+                    yield frame
+                    continue
+                dump_map.seek(frame_start)
+                for frame in iter_dump_frames(dump_map, dump_file):
+                    sorted_atoms = sorted_atoms and bool(np.all(np.diff(frame[ATOM_NUM]) > 0))
+                    yield frame
+                    break
+        finally:
+            dump_map.close()
+
+
+def dump_bin_frame_dtype(num_atoms, coord_dtype):
+    """
+    @param num_atoms: the number of atoms per frame in the binary dump cache
+    @param coord_dtype: the numpy dtype of the stored coordinates
+    @return: the numpy dtype of the frame records of a binary dump cache (see make_dump_bin)
+    """
+    return np.dtype([('timestep', '<i8'), ('offset', '<i8'), ('num_atoms', '<i8'), ('num_read', '<i8'),
+                     ('box', '<f8', (3,)), ('table', '<i8'), ('perm', '<i8'), ('head_start', '<i8'),
+                     ('head_len', '<i8'),
+                     ('xyz', coord_dtype, (num_atoms, 3))])
+
+
+def write_npy_from_file(b_file, src_file, dtype, shape):
+    """
+    Writes an array in the .npy format, copying its data from a (temporary) file
+    @param b_file: the open binary file to write to
+    @param src_file: the open file with the array data (in C order), which is read from its beginning
+    @param dtype: numpy dtype of the array
+    @param shape: shape of the array
+    """
+    np.lib.format.write_array_header_1_0(b_file, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                  'fortran_order': False, 'shape': shape})
+    src_file.seek(0)
+    shutil.copyfileobj(src_file, b_file)
+
+
+def match_dump_bin_table(table, frame_cols):
+    """
+    Finds the row of an atom table of a binary dump cache matching each atom line of a timestep
+    @param table: array of the atom table (DUMP_BIN_TABLE_DTYPE), sorted by atom id
+    @param frame_cols: list of the arrays of atom ids, molecule ids, types, and charges of the timestep
+    @return: array of the table row of each atom line, or None if not every atom line is in the table
+    """
+    rows = np.searchsorted(table['id'], frame_cols[0])
+    if np.any(rows >= len(table)):
+        return None
+    for col, frame_col in zip(DUMP_BIN_TABLE_DTYPE.names, frame_cols):
+        if not np.array_equal(table[col][rows], frame_col):
+            return None
+    return rows
+
+
+def new_dump_bin_table(table, frame_cols, num_rows):
+    """
+    Makes an atom table, sorted by atom id, for a timestep whose atoms are not all in the current table. If the
+    timestep was cut off, the rows of the current table for the atoms not read are kept.
+    @param table: array of the current atom table (DUMP_BIN_TABLE_DTYPE)
+    @param frame_cols: list of the arrays of atom ids, molecule ids, types, and charges of the timestep
+    @param num_rows: the number of rows of every table of the cache
+    @return: the new table, and array of the table row of each atom line
+    """
+    rows = np.zeros(num_rows, dtype=DUMP_BIN_TABLE_DTYPE)
+    num_read = len(frame_cols[0])
+    for col, frame_col in zip(DUMP_BIN_TABLE_DTYPE.names, frame_cols):
+        rows[col][:num_read] = frame_col
+    unread = table[~np.isin(table['id'], frame_cols[0])][:num_rows - num_read]
+    rows[num_read:num_read + len(unread)] = unread
+    order = np.argsort(rows['id'], kind='mergesort')
+    line_rows = np.empty(num_rows, dtype=np.int64)
+    line_rows[order] = np.arange(num_rows)
+    return rows[order], line_rows[:num_read]
+
+
+def make_dump_bin(dump_file, bin_file=None, single=False):
+    """
+    Converts a dump file to a binary cache, so that later reading it needs no parsing. The cache is one file with
+    five arrays in the .npy format, each of which can be memory-mapped (see read_dump_bin_arrays):
+      - the cache version, the size and modification time of the dump file (to tell if the cache is up to date),
+        and the type of the coordinates
+      - the table(s) of atom ids, molecule ids, types, and charges, sorted by atom id. Usually, these do not change
+        between timesteps, so there is only one table; a new one is stored only when they do (e.g. as protonation
+        changes)
+      - the table row of each atom line, for the timesteps whose atom lines are not in table order (as LAMMPS
+        writes them unless told to sort them by id); each different order is stored once
+      - one fixed-size record per timestep, with the timestep, the byte offset of the timestep in the dump file
+        (as in the dump file index), the numbers of atoms in the header and read, the box lengths, the table and
+        order (-1 for table order) to use, where to find the header lines, and the coordinates (in the order of the
+        atom lines). For a timestep cut off at the end of the dump file, only the first num_read rows are used.
+      - the header lines of all timesteps, as bytes
+    @param dump_file: name of the dump file to convert
+    @param bin_file: name of the binary cache to write; by default, DUMP_BIN_EXT is appended to the dump file name
+        (where find_dump_bin looks for it)
+    @param single: if True, the coordinates are stored as 32-bit instead of 64-bit floats, halving the size of
+        the cache but losing precision; such a cache is only read in place of the dump file when the reader allows
+        it (see find_dump_bin)
+    @return: the name of the binary cache written
+    :raises: InvalidDataError if the dump file is already a binary cache, or a timestep has more atoms than the
+        first one (the frame records have a fixed size)
+    """
+    if bin_file is None:
+        bin_file = dump_file + DUMP_BIN_EXT
+    with open(dump_file, 'rb') as d:
+        if d.read(len(NPY_MAGIC)) == NPY_MAGIC:
+            raise InvalidDataError("File {} is already a binary dump cache".format(dump_file))
+    coord_dtype = np.dtype('<f4') if single else DUMP_BIN_DOUBLE
+    meta = np.array([(DUMP_BIN_VERSION, os.path.getsize(dump_file), os.path.getmtime(dump_file), coord_dtype.str)],
+                    dtype=DUMP_BIN_META_DTYPE)
+    frame_offsets = get_dump_index(dump_file)[IDX_OFFSETS]
+    out_dir = os.path.dirname(os.path.abspath(bin_file))
+    frame_dtype = dump_bin_frame_dtype(0, coord_dtype)
+    record = None
+    num_rows = 0
+    table = np.zeros(0, dtype=DUMP_BIN_TABLE_DTYPE)
+    table_nums = {}
+    perm_nums = {}
+    num_frames = 0
+    head_start = 0
+    with tempfile.TemporaryFile(dir=out_dir) as table_tmp, tempfile.TemporaryFile(dir=out_dir) as perm_tmp, \
+            tempfile.TemporaryFile(dir=out_dir) as frame_tmp, tempfile.TemporaryFile(dir=out_dir) as head_tmp:
+        # the dump file itself is read, rather than any existing cache
+        dump_frames = read_dump_frames(dump_file, frame_offsets=frame_offsets, read_bin=False)
+        for offset, frame in zip(frame_offsets.tolist(), dump_frames):
+            num_read = len(frame[ATOM_NUM])
+            if record is None:
+                num_rows = max(frame[NUM_ATOMS], num_read)
+                frame_dtype = dump_bin_frame_dtype(num_rows, coord_dtype)
+                record = np.zeros(1, dtype=frame_dtype)
+            elif num_read > num_rows:
+                raise InvalidDataError("Timestep {} of dump file {} has more atoms than its first timestep, so it "
+                                       "cannot be converted to a binary cache".format(frame[TIMESTEP], dump_file))
+            frame_cols = [frame[ATOM_NUM], frame[MOL_NUM], frame[ATOM_TYPE], frame[CHARGE]]
+            line_rows = match_dump_bin_table(table, frame_cols)
+            if line_rows is None:
+                table, line_rows = new_dump_bin_table(table, frame_cols, num_rows)
+                table_key = hashlib.sha1(table.tobytes()).digest()
+                if table_key not in table_nums:
+                    table_nums[table_key] = len(table_nums)
+                    table_tmp.write(table.tobytes())
+                record['table'] = table_nums[table_key]
+            if num_read == num_rows and np.array_equal(line_rows, np.arange(num_rows)):
+                record['perm'] = -1
+            else:
+                perm = np.zeros(num_rows, dtype=np.int32)
+                perm[:num_read] = line_rows
+                perm_key = hashlib.sha1(perm.tobytes()).digest()
+                if perm_key not in perm_nums:
+                    perm_nums[perm_key] = len(perm_nums)
+                    perm_tmp.write(perm.tobytes())
+                record['perm'] = perm_nums[perm_key]
+            head = '\n'.join(frame[HEAD_CONTENT]).encode()
+            record['timestep'] = frame[TIMESTEP]
+            record['offset'] = offset
+            record['num_atoms'] = frame[NUM_ATOMS]
+            record['num_read'] = num_read
+            record['box'] = frame[BOX]
+            record['head_start'] = head_start
+            record['head_len'] = len(head)
+            record['xyz'] = 0
+            record['xyz'][0, :num_read] = frame[XYZ_COORDS]
+            frame_tmp.write(record.tobytes())
+            head_tmp.write(head)
+            head_start += len(head)
+            num_frames += 1
+        # any existing cache is only replaced once the new one is complete
+        tmp_name = bin_file + '.tmp'
+        try:
+            with open(tmp_name, 'wb') as b_file:
+                np.lib.format.write_array(b_file, meta)
+                write_npy_from_file(b_file, table_tmp, DUMP_BIN_TABLE_DTYPE, (len(table_nums), num_rows))
+                write_npy_from_file(b_file, perm_tmp, np.dtype('<i4'), (len(perm_nums), num_rows))
+                write_npy_from_file(b_file, frame_tmp, frame_dtype, (num_frames,))
+                write_npy_from_file(b_file, head_tmp, np.dtype(np.uint8), (head_start,))
+            os.rename(tmp_name, bin_file)
+        except Exception:
+            silent_remove(tmp_name)
+            raise
+    return bin_file
+
+
+def read_dump_bin_arrays(bin_file):
+    """
+    Memory-maps the arrays of a binary dump cache
+    @param bin_file: name of the binary dump cache, as written by make_dump_bin
+    @return: the meta data record, atom tables, atom line orders, frame records, and header bytes arrays (see
+        make_dump_bin)
+    :raises: InvalidDataError if the file is not a binary dump cache of the current version
+    """
+    arrays = []
+    try:
+        with open(bin_file, 'rb') as b_file:
+            for _ in range(5):
+                if np.lib.format.read_magic(b_file) != (1, 0):
+                    raise ValueError("unexpected .npy format version")
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(b_file)
+                offset = b_file.tell()
+                if int(np.prod(shape)) == 0:
+                    arrays.append(np.zeros(shape, dtype=dtype))
+                else:
+                    arrays.append(np.memmap(bin_file, dtype=dtype, mode='r', offset=offset, shape=shape))
+                b_file.seek(offset + dtype.itemsize * int(np.prod(shape)))
+    except ValueError as e:
+        raise InvalidDataError("Could not read binary dump cache {}: {}".format(bin_file, e))
+    if arrays[0][0]['version'] != DUMP_BIN_VERSION:
+        raise InvalidDataError("Binary dump cache {} was written by a different version; convert the dump file "
+                               "again".format(bin_file))
+    return arrays
+
+
+def find_dump_bin(dump_file, single=False):
+    """
+    Finds the binary cache (see make_dump_bin) to read in place of a dump file
+    @param dump_file: name of a dump file, or of a binary dump cache
+    @param single: if True, a binary cache with 32-bit coordinates may be returned; otherwise, only one with 64-bit
+        coordinates is, so that reading the cache gives the same coordinates as reading the dump file
+    @return: the name of the file itself if it is a binary dump cache, or else of its binary cache (with
+        DUMP_BIN_EXT appended to its name) if that exists, is up to date, and has coordinates of the allowed
+        precision, or else None
+    """
+    with open(dump_file, 'rb') as d:
+        if d.read(len(NPY_MAGIC)) == NPY_MAGIC:
+            return dump_file
+    bin_file = dump_file + DUMP_BIN_EXT
+    if os.path.isfile(bin_file):
+        try:
+            meta = read_dump_bin_arrays(bin_file)[0][0]
+        except InvalidDataError as e:
+            warning(e)
+            return None
+        if meta['src_size'] == os.path.getsize(dump_file) and meta['src_mtime'] == os.path.getmtime(dump_file) and \
+                (single or np.dtype(meta['coord_dtype'].decode()) == DUMP_BIN_DOUBLE):
+            return bin_file
+    return None
+
+
+def get_dump_bin(dump_file, single=False):
+    """
+    Returns the binary cache to read in place of a dump file, first converting the dump file if it does not yet
+    have an up-to-date binary cache
+    @param dump_file: name of a dump file, or of a binary dump cache
+    @param single: if True, the coordinates of a new cache are stored as 32-bit floats (see make_dump_bin), and an
+        existing cache of either precision is used; otherwise, an existing cache with 32-bit coordinates is replaced
+    @return: the name of the binary dump cache
+    """
+    bin_file = find_dump_bin(dump_file, single=single)
+    if bin_file is None:
+        bin_file = make_dump_bin(dump_file, single=single)
+    return bin_file
+
+
+def dump_bin_index(bin_file):
+    """
+    @param bin_file: name of a binary dump cache
+    @return: the dump file index (as described in build_dump_index) of the dump file converted to the cache
+    """
+    meta, tables, perms, frames, heads = read_dump_bin_arrays(bin_file)
+    return {IDX_TIMESTEPS: np.array(frames['timestep']),
+            IDX_OFFSETS: np.array(frames['offset']),
+            IDX_NUM_ATOMS: np.array(frames['num_atoms']),
+            IDX_BOXES: np.array(frames['box']).reshape(-1, 3),
+            IDX_FILE_SIZE: int(meta[0]['src_size']),
+            IDX_MTIME: float(meta[0]['src_mtime']),
+            }
+
+
+def read_dump_bin(bin_file, frame_offsets=None, single=False):
+    """
+    Reads the timesteps of a binary dump cache, as read_dump_frames reads those of a dump file. No parsing is
+    needed: the arrays of each timestep are copied from the memory-mapped cache (so that they can be changed, and
+    always have 64-bit coordinates).
+    @param bin_file: name of the binary dump cache
+    @param frame_offsets: optional byte offsets in the dump file (from get_dump_index) of the timesteps to read;
+        if None, all timesteps are read in order
+    @param single: if False, a warning is given if the cache has 32-bit coordinates, as they are less precise
+        than those of the dump file it was made from
+    @return: generator of dicts, one per timestep, as described in read_dump_frames
+    """
+    meta, tables, perms, frames, heads = read_dump_bin_arrays(bin_file)
+    if not single and np.dtype(meta[0]['coord_dtype'].decode()) != DUMP_BIN_DOUBLE:
+        warning("Binary dump cache {} has 32-bit coordinates, which are less precise than those of the dump file it "
+                "was made from".format(bin_file))
+    if frame_offsets is None:
+        frame_positions = range(len(frames))
+    else:
+        frame_positions = np.searchsorted(frames['offset'], np.asarray(frame_offsets, dtype=np.int64)).tolist()
+    for frame_pos in frame_positions:
+        record = frames[frame_pos]
+        num_read = int(record['num_read'])
+        table = tables[int(record['table'])]
+        if record['perm'] < 0:
+            table = table[:num_read]
+        else:
+            table = table[perms[int(record['perm'])][:num_read]]
+        head_start = int(record['head_start'])
+        yield {TIMESTEP: int(record['timestep']),
+               NUM_ATOMS: int(record['num_atoms']),
+               BOX: np.array(record['box'], dtype=float),
+               HEAD_CONTENT: heads[head_start:head_start + int(record['head_len'])].tobytes().decode().split('\n'),
+               ATOM_NUM: np.array(table['id'], dtype=int),
+               MOL_NUM: np.array(table['mol'], dtype=int),
+               ATOM_TYPE: np.array(table['type'], dtype=int),
+               CHARGE: np.array(table['q'], dtype=float),
+               XYZ_COORDS: np.array(record['xyz'][:num_read], dtype=float),
+               }
+
+
+def imap_bounded(pool, func, tasks, max_pending):
+    """
+    Like pool.imap, applies func to each task in worker processes and returns the results in task order. However,
+    new tasks are only submitted as results are used, so that no more than max_pending results (finished or not) are
+    held at once, however many tasks there are or however slowly the results are used.
+    @param pool: a multiprocessing Pool
+    @param func: the (picklable) function to apply
+    @param tasks: iterable of the arguments for func, one per task
+    @param max_pending: the maximum number of tasks submitted whose results have not been returned
+    @return: generator of the results, in task order
+    """
+    task_iter = iter(tasks)
+    pending = collections.deque(pool.apply_async(func, (task,)) for task in islice(task_iter, max(max_pending, 1)))
+    while pending:
+        result = pending.popleft().get()
+        # keep the workers busy while the result is used
+        for task in islice(task_iter, 1):
+            pending.append(pool.apply_async(func, (task,)))
+        yield result
+
+
 def process_pdb_tpl(tpl_loc):
     tpl_data = {NUM_ATOMS: 0, HEAD_CONTENT: [], ATOMS_CONTENT: [], TAIL_CONTENT: []}
 
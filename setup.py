@@ -50,6 +50,7 @@ setup(
                                       'data2data = md_utils.data2data:main',
                                       'data2pdb = md_utils.data2pdb:main',
                                       'data_edit = md_utils.data_edit:main',
+                                      'dump2bin = md_utils.dump2bin:main',
                                       'dump_edit = md_utils.dump_edit:main',
                                       'evb_chk_get_info = md_utils.evb_chk_get_info:main',
                                       'evb_get_info = md_utils.evb_get_info:main',
@@ -57,6 +58,7 @@ setup(
                                       'filter_col = md_utils.filter_col:main',
                                       'fes_combo = md_utils.fes_combo:main',
                                       'fill_tpl = md_utils.fill_tpl:main',
+                                      'gofr_merge = md_utils.gofr_merge:main',
                                       'fitevb_setup = md_utils.fitevb_setup:main',
                                       'lammps_dist = md_utils.lammps_dist:main',
                                       'lammps_log_proc = md_utils.lammps_log_proc:main',
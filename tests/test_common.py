@@ -3,16 +3,25 @@
 """
 Tests for the common lib.
 """
+import bz2
+import gzip
 import logging
 import shutil
 import tempfile
 import unittest
 import os
 import numpy as np
+from multiprocessing import Pool
 from md_utils.md_common import (find_files_by_dir, read_csv, get_fname_root,
                                 write_csv, str_to_bool, read_csv_header, fmt_row_data, calc_k, diff_lines,
                                 create_out_fname, dequote, quote, conv_raw_val, pbc_calc_vector, pbc_vector_avg,
-                                read_csv_dict, InvalidDataError, unit_vector, vec_angle, vec_dihedral)
+                                read_csv_dict, InvalidDataError, unit_vector, vec_angle, vec_dihedral,
+                                read_dump_frames, TIMESTEP, NUM_ATOMS, BOX, ATOM_NUM, MOL_NUM, ATOM_TYPE, CHARGE,
+                                XYZ_COORDS, get_dump_index, silent_remove, DUMP_INDEX_EXT, IDX_TIMESTEPS,
+                                IDX_OFFSETS, IDX_NUM_ATOMS, IDX_BOXES, pbc_dist, pbc_calc_vectors, pbc_dists,
+                                pbc_pair_dists, pbc_neighbor_dists, pbc_neighbor_pairs, vec_angles, vec_dihedrals,
+                                imap_bounded, read_dump_atoms, HEAD_CONTENT, open_input, compression_type, GZIP, BZ2,
+                                XZ, lzma, BackgroundDecompressor)
 from md_utils.fes_combo import DEF_FILE_PAT
 from md_utils.wham import CORR_KEY, COORD_KEY, FREE_KEY, RAD_KEY_SEQ
 
@@ -68,6 +77,10 @@ DIFF_LINES_ALT_SCI_FILE = os.path.join(SUB_DATA_DIR, 'cv_analysis_quat_good.log'
 IMPROP_SEC = os.path.join(LAMMPS_PROC_DIR, 'glue_improp.data')
 IMPROP_SEC_ALT = os.path.join(LAMMPS_PROC_DIR, 'glue_improp_diff_ord.data')
 
+GLUE_DUMP = os.path.join(LAMMPS_PROC_DIR, 'glue.dump')
+GLUE_INCOMP_DUMP = os.path.join(LAMMPS_PROC_DIR, 'glue_incomp.dump')
+GLUE_BAD_DUMP = os.path.join(LAMMPS_PROC_DIR, 'glue_bad.dump')
+
 # To test PBC math
 PBC_BOX = np.full(3, 24.25)
 A_VEC = [3.732, -1.803, -1.523]
@@ -420,6 +433,50 @@ class TestVectorPBCMath(unittest.TestCase):
     def testAvgInDiffImages(self):
         self.assertTrue(np.allclose(pbc_vector_avg(A_VEC, C_VEC, PBC_BOX), GOOD_A_C_AVG))
 
+    def testBatchVectors(self):
+        a_vecs = np.array([A_VEC, VEC_1, VEC_3])
+        b_vecs = np.array([C_VEC, VEC_2, VEC_2])
+        good_vecs = np.array([pbc_calc_vector(a, b, PBC_BOX) for a, b in zip(a_vecs, b_vecs)])
+        self.assertTrue(np.allclose(pbc_calc_vectors(a_vecs, b_vecs, PBC_BOX), good_vecs))
+        # one-to-many
+        self.assertTrue(np.allclose(pbc_dists(a_vecs, VEC_2, PBC_BOX),
+                                    [pbc_dist(a, VEC_2, PBC_BOX) for a in a_vecs]))
+
+    def testPairDists(self):
+        a_vecs = np.array([A_VEC, VEC_1])
+        b_vecs = np.array([C_VEC, VEC_2, VEC_3])
+        pair_dists = pbc_pair_dists(a_vecs, b_vecs, PBC_BOX)
+        self.assertEqual((2, 3), pair_dists.shape)
+        for a_index, a in enumerate(a_vecs):
+            for b_index, b in enumerate(b_vecs):
+                self.assertAlmostEqual(pair_dists[a_index, b_index], pbc_dist(a, b, PBC_BOX))
+        single_dists = pbc_pair_dists(a_vecs, b_vecs, PBC_BOX, dtype=np.float32)
+        self.assertEqual(np.float32, single_dists.dtype)
+        self.assertTrue(np.allclose(single_dists, pair_dists, atol=1e-4))
+
+    def testNeighborDists(self):
+        # the cell list search finds the same distances as comparing all pairs, including for points outside the
+        #     first periodic image
+        box = np.array([20.0, 24.25, 31.0])
+        a_vecs = np.random.RandomState(7).uniform(-30.0, 30.0, (40, 3))
+        b_vecs = np.random.RandomState(8).uniform(-30.0, 30.0, (300, 3))
+        for cutoff in [6.0, 11.0]:
+            all_dists = pbc_pair_dists(a_vecs, b_vecs, box).ravel()
+            good_dists = np.sort(all_dists[all_dists <= cutoff])
+            neighbor_dists = np.sort(pbc_neighbor_dists(a_vecs, b_vecs, box, cutoff))
+            self.assertTrue(np.allclose(neighbor_dists, good_dists))
+        self.assertEqual(0, len(pbc_neighbor_dists(a_vecs, [], box, 6.0)))
+
+    def testNeighborPairs(self):
+        box = np.array([20.0, 24.25, 31.0])
+        a_vecs = np.random.RandomState(7).uniform(-30.0, 30.0, (40, 3))
+        b_vecs = np.random.RandomState(8).uniform(-30.0, 30.0, (300, 3))
+        all_dists = pbc_pair_dists(a_vecs, b_vecs, box)
+        good_pairs = set(zip(*np.nonzero(all_dists <= 6.0)))
+        pair_a, pair_b, dists = pbc_neighbor_pairs(a_vecs, b_vecs, box, 6.0)
+        self.assertEqual(good_pairs, set(zip(pair_a, pair_b)))
+        self.assertTrue(np.allclose(dists, all_dists[pair_a, pair_b]))
+
     def testUnitVector(self):
         test_unit_vec = unit_vector(VEC_3)
         self.assertTrue(np.allclose(test_unit_vec, UNIT_VEC_3))
@@ -430,3 +487,199 @@ class TestVectorPBCMath(unittest.TestCase):
 
     def testDihedral(self):
         self.assertAlmostEqual(vec_dihedral(VEC_21, VEC_23, VEC_34), DIH_1234)
+
+    def testBatchAngles(self):
+        angles = vec_angles(np.array([VEC_21, VEC_23, VEC_21]), np.array([VEC_23, VEC_34, VEC_34]))
+        self.assertEqual((3,), angles.shape)
+        self.assertAlmostEqual(angles[0], ANGLE_123)
+        self.assertAlmostEqual(angles[1], vec_angle(VEC_23, VEC_34))
+        self.assertAlmostEqual(angles[2], vec_angle(VEC_21, VEC_34))
+
+    def testBatchDihedrals(self):
+        dihedrals = vec_dihedrals(np.array([VEC_21, -VEC_21]), VEC_23, VEC_34)
+        self.assertEqual((2,), dihedrals.shape)
+        self.assertAlmostEqual(dihedrals[0], DIH_1234)
+        self.assertAlmostEqual(dihedrals[1], vec_dihedral(-VEC_21, VEC_23, VEC_34))
+
+
+class TestReadDumpFrames(unittest.TestCase):
+    def testReadFrames(self):
+        frames = list(read_dump_frames(GLUE_DUMP))
+        self.assertEqual([frame[TIMESTEP] for frame in frames], [540000, 540010, 540020])
+        first_frame = frames[0]
+        self.assertEqual(first_frame[NUM_ATOMS], 1429)
+        self.assertTrue(np.allclose(first_frame[BOX], np.full(3, 24.2494)))
+        self.assertEqual(first_frame[XYZ_COORDS].shape, (1429, 3))
+        self.assertEqual(first_frame[ATOM_NUM][0], 1)
+        self.assertEqual(first_frame[MOL_NUM][0], 1)
+        self.assertEqual(first_frame[ATOM_TYPE][0], 6)
+        self.assertAlmostEqual(first_frame[CHARGE][0], 0.09)
+        self.assertTrue(np.allclose(first_frame[XYZ_COORDS][0], [8.52332, -9.99958, 8.67956]))
+
+    def testIncompleteFrame(self):
+        frames = list(read_dump_frames(GLUE_INCOMP_DUMP))
+        self.assertEqual(len(frames), 4)
+        self.assertEqual(len(frames[2][ATOM_NUM]), 1429)
+        self.assertEqual(len(frames[3][ATOM_NUM]), 3)
+        self.assertEqual(frames[3][NUM_ATOMS], 1429)
+
+    def testBadTimestep(self):
+        with self.assertRaises(InvalidDataError) as context:
+            list(read_dump_frames(GLUE_BAD_DUMP))
+        self.assertTrue("invalid literal for int()" in context.exception.args[0])
+
+
+class TestDumpIndex(unittest.TestCase):
+    def testIndexAndSeek(self):
+        index_file = GLUE_INCOMP_DUMP + DUMP_INDEX_EXT
+        try:
+            dump_index = get_dump_index(GLUE_INCOMP_DUMP)
+            self.assertTrue(os.path.isfile(index_file))
+            self.assertEqual(dump_index[IDX_TIMESTEPS].tolist(), [540000, 540010, 540020, 540030])
+            self.assertEqual(dump_index[IDX_NUM_ATOMS].tolist(), [1429] * 4)
+            self.assertTrue(np.allclose(dump_index[IDX_BOXES], np.full((4, 3), 24.2494)))
+            saved_index = get_dump_index(GLUE_INCOMP_DUMP)
+            self.assertTrue(np.array_equal(saved_index[IDX_OFFSETS], dump_index[IDX_OFFSETS]))
+            all_frames = list(read_dump_frames(GLUE_INCOMP_DUMP))
+            sought_frames = list(read_dump_frames(GLUE_INCOMP_DUMP, frame_offsets=dump_index[IDX_OFFSETS][[2, 0]]))
+            self.assertEqual([frame[TIMESTEP] for frame in sought_frames], [540020, 540000])
+            self.assertTrue(np.array_equal(sought_frames[0][XYZ_COORDS], all_frames[2][XYZ_COORDS]))
+            self.assertTrue(np.array_equal(sought_frames[1][ATOM_NUM], all_frames[0][ATOM_NUM]))
+        finally:
+            silent_remove(index_file)
+
+
+class TestReadDumpAtoms(unittest.TestCase):
+    def testSparseFrames(self):
+        # only the lines of the atoms needed are read from the complete timesteps
+        index_file = GLUE_INCOMP_DUMP + DUMP_INDEX_EXT
+        try:
+            all_frames = list(read_dump_frames(GLUE_INCOMP_DUMP))
+            frames = list(read_dump_atoms(GLUE_INCOMP_DUMP, [1000, 3, 1000, 1429]))
+            self.assertEqual([frame[TIMESTEP] for frame in frames], [540000, 540010, 540020, 540030])
+            for frame, full_frame in zip(frames[:3], all_frames):
+                self.assertEqual(frame[ATOM_NUM].tolist(), [3, 1000, 1429])
+                self.assertEqual(frame[NUM_ATOMS], 1429)
+                self.assertEqual(frame[HEAD_CONTENT], full_frame[HEAD_CONTENT])
+                self.assertTrue(np.allclose(frame[BOX], full_frame[BOX]))
+                self.assertTrue(np.array_equal(frame[XYZ_COORDS], full_frame[XYZ_COORDS][[2, 999, 1428]]))
+                self.assertTrue(np.array_equal(frame[CHARGE], full_frame[CHARGE][[2, 999, 1428]]))
+            # the last timestep was cut off, so it is read in full, as by read_dump_frames
+            self.assertEqual(frames[3][ATOM_NUM].tolist(), [1, 2, 3])
+            sought_frames = list(read_dump_atoms(GLUE_INCOMP_DUMP, [5],
+                                                 frame_offsets=get_dump_index(GLUE_INCOMP_DUMP)[IDX_OFFSETS][[2]]))
+            self.assertEqual([frame[TIMESTEP] for frame in sought_frames], [540020])
+            self.assertTrue(np.array_equal(sought_frames[0][XYZ_COORDS], all_frames[2][XYZ_COORDS][[4]]))
+        finally:
+            silent_remove(index_file)
+
+    def testUnsortedAtoms(self):
+        # atom lines not sorted by id are found by reading the whole timestep
+        temp_dir = tempfile.mkdtemp()
+        unsorted_dump = os.path.join(temp_dir, 'unsorted.dump')
+        try:
+            with open(GLUE_DUMP) as d:
+                dump_lines = d.readlines()
+            with open(unsorted_dump, 'w') as d:
+                d.writelines(dump_lines[:9] + dump_lines[9:1438][::-1] + dump_lines[1438:])
+            frames = list(read_dump_atoms(unsorted_dump, [3, 1000]))
+            self.assertEqual([len(frame[ATOM_NUM]) for frame in frames], [1429, 1429, 1429])
+            self.assertEqual(frames[0][ATOM_NUM][[-3, -1000]].tolist(), [3, 1000])
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+def write_compressed(src_file, c_file, c_type):
+    c_open = {GZIP: gzip.open, BZ2: bz2.BZ2File, XZ: lzma.open if lzma else None}[c_type]
+    with open(src_file, 'rb') as s_file:
+        with c_open(c_file, 'wb') as out_file:
+            shutil.copyfileobj(s_file, out_file)
+
+
+class TestOpenInput(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def testCompressedTypes(self):
+        with open(GLUE_DUMP) as d:
+            dump_text = d.read()
+        self.assertIsNone(compression_type(GLUE_DUMP))
+        for c_type in [GZIP, BZ2, XZ]:
+            if c_type == XZ and lzma is None:
+                continue
+            c_file = os.path.join(self.temp_dir, 'glue.dump.' + c_type)
+            write_compressed(GLUE_DUMP, c_file, c_type)
+            self.assertEqual(compression_type(c_file), c_type)
+            with open_input(c_file) as c_stream:
+                self.assertEqual(c_stream.read(), dump_text)
+
+    def testSeek(self):
+        c_file = os.path.join(self.temp_dir, 'glue.dump.gz')
+        write_compressed(GLUE_DUMP, c_file, GZIP)
+        with open(GLUE_DUMP, 'rb') as d:
+            dump_bytes = d.read()
+        with open_input(c_file, 'rb') as c_stream:
+            c_stream.seek(100000)
+            self.assertEqual(c_stream.read(50), dump_bytes[100000:100050])
+            self.assertEqual(c_stream.tell(), 100050)
+            # seeking backward starts again from the beginning of the file
+            c_stream.seek(10)
+            self.assertEqual(c_stream.readline(), dump_bytes[10:dump_bytes.index(b'\n', 10) + 1])
+
+    def testSeekEnd(self):
+        # the end is found from part way through a chunk of the raw stream
+        c_file = os.path.join(self.temp_dir, 'glue.dump.gz')
+        write_compressed(GLUE_DUMP, c_file, GZIP)
+        c_stream = BackgroundDecompressor(c_file, GZIP)
+        try:
+            self.assertEqual(c_stream.readinto(bytearray(1000)), 1000)
+            self.assertEqual(c_stream.seek(0, 2), os.path.getsize(GLUE_DUMP))
+            self.assertEqual(c_stream.tell(), os.path.getsize(GLUE_DUMP))
+        finally:
+            c_stream.close()
+
+    def testCutOff(self):
+        c_file = os.path.join(self.temp_dir, 'glue.dump.gz')
+        write_compressed(GLUE_DUMP, c_file, GZIP)
+        with open(c_file, 'rb') as c_stream:
+            c_bytes = c_stream.read()
+        with open(c_file, 'wb') as c_stream:
+            c_stream.write(c_bytes[:len(c_bytes) // 2])
+        with self.assertRaises(IOError) as context:
+            with open_input(c_file) as c_stream:
+                c_stream.read()
+        self.assertTrue("Could not decompress gzip file" in context.exception.args[0])
+
+    def testCompressedDump(self):
+        # the same frames are read as from the uncompressed file, and the index has the same offsets
+        c_file = os.path.join(self.temp_dir, 'glue_incomp.dump')
+        write_compressed(GLUE_INCOMP_DUMP, c_file, BZ2)
+        try:
+            all_frames = list(read_dump_frames(GLUE_INCOMP_DUMP))
+            c_frames = list(read_dump_frames(c_file))
+            self.assertEqual([len(frame[ATOM_NUM]) for frame in c_frames], [1429, 1429, 1429, 3])
+            for c_frame, frame in zip(c_frames, all_frames):
+                self.assertEqual(c_frame[TIMESTEP], frame[TIMESTEP])
+                self.assertTrue(np.array_equal(c_frame[XYZ_COORDS], frame[XYZ_COORDS]))
+            dump_index = get_dump_index(GLUE_INCOMP_DUMP)
+            c_index = get_dump_index(c_file)
+            self.assertTrue(np.array_equal(c_index[IDX_OFFSETS], dump_index[IDX_OFFSETS]))
+            sought_frames = list(read_dump_atoms(c_file, [5], frame_offsets=c_index[IDX_OFFSETS][[2, 0]]))
+            self.assertEqual([frame[TIMESTEP] for frame in sought_frames], [540020, 540000])
+            self.assertTrue(np.array_equal(sought_frames[0][XYZ_COORDS], all_frames[2][XYZ_COORDS]))
+        finally:
+            silent_remove(GLUE_INCOMP_DUMP + DUMP_INDEX_EXT)
+
+
+class TestImapBounded(unittest.TestCase):
+    def testOrder(self):
+        # more tasks than may be pending at once; results are returned in task order
+        pool = Pool(2)
+        try:
+            self.assertEqual([3, 2, 1, 0, 5, 4], list(imap_bounded(pool, abs, [-3, 2, -1, 0, -5, 4], 2)))
+        finally:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,218 @@
+# coding=utf-8
+
+"""
+Tests for dump2bin.py.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from md_utils.dump2bin import main
+from md_utils.md_common import (capture_stdout, capture_stderr, read_dump_frames, find_dump_bin, get_dump_index,
+                                get_dump_bin, TIMESTEP, NUM_ATOMS, BOX, ATOM_NUM, MOL_NUM, ATOM_TYPE, CHARGE,
+                                XYZ_COORDS, HEAD_CONTENT)
+import logging
+
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+__author__ = 'hmayes'
+
+# Directories #
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'test_data')
+PROC_DATA_DIR = os.path.join(DATA_DIR, 'lammps_proc')
+DIST_DATA_DIR = os.path.join(DATA_DIR, 'lammps_dist')
+
+# Input files #
+
+# the atom ids, molecule ids, types, and charges change with the protonation state
+PROT_DEPROT_DUMP = os.path.join(PROC_DATA_DIR, 'glu_prot_deprot.dump')
+CUTOFF_DUMP = os.path.join(DIST_DATA_DIR, '1.50_small_cutoff.dump')
+SMALL_DUMP = os.path.join(DIST_DATA_DIR, '1.50_small.dump')
+
+
+def copy_dumps(temp_dir, dump_files):
+    dump_copies = []
+    for dump_file in dump_files:
+        dump_copy = os.path.join(temp_dir, os.path.basename(dump_file))
+        shutil.copy2(dump_file, dump_copy)
+        dump_copies.append(dump_copy)
+    return dump_copies
+
+
+def shuffle_dump(dump_file, shuffled_file):
+    # writes the atom lines of each timestep in a random order, as LAMMPS does when not sorting them by atom id
+    rand = np.random.RandomState(42)
+    atom_lines = []
+    with open(dump_file) as d_file, open(shuffled_file, 'w') as s_file:
+        for line in d_file:
+            if line.startswith("ITEM: TIMESTEP"):
+                s_file.writelines([atom_lines[i] for i in rand.permutation(len(atom_lines))])
+                atom_lines = None
+            if atom_lines is None or line.startswith("ITEM:"):
+                s_file.write(line)
+                atom_lines = [] if line.startswith("ITEM: ATOMS") else None
+            else:
+                atom_lines.append(line)
+        s_file.writelines([atom_lines[i] for i in rand.permutation(len(atom_lines))])
+
+
+def dump_timestep(timestep, num_atoms):
+    lines = ["ITEM: TIMESTEP", str(timestep), "ITEM: NUMBER OF ATOMS", str(num_atoms), "ITEM: BOX BOUNDS pp pp pp"] + \
+        ["-10.0 10.0"] * 3 + ["ITEM: ATOMS id mol type q x y z"] + \
+        ["{0} 1 1 0.0 {0}.0 1.0 2.0".format(atom_num) for atom_num in range(1, num_atoms + 1)]
+    return '\n'.join(lines) + '\n'
+
+
+def frames_match(dump_frames, bin_frames, atol=0.0):
+    if len(dump_frames) != len(bin_frames):
+        return False
+    for dump_frame, bin_frame in zip(dump_frames, bin_frames):
+        if dump_frame[TIMESTEP] != bin_frame[TIMESTEP] or dump_frame[NUM_ATOMS] != bin_frame[NUM_ATOMS] or \
+                dump_frame[HEAD_CONTENT] != bin_frame[HEAD_CONTENT]:
+            return False
+        for key in [BOX, ATOM_NUM, MOL_NUM, ATOM_TYPE, CHARGE]:
+            if not np.array_equal(dump_frame[key], bin_frame[key]):
+                return False
+        if not np.allclose(dump_frame[XYZ_COORDS], bin_frame[XYZ_COORDS], rtol=0.0, atol=atol):
+            return False
+    return True
+
+
+class TestDump2BinNoOutput(unittest.TestCase):
+    def testNoArgs(self):
+        with capture_stderr(main, []) as output:
+            self.assertTrue("No dump files were specified" in output)
+
+    def testHelp(self):
+        test_input = ['-h']
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertFalse(output)
+        with capture_stdout(main, test_input) as output:
+            self.assertTrue("dump_files" in output)
+
+    def testNoSuchFile(self):
+        with capture_stderr(main, ["ghost.dump"]) as output:
+            self.assertTrue("Problems reading file" in output)
+
+    def testAlreadyBin(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dump_copy = copy_dumps(temp_dir, [CUTOFF_DUMP])[0]
+            with capture_stdout(main, [dump_copy]):
+                pass
+            with capture_stderr(main, [dump_copy + '.bin']) as output:
+                self.assertTrue("is already a binary dump cache" in output)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class TestDump2Bin(unittest.TestCase):
+    def testChangingTables(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dump_copy = copy_dumps(temp_dir, [PROT_DEPROT_DUMP])[0]
+            dump_frames = list(read_dump_frames(dump_copy))
+            with capture_stdout(main, [dump_copy]) as output:
+                self.assertTrue("Wrote file: {}.bin".format(dump_copy) in output)
+            self.assertEqual(find_dump_bin(dump_copy), dump_copy + '.bin')
+            # read from the cache, either by the name of the dump file or of the cache
+            self.assertTrue(frames_match(dump_frames, list(read_dump_frames(dump_copy))))
+            self.assertTrue(frames_match(dump_frames, list(read_dump_frames(dump_copy + '.bin'))))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def testCutoffIndex(self):
+        # the last timestep is cut off; the cache gives the same frames and index as the dump file
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dump_copy = copy_dumps(temp_dir, [CUTOFF_DUMP])[0]
+            dump_frames = list(read_dump_frames(dump_copy))
+            dump_index = get_dump_index(dump_copy)
+            with capture_stdout(main, [dump_copy]):
+                pass
+            self.assertTrue(frames_match(dump_frames, list(read_dump_frames(dump_copy))))
+            bin_index = get_dump_index(dump_copy)
+            for key in dump_index:
+                self.assertTrue(np.array_equal(dump_index[key], bin_index[key]))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def testSingleList(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dump_copies = copy_dumps(temp_dir, [PROT_DEPROT_DUMP, CUTOFF_DUMP])
+            list_file = os.path.join(temp_dir, 'dump_list.txt')
+            with open(list_file, 'w') as l_file:
+                l_file.write(dump_copies[1] + '\n')
+            dump_frames = [list(read_dump_frames(dump_copy)) for dump_copy in dump_copies]
+            with capture_stdout(main, [dump_copies[0], "-l", list_file, "-s"]):
+                pass
+            for dump_copy, frames in zip(dump_copies, dump_frames):
+                # single precision caches are only read when allowed
+                self.assertIsNone(find_dump_bin(dump_copy))
+                self.assertEqual(find_dump_bin(dump_copy, single=True), dump_copy + '.bin')
+                self.assertTrue(frames_match(frames, list(read_dump_frames(dump_copy, single=True)), atol=1e-4))
+            # a single precision cache named directly is read, with a warning
+            with capture_stderr(list, read_dump_frames(dump_copies[0] + '.bin')) as output:
+                self.assertTrue("has 32-bit coordinates" in output)
+            # a single precision cache is replaced when a double precision one is needed
+            self.assertEqual(get_dump_bin(dump_copies[0]), dump_copies[0] + '.bin')
+            self.assertEqual(find_dump_bin(dump_copies[0]), dump_copies[0] + '.bin')
+            self.assertTrue(frames_match(dump_frames[0], list(read_dump_frames(dump_copies[0]))))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def testShuffledAtoms(self):
+        # the atom lines are in a different order in each timestep; the cache stores one atom table with the order
+        # of each timestep, so it is smaller than the dump file
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dump_copy = os.path.join(temp_dir, os.path.basename(SMALL_DUMP))
+            shuffle_dump(SMALL_DUMP, dump_copy)
+            dump_frames = list(read_dump_frames(dump_copy))
+            self.assertFalse(np.array_equal(dump_frames[0][ATOM_NUM], dump_frames[1][ATOM_NUM]))
+            with capture_stdout(main, [dump_copy]):
+                pass
+            self.assertTrue(frames_match(dump_frames, list(read_dump_frames(dump_copy))))
+            self.assertLess(os.path.getsize(dump_copy + '.bin'), os.path.getsize(dump_copy))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def testFailedConversion(self):
+        # a conversion that fails leaves the existing cache in place, and no partial cache
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dump_file = os.path.join(temp_dir, 'grow.dump')
+            with open(dump_file, 'w') as d_file:
+                d_file.write(dump_timestep(10, 2))
+            with capture_stdout(main, [dump_file]):
+                pass
+            with open(dump_file + '.bin', 'rb') as b_file:
+                bin_bytes = b_file.read()
+            with open(dump_file, 'a') as d_file:
+                d_file.write(dump_timestep(20, 3))
+            with capture_stderr(main, [dump_file]) as output:
+                self.assertTrue("has more atoms than its first timestep" in output)
+            with open(dump_file + '.bin', 'rb') as b_file:
+                self.assertEqual(b_file.read(), bin_bytes)
+            self.assertFalse(os.path.exists(dump_file + '.bin.tmp'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def testStaleCache(self):
+        # once the dump file changes, it is read instead of its cache
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dump_copy = copy_dumps(temp_dir, [CUTOFF_DUMP])[0]
+            with capture_stdout(main, [dump_copy]):
+                pass
+            with open(dump_copy, 'a') as d_file:
+                d_file.write("ITEM: TIMESTEP\n")
+            self.assertIsNone(find_dump_bin(dump_copy))
+        finally:
+            shutil.rmtree(temp_dir)
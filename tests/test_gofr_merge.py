@@ -0,0 +1,119 @@
+# coding=utf-8
+
+"""
+Tests for gofr_merge.py.
+"""
+import os
+import unittest
+import numpy as np
+from md_utils.gofr_merge import main
+from md_utils.lammps_proc import main as lammps_proc_main
+from md_utils.lammps_proc import read_gofr_checkpoint, write_gofr_checkpoint, GOFR_BINS
+from md_utils.md_common import capture_stdout, capture_stderr, diff_lines, silent_remove
+import logging
+
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+DISABLE_REMOVE = logger.isEnabledFor(logging.DEBUG)
+
+__author__ = 'hmayes'
+
+# Directories #
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'test_data')
+SUB_DATA_DIR = os.path.join(DATA_DIR, 'gofr_merge')
+PROC_DATA_DIR = os.path.join(DATA_DIR, 'lammps_proc')
+
+# Input files #
+
+# lammps_proc runs writing checkpoints for different dump files, with the same bins
+GOFR_CHK_INI = os.path.join(PROC_DATA_DIR, 'gofr_chk.ini')
+GOFR_CHK_LONG_INI = os.path.join(PROC_DATA_DIR, 'gofr_chk_long.ini')
+GOFR_CHK = os.path.join(PROC_DATA_DIR, 'glue_dump_gofrs.npz')
+GOFR_CHK_LONG = os.path.join(PROC_DATA_DIR, 'glue_dump_long_gofrs.npz')
+GOFR_CHK_OUT = os.path.join(PROC_DATA_DIR, 'glue_dump_gofrs.csv')
+GOFR_CHK_LONG_OUT = os.path.join(PROC_DATA_DIR, 'glue_dump_long_gofrs.csv')
+CHK_LIST = os.path.join(SUB_DATA_DIR, 'gofr_chk.list')
+
+# Output files #
+
+MERGED_OUT = os.path.join(SUB_DATA_DIR, 'merged_gofrs.csv')
+# written by lammps_proc reading both dump files in one run
+GOOD_MERGED_OUT = os.path.join(SUB_DATA_DIR, 'merged_gofrs_good.csv')
+
+
+def make_checkpoints():
+    with capture_stdout(lammps_proc_main, ["-c", GOFR_CHK_INI]):
+        pass
+    with capture_stdout(lammps_proc_main, ["-c", GOFR_CHK_LONG_INI]):
+        pass
+
+
+def remove_checkpoints():
+    for f_name in [GOFR_CHK, GOFR_CHK_LONG, GOFR_CHK_OUT, GOFR_CHK_LONG_OUT, MERGED_OUT]:
+        silent_remove(f_name, disable=DISABLE_REMOVE)
+
+
+class TestGofrMergeNoOutput(unittest.TestCase):
+    def testNoArgs(self):
+        with capture_stderr(main, []) as output:
+            self.assertTrue("No g(r) checkpoint files were specified" in output)
+
+    def testHelp(self):
+        test_input = ['-h']
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertFalse(output)
+        with capture_stdout(main, test_input) as output:
+            self.assertTrue("checkpoint_files" in output)
+
+    def testNoSuchFile(self):
+        with capture_stderr(main, ["ghost.npz"]) as output:
+            self.assertTrue("Problems reading file" in output)
+
+    def testNotCheckpoint(self):
+        with capture_stderr(main, [GOFR_CHK_INI]) as output:
+            self.assertTrue("Could not read g(r) checkpoint file" in output)
+
+    def testBinsMismatch(self):
+        try:
+            make_checkpoints()
+            gofr_data, g_dr, done_files, partial_file, partial_frames = read_gofr_checkpoint(GOFR_CHK)
+            gofr_data[GOFR_BINS] = gofr_data[GOFR_BINS] * 2
+            write_gofr_checkpoint(GOFR_CHK, gofr_data, g_dr * 2, done_files)
+            with capture_stderr(main, [GOFR_CHK_LONG, GOFR_CHK, "-o", MERGED_OUT]) as output:
+                self.assertTrue("do not match the bins expected" in output)
+            self.assertFalse(os.path.isfile(MERGED_OUT))
+        finally:
+            remove_checkpoints()
+
+
+class TestGofrMerge(unittest.TestCase):
+    def testMerge(self):
+        # combining the checkpoints from separate runs gives the same output as reading all the dump files in one run
+        try:
+            make_checkpoints()
+            main([GOFR_CHK, GOFR_CHK_LONG, "-o", MERGED_OUT])
+            self.assertFalse(diff_lines(MERGED_OUT, GOOD_MERGED_OUT))
+        finally:
+            remove_checkpoints()
+
+    def testMergeList(self):
+        try:
+            make_checkpoints()
+            main(["-l", CHK_LIST, "-o", MERGED_OUT])
+            self.assertFalse(diff_lines(MERGED_OUT, GOOD_MERGED_OUT))
+        finally:
+            remove_checkpoints()
+
+    def testMergeRepeatedDumpFile(self):
+        try:
+            make_checkpoints()
+            with capture_stderr(main, [GOFR_CHK, GOFR_CHK, "-o", MERGED_OUT]) as output:
+                self.assertTrue("its frames will be counted more than once" in output)
+            # the same checkpoint twice gives the same normalized RDFs as the checkpoint alone
+            self.assertTrue(np.allclose(np.loadtxt(MERGED_OUT, delimiter=',', skiprows=1),
+                                        np.loadtxt(GOFR_CHK_OUT, delimiter=',', skiprows=1)))
+        finally:
+            remove_checkpoints()
@@ -4,13 +4,17 @@
 Tests for wham_rad.
 """
 
+import gzip
 import logging
+import shutil
+import tempfile
 import unittest
 import os
 import numpy as np
-from md_utils.lammps import find_atom_data
-from md_utils.lammps_dist import atom_distances, main
-from md_utils.md_common import (InvalidDataError, diff_lines, capture_stderr, capture_stdout, silent_remove)
+from md_utils.lammps import find_atom_data, find_atom_rows
+from md_utils.lammps_dist import atom_distances, iter_frame_distances, main
+from md_utils.md_common import (InvalidDataError, diff_lines, capture_stderr, capture_stdout, silent_remove,
+                                read_dump_frames, find_dump_bin, ATOM_NUM)
 
 __author__ = 'mayes'
 
@@ -34,7 +38,11 @@ GOOD_DUMP_OUT = os.path.join(LAM_DATA_DIR, 'pairs_dump_list_good.csv')
 DUMP_CUTOFF_PATH = os.path.join(LAM_DATA_DIR, '1.50_small_cutoff.dump')
 DUMP_CUTOFF_OUT = os.path.join(LAM_DATA_DIR, 'pairs_1.50_small_cutoff.csv')
 GOOD_DUMP_CUTOFF_OUT = os.path.join(LAM_DATA_DIR, 'std_pairs_1.50_small_cutoff.csv')
+DUMP_LIST_FILES = [os.path.join(LAM_DATA_DIR, 'gluprot7_{}test.dump'.format(dump_num)) for dump_num in [8, 20, 31]]
 GHOST_DUMP_LIST = os.path.join(LAM_DATA_DIR, 'ghost_dump_list.txt')
+DUMP_IDX = DUMP_PATH + '.idx.npz'
+DUMP_CUTOFF_IDX = DUMP_CUTOFF_PATH + '.idx.npz'
+DUMP_IDX_FILES = [DUMP_IDX, DUMP_CUTOFF_IDX] + [dump_file + '.idx.npz' for dump_file in DUMP_LIST_FILES]
 
 # Data #
 
@@ -76,9 +84,18 @@ ATOM_DIST = {7500000: {(4167, 17467): 14.680494519592861, (4168, 4197): 5.572394
              7500100: {(4167, 17467): 14.216006128479302, (4168, 4197): 4.540623282628058}}
 
 
+def remove_dump_indexes():
+    # the dump files are indexed to read only the lines of the atoms needed
+    for index_file in DUMP_IDX_FILES:
+        silent_remove(index_file, disable=DISABLE_REMOVE)
+
+
 # Tests #
 
 class TestFindAtomData(unittest.TestCase):
+    def tearDown(self):
+        remove_dump_indexes()
+
     def testGood(self):
         lam_atoms, lam_box = find_atom_data(DUMP_PATH, {4167, 17467})
         for box_dim in lam_box.values():
@@ -90,7 +107,23 @@ class TestFindAtomData(unittest.TestCase):
             find_atom_data(DUMP_PATH, {-97})
 
 
+class TestFindAtomRows(unittest.TestCase):
+    def testGood(self):
+        dump_frame = next(read_dump_frames(DUMP_PATH))
+        atom_ids = np.array([[4167, 17467], [17467, 4167], [4167, 4167]])
+        atom_rows = find_atom_rows(dump_frame, atom_ids, 7500000, DUMP_PATH)
+        self.assertEqual(atom_ids.tolist(), dump_frame[ATOM_NUM][atom_rows].tolist())
+
+    def testMissingAtoms(self):
+        dump_frame = next(read_dump_frames(DUMP_PATH))
+        with self.assertRaises(InvalidDataError):
+            find_atom_rows(dump_frame, np.array([4167, -97]), 7500000, DUMP_PATH)
+
+
 class TestAtomDistances(unittest.TestCase):
+    def tearDown(self):
+        remove_dump_indexes()
+
     def testTwoPair(self):
         pairs = [(4167, 17467), (4168, 4197)]
         dists = atom_distances(DUMP_PATH, pairs)
@@ -98,8 +131,19 @@ class TestAtomDistances(unittest.TestCase):
             for pair in pairs:
                 self.assertAlmostEqual(t_dist[pair], dists[tstep][pair])
 
+    def testFrameDistances(self):
+        # one time step at a time, in the order of the dump file
+        pairs = [(4167, 17467), (4168, 4197)]
+        frame_dists = list(iter_frame_distances(DUMP_PATH, pairs))
+        self.assertEqual(sorted(ATOM_DIST), [tstep for tstep, dists in frame_dists])
+        for tstep, dists in frame_dists:
+            self.assertTrue(np.allclose([ATOM_DIST[tstep][pair] for pair in pairs], dists))
+
 
 class TestMainFailWell(unittest.TestCase):
+    def tearDown(self):
+        remove_dump_indexes()
+
     def testHelp(self):
         test_input = ['-h']
         if logger.isEnabledFor(logging.DEBUG):
@@ -147,6 +191,11 @@ class TestMainFailWell(unittest.TestCase):
         with capture_stderr(main, test_input) as output:
             self.assertTrue("No such file or directory" in output)
 
+    def testZeroWorkers(self):
+        test_input = ["-f", DUMP_PATH, "-p", PAIRS_PATH, "-w", "0"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("must be at least 1" in output)
+
     # def testBadDumpFile(self):
     #     test_input = ["-f", GHOST_DUMP_LIST, "-p", PAIRS_PATH]
     #     # if logger.isEnabledFor(logging.DEBUG):
@@ -156,6 +205,9 @@ class TestMainFailWell(unittest.TestCase):
 
 
 class TestMain(unittest.TestCase):
+    def tearDown(self):
+        remove_dump_indexes()
+
     def testDefault(self):
         try:
             main(["-f", DUMP_PATH, "-p", PAIRS_PATH])
@@ -163,6 +215,14 @@ class TestMain(unittest.TestCase):
         finally:
             silent_remove(DIST_PATH)
 
+    def testDefaultWorkers(self):
+        # with more workers than dump files, the frames of the file are divided among the workers
+        try:
+            main(["-f", DUMP_PATH, "-p", PAIRS_PATH, "-w", "3"])
+            self.assertFalse(diff_lines(STD_DIST_PATH, DIST_PATH))
+        finally:
+            silent_remove(DIST_PATH)
+
     def testDumpList(self):
         try:
             main(["-l", DUMP_LIST, "-p", PAIRS_PATH2])
@@ -170,6 +230,61 @@ class TestMain(unittest.TestCase):
         finally:
             silent_remove(DUMP_OUT)
 
+    def testDumpListWorkers(self):
+        try:
+            main(["-l", DUMP_LIST, "-p", PAIRS_PATH2, "-w", "2"])
+            self.assertFalse(diff_lines(DUMP_OUT, GOOD_DUMP_OUT))
+        finally:
+            silent_remove(DUMP_OUT)
+
+    def testDumpListSplitWorkers(self):
+        # with more workers than dump files, each file's frames are divided among the workers
+        try:
+            main(["-l", DUMP_LIST, "-p", PAIRS_PATH2, "-w", "5"])
+            self.assertFalse(diff_lines(DUMP_OUT, GOOD_DUMP_OUT))
+        finally:
+            silent_remove(DUMP_OUT)
+
+    def testCompressedDump(self):
+        temp_dir = tempfile.mkdtemp()
+        c_dump = os.path.join(temp_dir, os.path.basename(DUMP_PATH))
+        try:
+            with open(DUMP_PATH, 'rb') as d:
+                with gzip.open(c_dump, 'wb') as c_file:
+                    shutil.copyfileobj(d, c_file)
+            main(["-f", c_dump, "-p", PAIRS_PATH, "-w", "2"])
+            self.assertFalse(diff_lines(os.path.join(temp_dir, os.path.basename(DIST_PATH)), STD_DIST_PATH))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def testBinCache(self):
+        # the binary cache is written first, then read in place of the dump file
+        temp_dir = tempfile.mkdtemp()
+        dump_copy = os.path.join(temp_dir, os.path.basename(DUMP_PATH))
+        try:
+            shutil.copy2(DUMP_PATH, dump_copy)
+            main(["-f", dump_copy, "-p", PAIRS_PATH, "-b"])
+            self.assertTrue(os.path.isfile(dump_copy + '.bin'))
+            self.assertFalse(diff_lines(os.path.join(temp_dir, os.path.basename(DIST_PATH)), STD_DIST_PATH))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def testSingleBinCache(self):
+        # a single precision cache is only read when allowed, giving distances close to those from the dump file
+        temp_dir = tempfile.mkdtemp()
+        dump_copy = os.path.join(temp_dir, os.path.basename(DUMP_PATH))
+        try:
+            shutil.copy2(DUMP_PATH, dump_copy)
+            main(["-f", dump_copy, "-p", PAIRS_PATH, "-b", "-s"])
+            self.assertIsNone(find_dump_bin(dump_copy))
+            self.assertEqual(find_dump_bin(dump_copy, single=True), dump_copy + '.bin')
+            dists = np.loadtxt(os.path.join(temp_dir, os.path.basename(DIST_PATH)), delimiter=',', skiprows=1,
+                               usecols=(1, 2, 3))
+            std_dists = np.loadtxt(STD_DIST_PATH, delimiter=',', skiprows=1, usecols=(1, 2, 3))
+            self.assertTrue(np.allclose(dists, std_dists, rtol=0.0, atol=1e-5))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def testFileCutoff(self):
         test_input = ["-f", DUMP_CUTOFF_PATH, "-p", PAIRS_PATH]
         try:
@@ -177,3 +292,11 @@ class TestMain(unittest.TestCase):
             self.assertFalse(diff_lines(DUMP_CUTOFF_OUT, GOOD_DUMP_CUTOFF_OUT))
         finally:
             silent_remove(DUMP_CUTOFF_OUT)
+
+    def testFileCutoffWorkers(self):
+        test_input = ["-f", DUMP_CUTOFF_PATH, "-p", PAIRS_PATH, "-w", "2"]
+        try:
+            main(test_input)
+            self.assertFalse(diff_lines(DUMP_CUTOFF_OUT, GOOD_DUMP_CUTOFF_OUT))
+        finally:
+            silent_remove(DUMP_CUTOFF_OUT)
@@ -5,8 +5,21 @@ Tests for lammps_proc.py.
 """
 import os
 import unittest
-from md_utils.lammps_proc import main, WAT_H_TYPE, WAT_O_TYPE, PROT_O_IDS, H3O_O_TYPE, H3O_H_TYPE
-from md_utils.md_common import capture_stdout, capture_stderr, diff_lines, silent_remove
+import numpy as np
+from md_utils.lammps_proc import (main, WAT_H_TYPE, WAT_O_TYPE, PROT_O_IDS, H3O_O_TYPE, H3O_H_TYPE, DEF_CFG_VALS,
+                                  PROT_RES_MOL_ID, PROT_H_TYPE, PROT_C_ID, find_atom_selections, SEL_WATER_O,
+                                  SEL_WATER_H, SEL_HYDRONIUM, SEL_CARBOXYL_O, SEL_CARBOXYL_C, SEL_PROT_H,
+                                  plan_calcs, STEP_EXCESS_H, STEP_CLOSEST_O, STEP_DA_GEOM, STEP_HIJ_ARQ, STEP_HYD_WAT,
+                                  OH_MIN, HIJ_ARQ, R_OO_HYD_WAT, switch_func, gofr_bin_ids, group_gofr_pairs,
+                                  read_gofr_checkpoint, write_gofr_checkpoint, HO_STEPS_COUNTED, new_msd_data,
+                                  add_msd_frames, calc_msd, MSD_MAX_LAG, MSD_ATOM_NUMS, MSD_ATOM_TYPE, CALC_CEC_MSD,
+                                  MSD_XYZ, MSD_BOX, TIMESTEP, new_res_data, add_res_frames, calc_res_corr,
+                                  add_msd_data, add_res_data,
+                                  RES_MAX_LAG, RES_OCC, RES_NUM_WATERS, setup_evb_sum, new_evb_cursor,
+                                  find_evb_vals, close_evb_cursor, EVB_SUM_FILE, ALIGN_COL, CALC_CEC_DIST, EVB_DICT,
+                                  EVB_KEYS, EVB_INDEX_STRIDE)
+from md_utils.md_common import (capture_stdout, capture_stderr, diff_lines, silent_remove, ATOM_NUM, MOL_NUM,
+                                ATOM_TYPE, InvalidDataError, read_csv_to_dict, find_dump_bin)
 import logging
 
 # logging.basicConfig(level=logging.DEBUG)
@@ -84,6 +97,12 @@ GOOD_HIJ_ARQ_OUT = os.path.join(SUB_DATA_DIR, 'glue_revised_arq_good.csv')
 
 HIJ_NEW_INI = os.path.join(SUB_DATA_DIR, 'calc_hij_arq_new.ini')
 GOOD_HIJ_NEW_OUT = os.path.join(SUB_DATA_DIR, 'glue_revised_new_hij_good.csv')
+HIJ_NEW_BATCH_INI = os.path.join(SUB_DATA_DIR, 'calc_hij_arq_new_batch.ini')
+HIJ_NEW_SWEEP_INI = os.path.join(SUB_DATA_DIR, 'calc_hij_arq_new_sweep.ini')
+GOOD_HIJ_NEW_SWEEP_OUT = os.path.join(SUB_DATA_DIR, 'glue_revised_new_sweep_sum_good.csv')
+HIJ_NEW_SWEEP_PARAMS = os.path.join(SUB_DATA_DIR, 'glue_revised_new_sweep.csv')
+GOOD_HIJ_NEW_SWEEP_PARAMS = os.path.join(SUB_DATA_DIR, 'glue_revised_new_sweep_good.csv')
+HIJ_NEW_SWEEP_MISMATCH_INI = os.path.join(SUB_DATA_DIR, 'calc_hij_arq_new_sweep_mismatch.ini')
 
 HIJ_NEW_GLU2_INI = os.path.join(SUB_DATA_DIR, 'calc_hij_glu_arq_new.ini')
 HIJ_NEW_GLU2_OUT = os.path.join(SUB_DATA_DIR, 'gluprot10_10no_evb_sum.csv')
@@ -94,6 +113,13 @@ HIJ_NEW_NONFLOAT_PARAM_INI = os.path.join(SUB_DATA_DIR, 'calc_hij_arq_new_non_fl
 
 CALC_GLU_PROPS_INI = os.path.join(SUB_DATA_DIR, 'calc_glu_props.ini')
 GOOD_GLU_PROPS_OUT = os.path.join(SUB_DATA_DIR, 'gluprot10_10no_evb_oco_good.csv')
+# the angle and dihedral listed match those calculated with calc_glu_props.ini
+INTERNAL_COORDS_INI = os.path.join(SUB_DATA_DIR, 'calc_internal_coords.ini')
+GOOD_INTERNAL_COORDS_OUT = os.path.join(SUB_DATA_DIR, 'gluprot10_10no_evb_internal_good.csv')
+INTERNAL_COORDS_BAD_INI = os.path.join(SUB_DATA_DIR, 'calc_internal_coords_bad.ini')
+COORD_NUMS_INI = os.path.join(SUB_DATA_DIR, 'calc_coord_nums.ini')
+GOOD_COORD_NUMS_OUT = os.path.join(SUB_DATA_DIR, 'gluprot10_10no_evb_coord_good.csv')
+COORD_NUMS_BAD_INI = os.path.join(SUB_DATA_DIR, 'calc_coord_nums_bad.ini')
 
 COMBINE_CEC_INI = os.path.join(SUB_DATA_DIR, 'calc_cec_dist.ini')
 COMBINE_CEC_OUT = os.path.join(SUB_DATA_DIR, '2.400_320_short_sum.csv')
@@ -106,6 +132,43 @@ GOOD_COMBINE_CEC_MULTI_FILE_OUT = os.path.join(SUB_DATA_DIR, 'gluprot1min_dump_s
 COMBINE_CEC_ONLY_STEPS_INI = os.path.join(SUB_DATA_DIR, 'calc_cec_dist_restrict_timesteps.ini')
 COMBINE_CEC_ONLY_STEPS_OUT = os.path.join(SUB_DATA_DIR, '2.400_320_short_sum.csv')
 GOOD_COMBINE_CEC_ONLY_STEPS_OUT = os.path.join(SUB_DATA_DIR, '2.400_320_restrict_timestep_good.csv')
+COMBINE_CEC_ONLY_STEPS_IDX = os.path.join(SUB_DATA_DIR, '2.400_320_short.dump.idx.npz')
+LONG_DUMP_IDX = os.path.join(SUB_DATA_DIR, '1.625_0a_21steps.dump.idx.npz')
+LONG_DUMP = os.path.join(SUB_DATA_DIR, '1.625_0a_21steps.dump')
+LONG_DUMP_BIN = LONG_DUMP + '.bin'
+INCOMP_DUMP_IDX = os.path.join(SUB_DATA_DIR, 'glue_incomp.dump.idx.npz')
+
+GOFR_CHK_9_STEPS_INI = os.path.join(SUB_DATA_DIR, 'gofr_chk_long_9steps.ini')
+GOFR_CHK_RESUME_INI = os.path.join(SUB_DATA_DIR, 'gofr_chk_long_resume.ini')
+GOFR_CHK_NO_FILE_INI = os.path.join(SUB_DATA_DIR, 'gofr_chk_no_file.ini')
+GOFR_CHK_INI = os.path.join(SUB_DATA_DIR, 'gofr_chk.ini')
+GOFR_CHK_LONG = os.path.join(SUB_DATA_DIR, 'glue_dump_long_gofrs.npz')
+GOFR_CHK = os.path.join(SUB_DATA_DIR, 'glue_dump_gofrs.npz')
+
+MSD_INI = os.path.join(SUB_DATA_DIR, 'calc_msd.ini')
+MSD_BAD_FIT_INI = os.path.join(SUB_DATA_DIR, 'calc_msd_bad_fit.ini')
+MSD_BIN_INI = os.path.join(SUB_DATA_DIR, 'calc_msd_bin.ini')
+MSD_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_msd.csv')
+GOOD_MSD_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_msd_good.csv')
+DIFFUSION_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_diffusion.csv')
+GOOD_DIFFUSION_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_diffusion_good.csv')
+CEC_MSD_INI = os.path.join(SUB_DATA_DIR, 'calc_cec_msd.ini')
+CEC_MSD_OUT = os.path.join(SUB_DATA_DIR, 'list_msd.csv')
+GOOD_CEC_MSD_OUT = os.path.join(SUB_DATA_DIR, '2.400_320_cec_msd_good.csv')
+
+RES_TIME_INI = os.path.join(SUB_DATA_DIR, 'calc_res_time.ini')
+RES_CORR_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_res_corr.csv')
+GOOD_RES_CORR_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_res_corr_good.csv')
+RES_TIMES_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_res_times.csv')
+GOOD_RES_TIMES_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_res_times_good.csv')
+
+DENSITY_INI = os.path.join(SUB_DATA_DIR, 'calc_density.ini')
+DENSITY_NO_CARB_INI = os.path.join(SUB_DATA_DIR, 'calc_density_no_carb.ini')
+DENSITY_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_density.dx')
+GOOD_DENSITY_OUT = os.path.join(SUB_DATA_DIR, 'glue_dump_long_density_good.dx')
+
+# written by the evb summary file tests
+EVB_SUM_CSV = os.path.join(SUB_DATA_DIR, 'evb_sum_test.csv')
 
 HIJ_ARQ6_GLU2_INI = os.path.join(SUB_DATA_DIR, 'calc_hij_arq6.ini')
 
@@ -114,6 +177,205 @@ good_long_out_msg = 'md_utils/tests/test_data/lammps_proc/glue_dump_long_gofrs.c
                     'Continuing program.\nCompleted reading'
 
 
+class TestAtomSelections(unittest.TestCase):
+    def testTypeChange(self):
+        # selections carried from the previous timestep are updated when atom types change
+        cfg = dict(DEF_CFG_VALS)
+        cfg.update({PROT_RES_MOL_ID: 1, PROT_O_IDS: [2, 3], PROT_C_ID: 1, PROT_H_TYPE: 5, WAT_O_TYPE: 2,
+                    WAT_H_TYPE: 1, H3O_O_TYPE: 3, H3O_H_TYPE: 4})
+        frame = {ATOM_NUM: np.arange(1, 11), MOL_NUM: np.array([1, 1, 1, 1, 2, 2, 2, 3, 3, 3]),
+                 ATOM_TYPE: np.array([6, 7, 7, 5, 2, 1, 1, 2, 1, 1])}
+        atom_selections = {}
+        find_atom_selections(cfg, frame, atom_selections)
+        self.assertEqual([1, 2], atom_selections[SEL_CARBOXYL_O].tolist())
+        self.assertEqual([0], atom_selections[SEL_CARBOXYL_C].tolist())
+        self.assertEqual([3], atom_selections[SEL_PROT_H].tolist())
+        self.assertEqual([4, 7], atom_selections[SEL_WATER_O].tolist())
+        self.assertEqual([5, 6, 8, 9], atom_selections[SEL_WATER_H].tolist())
+        self.assertEqual([], atom_selections[SEL_HYDRONIUM].tolist())
+        # the proton moves from the residue to the second water
+        next_frame = dict(frame)
+        next_frame[ATOM_TYPE] = np.array([6, 7, 7, 8, 2, 1, 1, 3, 4, 4])
+        find_atom_selections(cfg, next_frame, atom_selections)
+        self.assertEqual([], atom_selections[SEL_PROT_H].tolist())
+        self.assertEqual([4], atom_selections[SEL_WATER_O].tolist())
+        self.assertEqual([5, 6], atom_selections[SEL_WATER_H].tolist())
+        self.assertEqual([7, 8, 9], atom_selections[SEL_HYDRONIUM].tolist())
+
+
+class TestCalcPlan(unittest.TestCase):
+    def testNoFields(self):
+        self.assertEqual([], plan_calcs([]))
+
+    def testUsedSteps(self):
+        # only the steps needed for the requested fields are planned, in the order they are run
+        self.assertEqual([STEP_EXCESS_H, STEP_CLOSEST_O, STEP_DA_GEOM, STEP_HIJ_ARQ], plan_calcs([HIJ_ARQ]))
+        self.assertEqual([STEP_EXCESS_H, STEP_HYD_WAT], plan_calcs([OH_MIN, R_OO_HYD_WAT]))
+
+
+class TestSwitchFunc(unittest.TestCase):
+    def testSwitchValues(self):
+        switches = switch_func(3.5, 2.5, [1.0, 2.5, 3.0, 3.5, 4.0])
+        self.assertTrue(np.allclose([1.0, 1.0, 0.5, 0.0, 0.0], switches))
+
+
+class TestGofrBins(unittest.TestCase):
+    def testBinsAsHistogram(self):
+        # including distances on the bin edges, where rounding could place them in a neighboring bin
+        gofr_bins = np.arange(0.0, 12.0 + 0.05, 0.05)
+        dists = np.concatenate([gofr_bins, np.random.RandomState(3).uniform(0.0, 12.0, 1000)])
+        bin_counts = np.bincount(gofr_bin_ids(dists, gofr_bins), minlength=len(gofr_bins) - 1)
+        self.assertTrue(np.array_equal(np.histogram(dists, gofr_bins)[0], bin_counts))
+
+    def testGroupPairs(self):
+        # the first two share their first atom set; their combined second set matches the third's
+        gofr_pairs = [('a', 'a_steps', np.array([1]), np.array([2, 3])), ('b', 'b_steps', np.array([1]), np.array([4])),
+                      ('c', 'c_steps', np.array([5, 6]), np.array([2, 3, 4])),
+                      ('d', 'd_steps', np.array([2, 3]), np.array([2, 3]))]
+        groups = group_gofr_pairs(gofr_pairs, 8)
+        self.assertEqual(2, len(groups))
+        group_atoms = sorted((a_atoms.tolist(), b_atoms.tolist(), sorted(gofr_indices))
+                             for a_atoms, b_atoms, gofr_indices in groups)
+        self.assertEqual([([1, 5, 6], [2, 3, 4], [0, 1, 2]), ([2, 3], [2, 3], [3])], group_atoms)
+
+
+class TestMSD(unittest.TestCase):
+    def testStreamingMatchesDirect(self):
+        # positions wrapped into the box, and added a few frames at a time, so they are correlated over several chunks
+        rand_state = np.random.RandomState(5)
+        box = np.array([10.0, 12.0, 9.0])
+        num_frames = 250
+        true_xyz = np.cumsum(rand_state.normal(scale=0.5, size=(num_frames, 4, 3)), axis=0)
+        wrapped_xyz = true_xyz - box * np.floor(true_xyz / box)
+        cfg = {MSD_MAX_LAG: 40, MSD_ATOM_NUMS: [1, 2, 3], MSD_ATOM_TYPE: -1, CALC_CEC_MSD: True}
+        msd_data = new_msd_data(cfg)
+        for first_frame in range(0, num_frames, 30):
+            add_msd_frames(cfg, msd_data, [{TIMESTEP: frame, MSD_XYZ: [wrapped_xyz[frame, :3], wrapped_xyz[frame, 3:]],
+                                            MSD_BOX: box} for frame in range(first_frame,
+                                                                             min(first_frame + 30, num_frames))])
+        lags, msds = calc_msd(cfg, msd_data)
+        self.assertEqual(list(range(41)), lags.tolist())
+        for lag in lags:
+            sq_disps = np.sum(np.square(true_xyz[lag:] - true_xyz[:num_frames - lag]), axis=-1)
+            self.assertTrue(np.allclose([sq_disps[:, :3].mean(), sq_disps[:, 3:].mean()], msds[lag]))
+
+    def testAddRanges(self):
+        # ranges of frames added separately (as by worker processes), some shorter than the max lag, then combined
+        rand_state = np.random.RandomState(11)
+        box = np.array([10.0, 12.0, 9.0])
+        num_frames = 260
+        true_xyz = np.cumsum(rand_state.normal(scale=0.5, size=(num_frames, 4, 3)), axis=0)
+        wrapped_xyz = true_xyz - box * np.floor(true_xyz / box)
+        cfg = {MSD_MAX_LAG: 40, MSD_ATOM_NUMS: [1, 2, 3], MSD_ATOM_TYPE: -1, CALC_CEC_MSD: True}
+        msd_data = new_msd_data(cfg)
+        for first_frame, last_frame in [(0, 15), (15, 140), (140, 170), (170, 200), (200, 260)]:
+            range_msd_data = new_msd_data(cfg)
+            add_msd_frames(cfg, range_msd_data, [{TIMESTEP: frame, MSD_XYZ: [wrapped_xyz[frame, :3],
+                                                                             wrapped_xyz[frame, 3:]],
+                                                  MSD_BOX: box} for frame in range(first_frame, last_frame)])
+            add_msd_data(cfg, msd_data, range_msd_data)
+        lags, msds = calc_msd(cfg, msd_data)
+        self.assertEqual(list(range(41)), lags.tolist())
+        for lag in lags:
+            sq_disps = np.sum(np.square(true_xyz[lag:] - true_xyz[:num_frames - lag]), axis=-1)
+            self.assertTrue(np.allclose([sq_disps[:, :3].mean(), sq_disps[:, 3:].mean()], msds[lag]))
+
+
+class TestResTime(unittest.TestCase):
+    def testStreamingMatchesDirect(self):
+        # occupancies added a few frames at a time, so they are correlated over several chunks
+        rand_state = np.random.RandomState(7)
+        num_frames = 230
+        # two carboxylic oxygen atoms and 21 waters, with waters tending to stay within (or outside) the cutoff
+        occupied = np.cumsum(rand_state.rand(num_frames, 2, 21) < 0.05, axis=0) % 2 == 1
+        occupied[:, 1, :] = False
+        occupied[100:, 1, 20] = True
+        cfg = {RES_MAX_LAG: 30}
+        res_data = new_res_data()
+        for first_frame in range(0, num_frames, 40):
+            add_res_frames(cfg, res_data, [{TIMESTEP: frame, RES_NUM_WATERS: 21,
+                                            RES_OCC: np.packbits(occupied[frame], axis=-1)}
+                                           for frame in range(first_frame, min(first_frame + 40, num_frames))])
+        lags, res_corr = calc_res_corr(cfg, res_data)
+        self.assertEqual(list(range(31)), lags.tolist())
+        mean_occ = occupied.sum(axis=(0, 2)) / float(num_frames)
+        for lag in lags:
+            corr = np.sum(occupied[lag:] & occupied[:num_frames - lag], axis=(0, 2)) / float(num_frames - lag)
+            self.assertTrue(np.allclose(corr / mean_occ, res_corr[lag]))
+
+    def testAddRanges(self):
+        # ranges of frames added separately (as by worker processes), some shorter than the max lag, then combined
+        rand_state = np.random.RandomState(13)
+        num_frames = 230
+        occupied = np.cumsum(rand_state.rand(num_frames, 2, 21) < 0.05, axis=0) % 2 == 1
+        cfg = {RES_MAX_LAG: 30}
+        res_data = new_res_data()
+        for first_frame, last_frame in [(0, 10), (10, 25), (25, 150), (150, 230)]:
+            range_res_data = new_res_data()
+            add_res_frames(cfg, range_res_data, [{TIMESTEP: frame, RES_NUM_WATERS: 21,
+                                                  RES_OCC: np.packbits(occupied[frame], axis=-1)}
+                                                 for frame in range(first_frame, last_frame)])
+            add_res_data(cfg, res_data, range_res_data)
+        lags, res_corr = calc_res_corr(cfg, res_data)
+        mean_occ = occupied.sum(axis=(0, 2)) / float(num_frames)
+        for lag in lags:
+            corr = np.sum(occupied[lag:] & occupied[:num_frames - lag], axis=(0, 2)) / float(num_frames - lag)
+            self.assertTrue(np.allclose(corr / mean_occ, res_corr[lag]))
+
+    def testChangedWaterCount(self):
+        res_data = new_res_data()
+        frames = [{TIMESTEP: 0, RES_NUM_WATERS: 8, RES_OCC: np.zeros((2, 1), dtype=np.uint8)},
+                  {TIMESTEP: 10, RES_NUM_WATERS: 9, RES_OCC: np.zeros((2, 2), dtype=np.uint8)}]
+        with self.assertRaises(InvalidDataError):
+            add_res_frames({RES_MAX_LAG: 5}, res_data, frames)
+
+
+def write_evb_sum(timesteps):
+    with open(EVB_SUM_CSV, 'w') as csv_file:
+        csv_file.write('"timestep","ene_total","cec_x"\n')
+        for row_num, timestep in enumerate(timesteps):
+            csv_file.write('{},{},{}\n'.format(timestep, row_num, timestep * 0.5))
+
+
+def check_evb_vals(test_case, timesteps, requested_steps):
+    # values found by following the evb summary file match those of reading the whole file
+    write_evb_sum(timesteps)
+    cfg = {EVB_SUM_FILE: EVB_SUM_CSV, ALIGN_COL: TIMESTEP, CALC_CEC_DIST: False, CALC_CEC_MSD: False}
+    evb_sum = setup_evb_sum(cfg, [TIMESTEP])
+    evb_dict = read_csv_to_dict(EVB_SUM_CSV, TIMESTEP)
+    evb_cursor = new_evb_cursor()
+    for timestep in requested_steps:
+        if timestep in evb_dict:
+            good_vals = [evb_dict[timestep]['ene_total'], evb_dict[timestep]['cec_x']]
+        else:
+            good_vals = None
+        test_case.assertEqual(good_vals, find_evb_vals(cfg, evb_sum, evb_cursor, timestep))
+    close_evb_cursor(evb_cursor)
+    return evb_sum
+
+
+class TestEvbSum(unittest.TestCase):
+    def testSortedFile(self):
+        # more rows than are indexed, with missing and repeated timesteps, requested in order, repeated (as for
+        #     overlapping dump files), and out of order
+        rand_state = np.random.RandomState(11)
+        timesteps = sorted(rand_state.choice(np.arange(0, 12000, 2), 2500, replace=False).tolist() + [2000, 2000])
+        requested_steps = list(range(-2, 12004, 3)) + [2000, 2000, 1998] + rand_state.randint(0, 12000, 500).tolist()
+        try:
+            evb_sum = check_evb_vals(self, timesteps, requested_steps)
+            self.assertIsNone(evb_sum[EVB_DICT])
+            self.assertEqual(len(timesteps) // EVB_INDEX_STRIDE + 1, len(evb_sum[EVB_KEYS]))
+        finally:
+            silent_remove(EVB_SUM_CSV, disable=DISABLE_REMOVE)
+
+    def testUnsortedFile(self):
+        try:
+            with capture_stderr(check_evb_vals, self, [20, 40, 0, 60], [0, 10, 20, 60, 40]) as output:
+                self.assertTrue("is not sorted by 'timestep'" in output)
+        finally:
+            silent_remove(EVB_SUM_CSV, disable=DISABLE_REMOVE)
+
+
 class TestLammpsProcDataNoOutput(unittest.TestCase):
     # These tests only check for (hopefully) helpful messages
     def testHelp(self):
@@ -145,6 +407,10 @@ class TestLammpsProcDataNoOutput(unittest.TestCase):
         with capture_stdout(main, test_input) as output:
             self.assertTrue("optional arguments" in output)
 
+    def testZeroWorkers(self):
+        with capture_stderr(main, ["-c", HO_GOFR_INI_PATH, "-w", "0"]) as output:
+            self.assertTrue("must be at least 1" in output)
+
     def testMissDump(self):
         with capture_stderr(main, ["-c", MISS_DUMP_INI]) as output:
             self.assertTrue("No such file or directory" in output)
@@ -222,6 +488,60 @@ class TestLammpsProcDataNoOutput(unittest.TestCase):
         with capture_stderr(main, test_input) as output:
             self.assertTrue("Missing input value for key" in output)
 
+    def testInternalCoordsWrongNumAtoms(self):
+        test_input = ["-c", INTERNAL_COORDS_BAD_INI]
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("expected 3 comma-separated integer atom ids" in output)
+
+    def testCoordNumsBadDists(self):
+        test_input = ["-c", COORD_NUMS_BAD_INI]
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("then the switching distance and a larger cut-off" in output)
+
+    def testNewHIJSweepMismatch(self):
+        test_input = ["-c", HIJ_NEW_SWEEP_MISMATCH_INI]
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("Found 2 values for key 'new_vij'" in output)
+
+    def testGofrResumeNoCheckpointFile(self):
+        test_input = ["-c", GOFR_CHK_NO_FILE_INI]
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("To resume from a g(r) checkpoint, specify the checkpoint file" in output)
+
+    def testGofrResumeWrongDumpFiles(self):
+        # the checkpoint was written for the glue.dump file, not the one listed for the run
+        try:
+            silent_remove(GOFR_CHK_LONG)
+            main(["-c", GOFR_CHK_INI])
+            os.rename(GOFR_CHK, GOFR_CHK_LONG)
+            with capture_stderr(main, ["-c", GOFR_CHK_RESUME_INI]) as output:
+                self.assertTrue("was not written while reading the dump files listed for this run" in output)
+        finally:
+            silent_remove(GOFR_CHK_LONG, disable=DISABLE_REMOVE)
+            silent_remove(DEF_GOFR_OUT, disable=DISABLE_REMOVE)
+
+    def testMSDBadFitLags(self):
+        test_input = ["-c", MSD_BAD_FIT_INI]
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("To fit diffusion coefficients, specify the first and last lag" in output)
+
+    def testDensityNoCarbon(self):
+        test_input = ["-c", DENSITY_NO_CARB_INI]
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("specify the carboxylic carbon atom" in output)
+
     def testMissNewHIJNonfloatParam(self):
         test_input = ["-c", HIJ_NEW_NONFLOAT_PARAM_INI]
         if logger.isEnabledFor(logging.DEBUG):
@@ -275,6 +595,16 @@ class TestLammpsProcData(unittest.TestCase):
         finally:
             silent_remove(DEF_GOFR_INCOMP_OUT, disable=DISABLE_REMOVE)
 
+    def testIncompDumpWorkers(self):
+        # frames after the incomplete frame are ignored, as when the file is read in series
+        try:
+            with capture_stderr(main, ["-c", INCOMP_DUMP_INI_PATH, "-w", "4"]) as output:
+                self.assertTrue("WARNING" in output)
+            self.assertFalse(diff_lines(DEF_GOFR_INCOMP_OUT, GOOD_HO_GOFR_OUT_PATH))
+        finally:
+            silent_remove(DEF_GOFR_INCOMP_OUT, disable=DISABLE_REMOVE)
+            silent_remove(INCOMP_DUMP_IDX, disable=DISABLE_REMOVE)
+
     def testHOGofR(self):
         try:
             main(["-c", HO_GOFR_INI_PATH])
@@ -321,6 +651,119 @@ class TestLammpsProcData(unittest.TestCase):
         finally:
             silent_remove(DEF_MAX_STEPS_OUT, disable=DISABLE_REMOVE)
 
+    def testHO_OO_HH_OHGofR_MaxStepsWorkers(self):
+        # results from dump files read in parallel are combined to give the same output as when read in series;
+        # with only one dump file, its frames are divided among the workers
+        try:
+            with capture_stdout(main, ["-c", HO_OO_HH_OH_GOFR_INI_MAX_STEPS, "-w", "2"]) as output:
+                self.assertTrue("Reached the maximum timesteps" in output)
+            self.assertFalse(diff_lines(DEF_MAX_STEPS_OUT, GOOD_HO_OO_HH_OH_GOFR_OUT_MAX_STEPS))
+        finally:
+            silent_remove(DEF_MAX_STEPS_OUT, disable=DISABLE_REMOVE)
+            silent_remove(LONG_DUMP_IDX, disable=DISABLE_REMOVE)
+
+    def testGofrCheckpointResume(self):
+        # a checkpoint for a run stopped after 9 frames of the dump file is made from the output of a run of only 9
+        #     frames; resuming from it gives the same output as an uninterrupted run
+        try:
+            main(["-c", GOFR_CHK_9_STEPS_INI])
+            gofr_data, g_dr, done_files, partial_file, partial_frames = read_gofr_checkpoint(GOFR_CHK_LONG)
+            self.assertEqual((1, '', 0), (len(done_files), partial_file, partial_frames))
+            write_gofr_checkpoint(GOFR_CHK_LONG, gofr_data, g_dr, [], partial_file=done_files[0], partial_frames=9)
+            with capture_stdout(main, ["-c", GOFR_CHK_RESUME_INI]) as output:
+                self.assertTrue("0 dump file(s) and 9 frame(s) of the next already read" in output)
+            self.assertFalse(diff_lines(DEF_MAX_STEPS_OUT, GOOD_HO_OO_HH_OH_GOFR_OUT_MAX_STEPS))
+            self.assertEqual(20, read_gofr_checkpoint(GOFR_CHK_LONG)[0][HO_STEPS_COUNTED])
+        finally:
+            silent_remove(DEF_MAX_STEPS_OUT, disable=DISABLE_REMOVE)
+            silent_remove(GOFR_CHK_LONG, disable=DISABLE_REMOVE)
+            silent_remove(LONG_DUMP_IDX, disable=DISABLE_REMOVE)
+
+    def testGofrCheckpointResumeWorkers(self):
+        # resuming part way through a dump file requires reading it in series
+        try:
+            main(["-c", GOFR_CHK_9_STEPS_INI])
+            gofr_data, g_dr, done_files, partial_file, partial_frames = read_gofr_checkpoint(GOFR_CHK_LONG)
+            write_gofr_checkpoint(GOFR_CHK_LONG, gofr_data, g_dr, [], partial_file=done_files[0], partial_frames=9)
+            with capture_stderr(main, ["-c", GOFR_CHK_RESUME_INI, "-w", "2"]) as output:
+                self.assertTrue("was written part way through dump file" in output)
+        finally:
+            silent_remove(DEF_MAX_STEPS_OUT, disable=DISABLE_REMOVE)
+            silent_remove(GOFR_CHK_LONG, disable=DISABLE_REMOVE)
+
+    def testMSD(self):
+        try:
+            main(["-c", MSD_INI])
+            self.assertFalse(diff_lines(MSD_OUT, GOOD_MSD_OUT))
+            self.assertFalse(diff_lines(DIFFUSION_OUT, GOOD_DIFFUSION_OUT))
+        finally:
+            silent_remove(MSD_OUT, disable=DISABLE_REMOVE)
+            silent_remove(DIFFUSION_OUT, disable=DISABLE_REMOVE)
+
+    def testMSDWorkers(self):
+        # the frames read by each worker are unwrapped in order by the parent process
+        try:
+            main(["-c", MSD_INI, "-w", "2"])
+            self.assertFalse(diff_lines(MSD_OUT, GOOD_MSD_OUT))
+        finally:
+            silent_remove(MSD_OUT, disable=DISABLE_REMOVE)
+            silent_remove(DIFFUSION_OUT, disable=DISABLE_REMOVE)
+            silent_remove(LONG_DUMP_IDX, disable=DISABLE_REMOVE)
+
+    def testMSDBinCacheWorkers(self):
+        # the binary cache is written first, then its frames are divided among the workers
+        try:
+            main(["-c", MSD_BIN_INI])
+            self.assertEqual(find_dump_bin(LONG_DUMP), LONG_DUMP_BIN)
+            self.assertFalse(diff_lines(MSD_OUT, GOOD_MSD_OUT))
+            self.assertFalse(diff_lines(DIFFUSION_OUT, GOOD_DIFFUSION_OUT))
+        finally:
+            silent_remove(MSD_OUT, disable=DISABLE_REMOVE)
+            silent_remove(DIFFUSION_OUT, disable=DISABLE_REMOVE)
+            silent_remove(LONG_DUMP_IDX, disable=DISABLE_REMOVE)
+            silent_remove(LONG_DUMP_BIN, disable=DISABLE_REMOVE)
+
+    def testCecMSD(self):
+        try:
+            main(["-c", CEC_MSD_INI])
+            self.assertFalse(diff_lines(CEC_MSD_OUT, GOOD_CEC_MSD_OUT))
+        finally:
+            silent_remove(CEC_MSD_OUT, disable=DISABLE_REMOVE)
+            silent_remove(COMBINE_CEC_ONLY_STEPS_IDX, disable=DISABLE_REMOVE)
+
+    def testResTime(self):
+        try:
+            main(["-c", RES_TIME_INI])
+            self.assertFalse(diff_lines(RES_CORR_OUT, GOOD_RES_CORR_OUT))
+            self.assertFalse(diff_lines(RES_TIMES_OUT, GOOD_RES_TIMES_OUT))
+        finally:
+            silent_remove(RES_CORR_OUT, disable=DISABLE_REMOVE)
+            silent_remove(RES_TIMES_OUT, disable=DISABLE_REMOVE)
+
+    def testResTimeWorkers(self):
+        try:
+            main(["-c", RES_TIME_INI, "-w", "2"])
+            self.assertFalse(diff_lines(RES_CORR_OUT, GOOD_RES_CORR_OUT))
+        finally:
+            silent_remove(RES_CORR_OUT, disable=DISABLE_REMOVE)
+            silent_remove(RES_TIMES_OUT, disable=DISABLE_REMOVE)
+            silent_remove(LONG_DUMP_IDX, disable=DISABLE_REMOVE)
+
+    def testDensity(self):
+        try:
+            main(["-c", DENSITY_INI])
+            self.assertFalse(diff_lines(DENSITY_OUT, GOOD_DENSITY_OUT))
+        finally:
+            silent_remove(DENSITY_OUT, disable=DISABLE_REMOVE)
+
+    def testDensityWorkers(self):
+        try:
+            main(["-c", DENSITY_INI, "-w", "2"])
+            self.assertFalse(diff_lines(DENSITY_OUT, GOOD_DENSITY_OUT))
+        finally:
+            silent_remove(DENSITY_OUT, disable=DISABLE_REMOVE)
+            silent_remove(LONG_DUMP_IDX, disable=DISABLE_REMOVE)
+
     def testHIJArqNew(self):
         # Test calculating the Maupin form
         try:
@@ -330,6 +773,26 @@ class TestLammpsProcData(unittest.TestCase):
         finally:
             silent_remove(HIJ_ARQ_OUT, disable=DISABLE_REMOVE)
 
+    def testHIJArqNewSweep(self):
+        # the first parameter set matches the parameters of testHIJArqNew
+        try:
+            test_input = ["-c", HIJ_NEW_SWEEP_INI, "-p"]
+            main(test_input)
+            self.assertFalse(diff_lines(HIJ_ARQ_OUT, GOOD_HIJ_NEW_SWEEP_OUT))
+            self.assertFalse(diff_lines(HIJ_NEW_SWEEP_PARAMS, GOOD_HIJ_NEW_SWEEP_PARAMS))
+        finally:
+            silent_remove(HIJ_ARQ_OUT, disable=DISABLE_REMOVE)
+            silent_remove(HIJ_NEW_SWEEP_PARAMS, disable=DISABLE_REMOVE)
+
+    def testHIJArqNewBatch(self):
+        # same results when the hij formulas are evaluated for all frames at once, including with intermediate output
+        try:
+            test_input = ["-c", HIJ_NEW_BATCH_INI]
+            main(test_input)
+            self.assertFalse(diff_lines(HIJ_ARQ_OUT, GOOD_HIJ_NEW_OUT))
+        finally:
+            silent_remove(HIJ_ARQ_OUT, disable=DISABLE_REMOVE)
+
     def testHIJArqNew2(self):
         # Test calculating the Maupin form
         try:
@@ -343,6 +806,22 @@ class TestLammpsProcData(unittest.TestCase):
         finally:
             silent_remove(HIJ_NEW_GLU2_OUT, disable=DISABLE_REMOVE)
 
+    def testInternalCoords(self):
+        try:
+            test_input = ["-c", INTERNAL_COORDS_INI, "-p"]
+            main(test_input)
+            self.assertFalse(diff_lines(HIJ_NEW_GLU2_OUT, GOOD_INTERNAL_COORDS_OUT))
+        finally:
+            silent_remove(HIJ_NEW_GLU2_OUT, disable=DISABLE_REMOVE)
+
+    def testCoordNums(self):
+        try:
+            test_input = ["-c", COORD_NUMS_INI, "-p"]
+            main(test_input)
+            self.assertFalse(diff_lines(HIJ_NEW_GLU2_OUT, GOOD_COORD_NUMS_OUT))
+        finally:
+            silent_remove(HIJ_NEW_GLU2_OUT, disable=DISABLE_REMOVE)
+
     def testCalcProps(self):
         try:
             test_input = ["-c", CALC_GLU_PROPS_INI, "-p"]
@@ -370,13 +849,26 @@ class TestLammpsProcData(unittest.TestCase):
         finally:
             silent_remove(COMBINE_CEC_MULTI_FILE_OUT, disable=DISABLE_REMOVE)
 
+    def testCombineCECMultifileWorkers(self):
+        try:
+            test_input = ["-c", COMBINE_CEC_MULTI_FILE_INI, "-w", "3"]
+            main(test_input)
+            self.assertFalse(diff_lines(COMBINE_CEC_MULTI_FILE_OUT, GOOD_COMBINE_CEC_MULTI_FILE_OUT))
+        finally:
+            silent_remove(COMBINE_CEC_MULTI_FILE_OUT, disable=DISABLE_REMOVE)
+
     def testCombineCECRestrictTimesteps(self):
         try:
             test_input = ["-c", COMBINE_CEC_ONLY_STEPS_INI]
             main(test_input)
             self.assertFalse(diff_lines(COMBINE_CEC_ONLY_STEPS_OUT, GOOD_COMBINE_CEC_ONLY_STEPS_OUT))
+            # the dump file index is reused when the dump file has not changed
+            self.assertTrue(os.path.isfile(COMBINE_CEC_ONLY_STEPS_IDX))
+            main(test_input)
+            self.assertFalse(diff_lines(COMBINE_CEC_ONLY_STEPS_OUT, GOOD_COMBINE_CEC_ONLY_STEPS_OUT))
         finally:
             silent_remove(COMBINE_CEC_ONLY_STEPS_OUT, disable=DISABLE_REMOVE)
+            silent_remove(COMBINE_CEC_ONLY_STEPS_IDX, disable=DISABLE_REMOVE)
 
     def testHIJArq6(self):
         # Test calculating the Maupin form
@@ -4,7 +4,10 @@
 Tests for md_utils script
 """
 
+import gzip
 import logging
+import shutil
+import tempfile
 import unittest
 import os
 
@@ -87,6 +90,18 @@ class TestMain(unittest.TestCase):
         finally:
             silent_remove(LOG_OUT, disable=DISABLE_REMOVE)
 
+    def testCompressedLogFile(self):
+        temp_dir = tempfile.mkdtemp()
+        c_log = os.path.join(temp_dir, os.path.basename(LOG_PATH))
+        try:
+            with open(LOG_PATH, 'rb') as l_file:
+                with gzip.open(c_log, 'wb') as c_file:
+                    shutil.copyfileobj(l_file, c_file)
+            main(["-f", c_log, "-t"])
+            self.assertFalse(diff_lines(os.path.join(temp_dir, os.path.basename(LOG_OUT)), GOOD_LOG_OUT))
+        finally:
+            shutil.rmtree(temp_dir)
+
     # def testLogList(self):
     #     try:
     #         main(["-l", LOG_LIST])